@@ -0,0 +1,160 @@
+import os
+import random
+import logging
+import threading
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, NamedTuple, Optional
+
+from backend.models import Stash, Event, EventDigest, EventType, RollupPeriod
+from backend.database.firestore_wrapper import firestore_wrapper
+from backend.database.repos import stash_repo, event_repo, event_digest_repo
+
+# === Config ===
+COMPACTION_INTERVAL = float(os.environ.get("EVENT_COMPACTION_INTERVAL", "21600"))  # seconds; 0 disables the background job
+CHUNK_SIZE = 400  # events per batch, leaving room under Firestore's 500 writes for the digest writes
+UNKNOWN_MEMBER = "unknown"  # counts_by_member key for events without a usable member id
+
+_logger = logging.getLogger(__name__)
+
+
+def _member_key(member_id: Optional[str]) -> str:
+    # Map keys become field paths: they cannot be empty, and __name__ style ones are reserved
+    if not member_id or not isinstance(member_id, str) or (member_id.startswith("__") and member_id.endswith("__")):
+        return UNKNOWN_MEMBER
+    return member_id
+
+
+class RetentionPolicy(NamedTuple):
+    max_age: Optional[timedelta]
+    max_count: Optional[int]
+    rollup: RollupPeriod
+
+    @classmethod
+    def for_stash(cls, stash: Stash) -> "RetentionPolicy":
+        # Opt-in per stash: a limit that is unset or 0 keeps every event
+        days, count = stash.event_retention_days or 0, stash.event_retention_count or 0
+        return cls(
+            max_age=timedelta(days=days) if days > 0 else None,
+            max_count=count if count > 0 else None,
+            rollup=RollupPeriod(stash.event_rollup or RollupPeriod.DAILY),
+        )
+
+    @property
+    def keeps_everything(self) -> bool:
+        return self.max_age is None and self.max_count is None
+
+
+class EventCompactor:
+    """
+    Rolls the events a stash's retention policy no longer keeps into per-period EventDigests
+    and deletes them, oldest first, CHUNK_SIZE at a time. Stashes without a policy keep every event.
+    Each chunk is one batch: the digest counters only grow together with the deletes, and a delete
+    requires the event to still exist, so two workers compacting the same stash never count an event twice.
+    Needs a composite index on events (stash_id, created_at).
+    """
+
+    def __init__(self, interval: float = COMPACTION_INTERVAL):
+        self._interval = interval
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def compact_stash(self, stash: Stash, now: Optional[datetime] = None) -> int:
+        """
+        Applies the stash's retention policy. Returns how many events were compacted.
+        """
+        policy = RetentionPolicy.for_stash(stash)
+        if policy.keeps_everything:
+            return 0
+        now = now or datetime.now(timezone.utc)
+        compacted = 0
+
+        if policy.max_age is not None:
+            filters = [("stash_id", "==", stash.id), ("created_at", "<", now - policy.max_age)]
+            while (events := event_repo.query(filters, limit=CHUNK_SIZE, order_by=[("created_at", "asc")])):
+                if not self._compact_chunk(stash.id, events, policy.rollup):
+                    return compacted
+                compacted += len(events)
+
+        if policy.max_count is not None:
+            excess = event_repo.count([("stash_id", "==", stash.id)]) - policy.max_count
+            while excess > 0:
+                events = event_repo.query([("stash_id", "==", stash.id)], limit=min(CHUNK_SIZE, excess), order_by=[("created_at", "asc")])
+                if not events or not self._compact_chunk(stash.id, events, policy.rollup):
+                    break
+                compacted += len(events)
+                excess -= len(events)
+
+        if compacted:
+            _logger.info("Compacted %d events of stash %s into %s digests", compacted, stash.id, policy.rollup.value)
+        return compacted
+
+    def _compact_chunk(self, stash_id: str, events: List[Event], period: RollupPeriod) -> bool:
+        counters: Dict[datetime, Dict[str, Counter]] = {}
+        for event in events:
+            start = period.start_of(event.created_at)
+            digest = counters.setdefault(start, {"counts_by_type": Counter(), "counts_by_member": Counter()})
+            digest["counts_by_type"][EventType(event.type).value] += 1
+            digest["counts_by_member"][_member_key(event.member_id)] += 1
+
+        batch = firestore_wrapper.create_batch()
+        try:
+            for start, digest in counters.items():
+                digest_id = EventDigest.id_for(stash_id, period, start)
+                event_digest_repo.batch_accumulate(
+                    batch,
+                    digest_id,
+                    {"id": digest_id, "stash_id": stash_id, "period": period.value, "period_start": start, "period_end": start + period.length()},
+                    {"count": sum(digest["counts_by_type"].values()), **{name: dict(counts) for name, counts in digest.items()}},
+                )
+            for event in events:
+                event_repo.batch_delete(batch, event.id, must_exist=True)
+        except (ValueError, TypeError) as e:
+            _logger.error("Event compaction of stash %s could not build its batch: %s", stash_id, e)
+            return False
+
+        return firestore_wrapper.commit_batch(batch)
+
+    def compact_all(self) -> int:
+        """
+        Applies the retention policy of every stash that set one. Returns how many events were compacted in total.
+        """
+        fields = ["id", "event_retention_days", "event_retention_count", "event_rollup"]
+        stashes: Dict[str, Stash] = {}
+        for limit in ("event_retention_days", "event_retention_count"):
+            stashes.update((stash.id, stash) for stash in stash_repo.query([(limit, ">", 0)], fields=fields))
+        total = 0
+        for stash in stashes.values():
+            try:
+                total += self.compact_stash(stash)
+            except Exception as e:
+                _logger.error("Event compaction failed for stash %s: %s", stash.id, e)
+        return total
+
+    # ----------------
+    # Background job
+    # ----------------
+    def start(self) -> None:
+        if self._interval <= 0 or self._thread is not None:
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name="event-compaction", daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        # Jittered so workers started together do not all compact at the same moment
+        while not self._stopped.wait(self._interval * random.uniform(0.5, 1.0)):
+            try:
+                self.compact_all()
+            except Exception as e:
+                _logger.error("Event compaction run failed: %s", e)
+
+    def stop(self) -> None:
+        if self._thread is not None:
+            self._stopped.set()
+            self._thread.join(timeout=5)
+            self._thread = None
+
+
+# Global importable instance
+event_compactor = EventCompactor()
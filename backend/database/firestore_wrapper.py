@@ -1,15 +1,31 @@
+from __future__ import annotations
+
 import os
 import json
 import logging
-from typing import Optional, List, Dict, Any, Type, TypeVar
+import threading
+from itertools import zip_longest
+from typing import TYPE_CHECKING, Optional, List, Dict, Any, Type, TypeVar, Tuple, Callable, Iterable, Iterator
 from datetime import datetime, timezone
 
-from google.cloud import firestore
-from google.oauth2 import service_account
 from backend.models import BaseDocument
+from backend.database.log_pipeline import OperationLogPolicy
+from backend.database.hydrator import get_hydrator
+from backend.database.invalidation import Invalidation, invalidation_bus
+from backend.database.retry import Backoff, RetryStats, DEFAULT_MAX_ATTEMPTS
+
+if TYPE_CHECKING:
+    # The client library takes a third of a cold start to import, so it is loaded on first use
+    from google.cloud import firestore
 
 # Create a type variable for typed model return
 T = TypeVar("T", bound=BaseDocument)
+R = TypeVar("R")
+
+class TransactionConflict(Exception):
+    """
+    A transaction kept losing to concurrent writers and ran out of attempts.
+    """
 
 class FirestoreWrapper:
     """
@@ -18,14 +34,61 @@ class FirestoreWrapper:
     """
 
     def __init__(self):
-        self._db = self._get_firestore_client()
-        logging.basicConfig(
-            level=logging.INFO,
-            format='%(asctime)s [%(levelname)s] %(name)s - %(message)s'
-        )
+        # The client is created on first use (or by connect() during app startup), not at import
+        self._client: Optional[firestore.Client] = None
+        self._client_lock = threading.Lock()
         self._logger = logging.getLogger(__name__)
+        self._log_policy = OperationLogPolicy.from_env()
+        self._backoff = Backoff()
+        self._retry_stats = RetryStats()
+
+    @property
+    def _db(self) -> firestore.Client:
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    self._client = self._get_firestore_client()
+        return self._client
+
+    def connect(self) -> firestore.Client:
+        """
+        Creates the client now instead of on the first request. Raises if no credentials are found.
+        """
+        return self._db
+
+    def warm_up(self) -> bool:
+        """
+        Opens the gRPC channel and fetches an access token with one cheap point read,
+        so the first request does not pay for the handshake.
+        """
+        try:
+            self._db.collection("_warmup").document("_warmup").get()
+            self._log("connect", "Firestore connection warmed up")
+            return True
+        except Exception as e:
+            self._log("connect", "Firestore warm-up failed: %s", e, level=logging.WARNING)
+            return False
+
+    def close(self) -> None:
+        with self._client_lock:
+            if self._client is not None:
+                self._client.close()
+                self._client = None
+
+    def _log(self, op: str, msg: str, *args: Any, level: Optional[int] = None, **ctx: Any) -> None:
+        """
+        Emits a structured log for an operation if its level is enabled and it survives sampling.
+        `msg` is %-formatted lazily, so filtered records cost no string building.
+        """
+        level = level if level is not None else self._log_policy.level_for(op)
+        if not self._logger.isEnabledFor(level) or not self._log_policy.sample(op, level):
+            return
+        self._logger.log(level, msg, *args, extra={"op": op, "ctx": ctx})
 
     def _get_firestore_client(self) -> firestore.Client:
+        from google.cloud import firestore
+        from google.oauth2 import service_account
+
         creds_json = os.environ.get("FIREBASE_CREDENTIALS")
         if creds_json:
             try:
@@ -45,6 +108,42 @@ class FirestoreWrapper:
 
         raise RuntimeError("No Firestore credentials found.")
 
+    def _hydrate(self, model_class: Type[T], data: Dict[str, Any], trusted: bool, partial: bool = False, update_time: Optional[datetime] = None) -> T:
+        """
+        Builds a model from stored data.
+        Trusted data (written by this backend) skips validation; untrusted data is fully validated.
+        Partial data (from a projection) cannot be validated as a whole and is always constructed.
+        """
+        if partial:
+            obj = get_hydrator(model_class).partial(data)
+            obj._mark_loaded(data.keys(), update_time)
+            return obj
+        obj = get_hydrator(model_class)(data) if trusted else model_class(**data)
+        obj._mark_loaded(update_time=update_time)
+        return obj
+
+    def _publish(self, targets: List[Tuple[str, str]], results: List[Any]) -> None:
+        """
+        Tells every worker that these documents changed, with the server's update_time where known.
+        """
+        now = datetime.now(timezone.utc)
+        invalidation_bus.publish([
+            Invalidation(collection, doc_id, getattr(result, "update_time", None) or now)
+            for (collection, doc_id), result in zip_longest(targets, results[:len(targets)])
+        ])
+
+    @staticmethod
+    def _write_targets(batch: firestore.WriteBatch) -> List[Tuple[str, str]]:
+        """
+        (collection path, doc id) of each write queued in a batch. Must be read before commit, which clears them.
+        """
+        targets = []
+        for write in getattr(batch, "_write_pbs", []):
+            name = write.delete or write.update.name
+            collection, _, doc_id = name.split("/documents/", 1)[-1].rpartition("/")
+            targets.append((collection, doc_id))
+        return targets
+
     # ----------------
     # CRUD Operations
     # ----------------
@@ -57,66 +156,101 @@ class FirestoreWrapper:
         try:
             model.created_at = datetime.now(timezone.utc)
             data = model.model_dump()
-            self._db.collection(collection).document(model.id).create(data)
-            self._logger.info(f"Added document to {collection}/{model.id}")
+            result = self._db.collection(collection).document(model.id).create(data)
+            self._publish([(collection, model.id)], [result])
+            self._log("add", "Added document to %s/%s", collection, model.id, collection=collection, doc_id=model.id)
             return model.id
         except Exception as e:
-            self._logger.error(f"Error adding document to {collection}: {e}")
+            self._log("add", "Error adding document to %s: %s", collection, e, level=logging.ERROR, collection=collection)
             return None
 
-    def get_document(self, collection: str, doc_id: str, model_class: Type[T]) -> Optional[T]:
+    def get_document(self, collection: str, doc_id: str, model_class: Type[T], trusted: bool = False, transaction: Optional[firestore.Transaction] = None) -> Optional[T]:
         """
         Retrieves a document from a collection and parses it into the given model class.
+        Pass `transaction` to read inside a transaction.
         """
         try:
             doc_ref = self._db.collection(collection).document(doc_id)
-            doc = doc_ref.get()
+            doc = doc_ref.get(transaction=transaction)
             if not doc.exists:
-                self._logger.warning(f"Document not found: {collection}/{doc_id}")
+                self._log("get", "Document not found: %s/%s", collection, doc_id, level=logging.WARNING, collection=collection, doc_id=doc_id)
                 return None
 
-            data = doc.to_dict()
             data = doc.to_dict()
             if isinstance(data, dict):
-                return model_class(**data)
+                return self._hydrate(model_class, data, trusted, update_time=doc.update_time)
         except Exception as e:
-            self._logger.error(f"Failed to get document {collection}/{doc_id}: {e}")
+            if transaction is not None:
+                raise  # the transaction engine decides whether to retry
+            self._log("get", "Failed to get document %s/%s: %s", collection, doc_id, e, level=logging.ERROR, collection=collection, doc_id=doc_id)
             return None
 
+    def get_documents(self, collection: str, doc_ids: Iterable[str], model_class: Type[T], trusted: bool = False) -> Dict[str, T]:
+        """
+        Retrieves many documents in one round trip, by id. Missing documents are left out.
+        """
+        refs = [self._db.collection(collection).document(doc_id) for doc_id in dict.fromkeys(doc_ids)]
+        if not refs:
+            return {}
+        try:
+            results = {
+                doc.id: self._hydrate(model_class, doc.to_dict(), trusted, update_time=doc.update_time)
+                for doc in self._db.get_all(refs) if doc.exists
+            }
+            self._log("get_many", "Retrieved %d of %d documents from %s", len(results), len(refs), collection, collection=collection, count=len(results))
+            return results
+        except Exception as e:
+            self._log("get_many", "Failed to get documents from %s: %s", collection, e, level=logging.ERROR, collection=collection)
+            return {}
+
     def update_document(self, collection: str, doc_id: str, updates: Dict[str, Any]) -> bool:
         """
         Updates a document's fields and sets updated_at.
         """
         try:
             updates["updated_at"] = datetime.now(timezone.utc)
-            self._db.collection(collection).document(doc_id).update(updates)
-            self._logger.info(f"Updated document in {collection}/{doc_id}: {list(updates.keys())}")
+            result = self._db.collection(collection).document(doc_id).update(updates)
+            self._publish([(collection, doc_id)], [result])
+            self._log("update", "Updated document in %s/%s: %s", collection, doc_id, list(updates.keys()), collection=collection, doc_id=doc_id)
             return True
         except Exception as e:
-            self._logger.error(f"Error updating document {collection}/{doc_id}: {e}")
+            self._log("update", "Error updating document %s/%s: %s", collection, doc_id, e, level=logging.ERROR, collection=collection, doc_id=doc_id)
             return False
 
     def delete_document(self, collection: str, doc_id: str) -> bool:
         try:
             self._db.collection(collection).document(doc_id).delete()
-            self._logger.info(f"Deleted document from {collection}/{doc_id}")
+            self._publish([(collection, doc_id)], [])
+            self._log("delete", "Deleted document from %s/%s", collection, doc_id, collection=collection, doc_id=doc_id)
             return True
         except Exception as e:
-            self._logger.error(f"Failed to delete document {collection}/{doc_id}: {e}")
+            self._log("delete", "Failed to delete document %s/%s: %s", collection, doc_id, e, level=logging.ERROR, collection=collection, doc_id=doc_id)
             return False
 
-    def list_documents(self, collection: str, model_class: Type[T], limit: Optional[int] = None) -> List[T]:
+    def _build_query(self, collection: str, filters: List[tuple], limit: Optional[int] = None, order_by: Optional[List[Tuple[str, str]]] = None):
+        from google.cloud import firestore
+
+        q = self._db.collection(collection)
+        for field, op, value in filters:
+            q = q.where(field, op, value)
+        for field, direction in order_by or []:
+            q = q.order_by(field, direction=firestore.Query.DESCENDING if direction == "desc" else firestore.Query.ASCENDING)
+        if limit:
+            q = q.limit(limit)
+        return q
+
+    def list_documents(self, collection: str, model_class: Type[T], limit: Optional[int] = None, trusted: bool = False) -> List[T]:
         """
         Returns all documents in a collection (up to limit) parsed as model objects.
         """
         try:
             ref = self._db.collection(collection)
             docs = ref.limit(limit).stream() if limit else ref.stream()
-            results = [model_class(**doc.to_dict()) for doc in docs if doc.exists]
-            self._logger.info(f"Retrieved {len(results)} documents from {collection}")
+            results = [self._hydrate(model_class, doc.to_dict(), trusted, update_time=doc.update_time) for doc in docs if doc.exists]
+            self._log("list", "Retrieved %d documents from %s", len(results), collection, collection=collection, count=len(results))
             return results
         except Exception as e:
-            self._logger.error(f"Error listing documents in {collection}: {e}")
+            self._log("list", "Error listing documents in %s: %s", collection, e, level=logging.ERROR, collection=collection)
             return []
 
     def query_collection(
@@ -125,26 +259,104 @@ class FirestoreWrapper:
         filters: List[tuple],
         model_class: Type[T],
         limit: Optional[int] = None,
+        trusted: bool = False,
+        fields: Optional[List[str]] = None,
+        order_by: Optional[List[Tuple[str, str]]] = None,
     ) -> List[T]:
         """
         Returns filtered and typed list of documents from a collection.
         `filters` = List of tuples like: [("type", "==", "weapon")]
+        `fields` = Optional projection; only these fields are read and set on the returned models.
+        `order_by` = Optional list of tuples like: [("created_at", "desc")]
         """
         try:
-            ref = self._db.collection(collection)
-            q = ref
-            for field, op, value in filters:
-                q = q.where(field, op, value)
-            if limit:
-                q = q.limit(limit)
+            q = self._build_query(collection, filters, limit, order_by)
+            if fields:
+                q = q.select(fields)
             docs = q.stream()
-            results = [model_class(**doc.to_dict()) for doc in docs if doc.exists]
-            self._logger.info(f"Query on {collection} returned {len(results)} results.")
+            results = [self._hydrate(model_class, doc.to_dict(), trusted, partial=bool(fields), update_time=doc.update_time) for doc in docs if doc.exists]
+            self._log("query", "Query on %s returned %d results.", collection, len(results), collection=collection, count=len(results))
             return results
         except Exception as e:
-            self._logger.error(f"Error querying {collection} with {filters}: {e}")
+            self._log("query", "Error querying %s with %s: %s", collection, filters, e, level=logging.ERROR, collection=collection)
             return []
         
+    def aggregate_collection(
+        self,
+        collection: str,
+        filters: List[tuple],
+        aggregation: str,
+        field: Optional[str] = None,
+    ) -> Optional[float]:
+        """
+        Runs a server-side aggregation ("count", "sum" or "avg") over the filtered documents.
+        Costs a single read per 1000 index entries instead of one read per document.
+        Returns None if the aggregation fails.
+        """
+        try:
+            q = self._build_query(collection, filters)
+            if aggregation == "count":
+                agg = q.count(alias=aggregation)
+            elif aggregation == "sum" and field:
+                agg = q.sum(field, alias=aggregation)
+            elif aggregation == "avg" and field:
+                agg = q.avg(field, alias=aggregation)
+            else:
+                raise ValueError(f"Unsupported aggregation '{aggregation}' on field '{field}'")
+            value = agg.get()[0][0].value
+            self._log("aggregate", "%s on %s returned %s.", aggregation, collection, value, collection=collection, aggregation=aggregation)
+            return value
+        except Exception as e:
+            self._log("aggregate", "Error running %s on %s with %s: %s", aggregation, collection, filters, e, level=logging.ERROR, collection=collection)
+            return None
+
+    def exists_in_collection(self, collection: str, filters: List[tuple]) -> bool:
+        """
+        Returns True if at least one document matches the filters.
+        Reads a single document name instead of the matching documents.
+        """
+        try:
+            q = self._build_query(collection, filters, limit=1).select(["__name__"])
+            found = any(True for _ in q.stream())
+            self._log("exists", "Exists on %s returned %s.", collection, found, collection=collection)
+            return found
+        except Exception as e:
+            self._log("exists", "Error checking existence in %s with %s: %s", collection, filters, e, level=logging.ERROR, collection=collection)
+            return False
+
+    def stream_collection(self, collection: str, filters: List[tuple], page_size: int = 500) -> Iterator[Dict[str, Any]]:
+        """
+        Yields the stored data of matching documents in document id order, reading one page at a time,
+        so memory holds a single page however many documents match. Errors are raised, not swallowed,
+        since the caller may already have handed out earlier pages.
+        """
+        q = self._build_query(collection, filters, limit=page_size).order_by("__name__")
+        last = None
+        count = 0
+        while True:
+            try:
+                docs = list((q.start_after(last) if last is not None else q).stream())
+            except Exception as e:
+                self._log("stream", "Error streaming %s with %s: %s", collection, filters, e, level=logging.ERROR, collection=collection)
+                raise
+            for doc in docs:
+                if isinstance(data := doc.to_dict(), dict):
+                    yield data
+            count += len(docs)
+            if len(docs) < page_size:
+                self._log("stream", "Streamed %d documents from %s.", count, collection, collection=collection, count=count)
+                return
+            last = docs[-1]
+
+    def get_fields(self, collection: str, doc_ids: Iterable[str], fields: List[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        Reads only `fields` of the given documents in one round trip. Missing documents are left out.
+        """
+        refs = [self._db.collection(collection).document(doc_id) for doc_id in dict.fromkeys(doc_ids)]
+        if not refs:
+            return {}
+        return {doc.id: doc.to_dict() or {} for doc in self._db.get_all(refs, field_paths=fields) if doc.exists}
+
     # ----------------
     # Batch Operations
     # ----------------
@@ -159,27 +371,95 @@ class FirestoreWrapper:
         Commits a Firestore batch operation.
         Returns True if successful, False otherwise.
         """
+        targets = self._write_targets(batch)
         try:
-            batch.commit()
-            self._logger.info("Batch commit successful.")
-            return True
+            results = batch.commit()
+            self._log("commit", "Batch commit successful.")
         except Exception as e:
-            self._logger.error(f"Batch commit failed: {e}")
+            self._log("commit", "Batch commit failed: %s", e, level=logging.ERROR)
             return False
+        self._publish(targets, list(results or []))
+        return True
 
-    def run_transaction(self, transaction_callable) -> Optional[Any]:
+    # ----------------
+    # Transactions
+    # ----------------
+    def transaction_stats(self) -> Dict[str, Dict[str, int]]:
         """
-        Runs a transaction with retries.
-        `transaction_func` should accept a transaction object as its first argument.
+        Runs, retries and conflicts (runs that gave up) per transaction name since startup.
         """
-        transaction = self._db.transaction()
-        try:
-            result = transaction_callable(transaction)
-            self._logger.info("Transaction completed successfully.")
+        return self._retry_stats.snapshot()
+
+    def _retry(self, name: str, attempt: Callable[[], Tuple[R, List[Tuple[str, str]], List[Any]]],
+               retry_on: Tuple[Type[BaseException], ...], max_attempts: int) -> Optional[R]:
+        from google.api_core.exceptions import GoogleAPICallError, RetryError
+
+        for retries in range(max_attempts):
+            try:
+                result, targets, write_results = attempt()
+            except Exception as e:
+                contended = isinstance(e, retry_on) or isinstance(e.__cause__, retry_on)
+                if contended and retries + 1 < max_attempts:
+                    self._backoff.sleep(retries)
+                    continue
+                self._retry_stats.record(name, retries, conflict=contended)
+                if contended:
+                    self._log("transaction", "%s gave up after %d attempts: %s", name, max_attempts, e, level=logging.WARNING, name=name, retries=retries)
+                    raise TransactionConflict(f"{name} conflicted {max_attempts} times") from e
+                if isinstance(e, (GoogleAPICallError, RetryError)):
+                    self._log("transaction", "%s failed: %s", name, e, level=logging.ERROR, name=name, retries=retries)
+                    return None
+                raise  # raised by the caller's function, e.g. a validation error
+
+            self._retry_stats.record(name, retries, conflict=False)
+            self._publish(targets, write_results)
+            self._log("transaction", "%s committed after %d retries", name, retries, level=logging.WARNING if retries else None, name=name, retries=retries)
             return result
-        except Exception as e:
-            self._logger.error(f"Transaction failed: {e}")
-            return None
+        return None
+
+    def run_transaction(self, fn: Callable[[firestore.Transaction], R], name: str = "transaction", max_attempts: int = DEFAULT_MAX_ATTEMPTS) -> Optional[R]:
+        """
+        Runs `fn(transaction)` as a read-then-write transaction: reads go through the transaction
+        (e.g. `repo.transaction_get`) and writes are queued on it like on a batch.
+        If Firestore aborts it because of contention, or a write's precondition (see run_optimistic)
+        no longer holds, `fn` is re-run after a jittered backoff.
+        Exceptions raised by `fn` roll back and propagate. Returns None if the commit fails,
+        raises TransactionConflict if every attempt was contended.
+        """
+        from google.cloud import firestore
+        from google.api_core.exceptions import Aborted, FailedPrecondition
+
+        def attempt():
+            transaction = self._db.transaction(max_attempts=1)  # retries happen here, with backoff
+            targets: List[Tuple[str, str]] = []
+
+            def body(tx):
+                result = fn(tx)
+                targets.extend(self._write_targets(tx))
+                return result
+
+            result = firestore.transactional(body)(transaction)
+            return result, targets, list(getattr(transaction, "write_results", None) or [])
+
+        return self._retry(name, attempt, (Aborted, FailedPrecondition), max_attempts)
+
+    def run_optimistic(self, fn: Callable[[firestore.WriteBatch], R], name: str = "optimistic", max_attempts: int = DEFAULT_MAX_ATTEMPTS) -> Optional[R]:
+        """
+        Cheaper alternative to run_transaction for single-document edits: `fn(batch)` reads normally
+        and queues writes with an update_time precondition (`repo.batch_update(..., if_unchanged=True)`).
+        If the document changed in between, or one queued with batch_create appeared, the commit fails
+        and `fn` is re-run after a jittered backoff. Same return and error behaviour as run_transaction.
+        """
+        from google.api_core.exceptions import Aborted, AlreadyExists, FailedPrecondition
+
+        def attempt():
+            batch = self.create_batch()
+            result = fn(batch)
+            targets = self._write_targets(batch)
+            write_results = batch.commit() if targets else []
+            return result, targets, list(write_results or [])
+
+        return self._retry(name, attempt, (FailedPrecondition, Aborted, AlreadyExists), max_attempts)
 
 # Global importable instance
 firestore_wrapper = FirestoreWrapper()
@@ -0,0 +1,106 @@
+from enum import Enum
+from functools import lru_cache
+from typing import Any, Callable, Dict, Generic, Optional, Type, TypeVar, Union, get_args, get_origin
+
+from backend.models import BaseDocument
+
+T = TypeVar("T", bound=BaseDocument)
+_IMMUTABLE = (type(None), bool, int, float, str, bytes, tuple, frozenset)
+
+
+def _enum_coercer(annotation: Any) -> Optional[Callable[[Any], Any]]:
+    """
+    Returns a function that turns stored enum values back into enum members, or None if the
+    annotation holds no enums. Firestore hands enums back as plain strings.
+    """
+    if isinstance(annotation, type) and issubclass(annotation, Enum):
+        return lambda value: value if isinstance(value, annotation) or value is None else annotation(value)
+
+    origin = get_origin(annotation)
+    if origin is Union:
+        inner = [_enum_coercer(arg) for arg in get_args(annotation)]
+        inner = [coerce for coerce in inner if coerce]
+        return inner[0] if len(inner) == 1 else None
+    if origin is dict:
+        _, value_type = get_args(annotation)
+        if (coerce := _enum_coercer(value_type)):
+            return lambda value: {k: coerce(v) for k, v in value.items()} if isinstance(value, dict) else value
+    return None
+
+
+class ModelHydrator(Generic[T]):
+    """
+    Fast constructor for documents this backend wrote itself.
+    Skips Pydantic validation (EmailStr checks, coercion) and only restores enum members,
+    fills defaults for missing optional fields and drops unknown keys.
+    Documents missing a required field fall back to full validation.
+    """
+
+    def __init__(self, model_cls: Type[T]):
+        self._model_cls = model_cls
+        self._field_names = frozenset(model_cls.model_fields)
+        self._required = frozenset(name for name, field in model_cls.model_fields.items() if field.is_required())
+        self._defaults: Dict[str, Any] = {
+            name: field for name, field in model_cls.model_fields.items() if not field.is_required()
+        }
+        self._coercers = {
+            name: coerce for name, field in model_cls.model_fields.items()
+            if (coerce := _enum_coercer(field.annotation))
+        }
+        # Immutable private defaults are shared through a template; the rest are built per object
+        self._private_template: Dict[str, Any] = {}
+        self._private_factories: Dict[str, Callable[[], Any]] = {}
+        for name, attr in model_cls.__private_attributes__.items():
+            if attr.default_factory is frozenset:
+                self._private_template[name] = frozenset()
+            elif attr.default_factory is None and isinstance(attr.default, _IMMUTABLE):
+                self._private_template[name] = attr.default
+            else:
+                self._private_factories[name] = attr.get_default
+        self._has_private = bool(model_cls.__private_attributes__)
+
+    def _default(self, name: str) -> Any:
+        field = self._defaults[name]
+        return field.default_factory() if field.default_factory else field.default
+
+    def __call__(self, data: Dict[str, Any]) -> T:
+        keys = data.keys()
+        if keys == self._field_names:
+            return self._build(data, set(keys))
+        if not self._required <= keys:
+            return self._model_cls(**data)
+        fields_set = keys & self._field_names
+        return self._build({name: data[name] if name in fields_set else self._default(name) for name in self._model_cls.model_fields}, fields_set)
+
+    def partial(self, data: Dict[str, Any]) -> T:
+        """
+        Builds a model from a projection (a subset of fields). Missing required fields are None
+        and only the projected fields are marked as set, so `exclude_unset` dumps just those.
+        """
+        fields_set = data.keys() & self._field_names
+        return self._build({
+            name: data[name] if name in fields_set else (self._default(name) if name in self._defaults else None)
+            for name in self._model_cls.model_fields
+        }, fields_set)
+
+    def _build(self, data: Dict[str, Any], fields_set: set) -> T:
+        for name, coerce in self._coercers.items():
+            data[name] = coerce(data[name])
+
+        obj = self._model_cls.__new__(self._model_cls)
+        object.__setattr__(obj, "__dict__", data)
+        object.__setattr__(obj, "__pydantic_fields_set__", fields_set)
+        object.__setattr__(obj, "__pydantic_extra__", None)
+        if self._has_private:
+            private = dict(self._private_template)
+            for name, factory in self._private_factories.items():
+                private[name] = factory()
+            object.__setattr__(obj, "__pydantic_private__", private)
+        else:
+            object.__setattr__(obj, "__pydantic_private__", None)
+        return obj
+
+
+@lru_cache(maxsize=None)
+def get_hydrator(model_cls: Type[T]) -> ModelHydrator[T]:
+    return ModelHydrator(model_cls)
@@ -0,0 +1,322 @@
+import os
+import json
+import time
+import queue
+import socket
+import logging
+import threading
+from uuid import uuid4
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Generic, List, NamedTuple, Optional, Tuple, TypeVar
+
+from backend.models import BaseDocument
+
+# === Config ===
+# INVALIDATION_TRANSPORT picks how workers hear about each other's writes:
+#   "local"     - Unix datagram sockets, for several workers on one host (default)
+#   "firestore" - a snapshot listener on INVALIDATION_COLLECTION, for several hosts
+#   "none"      - this process only
+DEFAULT_TRANSPORT = "local"
+DEFAULT_SOCKET_DIR = "/tmp/stasher-invalidation"
+INVALIDATION_COLLECTION = "_invalidations"
+INVALIDATION_TTL = timedelta(minutes=10)  # expires_at on published docs, for a Firestore TTL policy
+MAX_DATAGRAM_ENTRIES = 256  # keeps one datagram well under the kernel's size limit
+MAX_DOCUMENT_ENTRIES = 500
+
+T = TypeVar("T", bound=BaseDocument)
+_logger = logging.getLogger(__name__)
+
+
+class Invalidation(NamedTuple):
+    collection: str
+    doc_id: str
+    update_time: datetime
+
+Subscriber = Callable[[List[Invalidation]], None]
+
+
+def _encode(entries: List[Invalidation]) -> List[list]:
+    return [[entry.collection, entry.doc_id, entry.update_time.isoformat()] for entry in entries]
+
+def _decode(rows: List[list]) -> List[Invalidation]:
+    return [Invalidation(collection, doc_id, datetime.fromisoformat(update_time)) for collection, doc_id, update_time in rows]
+
+def _chunks(entries: List[Invalidation], size: int) -> List[List[Invalidation]]:
+    return [entries[i:i + size] for i in range(0, len(entries), size)]
+
+
+
+# === === Bus === ===
+
+class InvalidationBus:
+    """
+    Fans out `(collection, id, update_time)` for every committed write.
+    Subscribers in this process are called synchronously on publish; other workers are
+    reached through the transport and called from its receiver thread.
+    """
+
+    def __init__(self):
+        self.origin = f"{socket.gethostname()}:{os.getpid()}:{uuid4().hex[:8]}"
+        self._subscribers: List[Subscriber] = []
+        self._lock = threading.Lock()
+        self._transport = None
+
+    def subscribe(self, callback: Subscriber) -> Callable[[], None]:
+        """
+        Registers a callback and returns a function that unregisters it.
+        """
+        with self._lock:
+            self._subscribers.append(callback)
+
+        def unsubscribe() -> None:
+            with self._lock:
+                if callback in self._subscribers:
+                    self._subscribers.remove(callback)
+        return unsubscribe
+
+    def start(self, transport) -> None:
+        self.stop()
+        transport.start(self._deliver)
+        self._transport = transport
+
+    def stop(self) -> None:
+        if self._transport is not None:
+            self._transport.stop()
+            self._transport = None
+
+    def publish(self, entries: List[Invalidation]) -> None:
+        if not entries:
+            return
+        self._deliver(entries)
+        if self._transport is not None:
+            try:
+                self._transport.send(entries)
+            except Exception as e:
+                _logger.warning("Failed to publish %d invalidations: %s", len(entries), e)
+
+    def _deliver(self, entries: List[Invalidation]) -> None:
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for callback in subscribers:
+            try:
+                callback(entries)
+            except Exception as e:
+                _logger.error("Invalidation subscriber failed: %s", e)
+
+
+
+# === === Transports === ===
+
+class LocalTransport:
+    """
+    One Unix datagram socket per worker in a shared directory. Publishing sends to every
+    other socket in the directory; sockets left behind by dead workers are removed on the way.
+    """
+
+    def __init__(self, socket_dir: Optional[str] = None):
+        self._dir = socket_dir or os.environ.get("INVALIDATION_SOCKET_DIR", DEFAULT_SOCKET_DIR)
+        self._path = os.path.join(self._dir, f"{os.getpid()}-{uuid4().hex[:8]}.sock")
+        self._recv_sock: Optional[socket.socket] = None
+        self._send_sock: Optional[socket.socket] = None
+
+    def start(self, deliver: Subscriber) -> None:
+        os.makedirs(self._dir, exist_ok=True)
+        self._recv_sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._recv_sock.bind(self._path)
+        self._send_sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._send_sock.setblocking(False)  # never stall a request on a slow peer
+        threading.Thread(target=self._receive, args=(self._recv_sock, deliver), name="invalidation-local", daemon=True).start()
+
+    def _receive(self, sock: socket.socket, deliver: Subscriber) -> None:
+        while True:
+            try:
+                payload = sock.recv(65536)
+            except OSError:
+                return  # socket closed by stop()
+            try:
+                deliver(_decode(json.loads(payload)))
+            except Exception as e:
+                _logger.warning("Dropped malformed invalidation datagram: %s", e)
+
+    def send(self, entries: List[Invalidation]) -> None:
+        if self._send_sock is None:
+            return
+        payloads = [json.dumps(_encode(chunk)).encode() for chunk in _chunks(entries, MAX_DATAGRAM_ENTRIES)]
+        for name in os.listdir(self._dir):
+            peer = os.path.join(self._dir, name)
+            if not name.endswith(".sock") or peer == self._path:
+                continue
+            for payload in payloads:
+                try:
+                    self._send_sock.sendto(payload, peer)
+                except (ConnectionRefusedError, FileNotFoundError):
+                    self._remove_stale(peer)
+                    break
+                except BlockingIOError:
+                    _logger.warning("Invalidation queue of %s is full, dropping %d entries", name, len(entries))
+                    break
+
+    def _remove_stale(self, peer: str) -> None:
+        try:
+            os.unlink(peer)
+        except OSError:
+            pass
+
+    def stop(self) -> None:
+        for sock in (self._recv_sock, self._send_sock):
+            if sock is not None:
+                sock.close()
+        self._recv_sock = self._send_sock = None
+        self._remove_stale(self._path)
+
+
+class FirestoreTransport:
+    """
+    Publishes invalidations as documents in INVALIDATION_COLLECTION and listens for the ones
+    other processes write. Writes happen on a background thread, coalesced per flush.
+    Configure a TTL policy on `expires_at` so the collection cleans itself up.
+    """
+
+    def __init__(self, client_factory: Callable[[], object], origin: str):
+        self._client_factory = client_factory
+        self._origin = origin
+        self._outbox: "queue.SimpleQueue[Optional[List[Invalidation]]]" = queue.SimpleQueue()
+        self._watch = None
+        self._sender: Optional[threading.Thread] = None
+
+    def start(self, deliver: Subscriber) -> None:
+        from google.cloud.firestore_v1.base_query import FieldFilter
+
+        client = self._client_factory()
+        since = datetime.now(timezone.utc)
+
+        def on_snapshot(_docs, changes, _read_time) -> None:
+            for change in changes:
+                if change.type.name != "ADDED":
+                    continue
+                data = change.document.to_dict() or {}
+                if data.get("origin") != self._origin:
+                    deliver(_decode([[row["collection"], row["doc_id"], row["update_time"]] for row in data.get("entries", [])]))
+
+        query = client.collection(INVALIDATION_COLLECTION).where(filter=FieldFilter("published_at", ">=", since))
+        self._watch = query.on_snapshot(on_snapshot)
+        self._sender = threading.Thread(target=self._send_loop, args=(client,), name="invalidation-firestore", daemon=True)
+        self._sender.start()
+
+    def _send_loop(self, client) -> None:
+        while (entries := self._outbox.get()) is not None:
+            # Drain whatever queued up meanwhile into the same document
+            while not self._outbox.empty():
+                if (more := self._outbox.get()) is None:
+                    self._outbox.put(None)
+                    break
+                entries = entries + more
+            now = datetime.now(timezone.utc)
+            for chunk in _chunks(entries, MAX_DOCUMENT_ENTRIES):
+                try:
+                    client.collection(INVALIDATION_COLLECTION).document().set({
+                        "origin": self._origin,
+                        "entries": [{"collection": c, "doc_id": d, "update_time": t} for c, d, t in _encode(chunk)],
+                        "published_at": now,
+                        "expires_at": now + INVALIDATION_TTL,
+                    })
+                except Exception as e:
+                    _logger.warning("Failed to write %d invalidations: %s", len(chunk), e)
+
+    def send(self, entries: List[Invalidation]) -> None:
+        self._outbox.put(list(entries))
+
+    def stop(self) -> None:
+        if self._watch is not None:
+            self._watch.unsubscribe()
+            self._watch = None
+        if self._sender is not None:
+            self._outbox.put(None)
+            self._sender.join(timeout=5)
+            self._sender = None
+
+
+def transport_from_env(client_factory: Callable[[], object]):
+    """
+    Builds the transport named by INVALIDATION_TRANSPORT, or None for "none".
+    """
+    name = os.environ.get("INVALIDATION_TRANSPORT", DEFAULT_TRANSPORT).lower()
+    if name == "local":
+        return LocalTransport()
+    if name == "firestore":
+        return FirestoreTransport(client_factory, invalidation_bus.origin)
+    if name == "none":
+        return None
+    raise ValueError(f"Unknown INVALIDATION_TRANSPORT '{name}'")
+
+
+
+# === === Cache === ===
+
+class DocumentCache(Generic[T]):
+    """
+    Per-process cache of one collection's documents by id, kept coherent by the invalidation bus.
+    Entries also expire after `max_age` seconds, which bounds staleness if a message is lost.
+    Models are copied in and out, so callers can mutate what they get back.
+    """
+
+    def __init__(self, collection: str, max_age: float, max_entries: int = 10000):
+        self._collection = collection
+        self._max_age = max_age
+        self._max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, T]]" = OrderedDict()
+        # Sequence number of the last invalidation per id, so a read that raced a write is not cached
+        self._invalidated: "OrderedDict[str, int]" = OrderedDict()
+        self._floor = 0  # sequence number of the newest tombstone trimmed from _invalidated
+        self._seq = 0
+        self._lock = threading.Lock()
+        self._unsubscribe = invalidation_bus.subscribe(self._on_invalidate)
+
+    def token(self) -> int:
+        """
+        Take before reading from Firestore and pass to put().
+        """
+        return self._seq
+
+    def get(self, doc_id: str) -> Optional[T]:
+        with self._lock:
+            entry = self._entries.get(doc_id)
+            if entry is None:
+                return None
+            stored_at, obj = entry
+            if time.monotonic() - stored_at > self._max_age:
+                del self._entries[doc_id]
+                return None
+            self._entries.move_to_end(doc_id)
+        return obj.model_copy(deep=True)
+
+    def put(self, doc_id: str, obj: T, token: int) -> None:
+        copy = obj.model_copy(deep=True)
+        with self._lock:
+            if token < self._floor or self._invalidated.get(doc_id, -1) > token:
+                return
+            self._entries[doc_id] = (time.monotonic(), copy)
+            self._entries.move_to_end(doc_id)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def _on_invalidate(self, entries: List[Invalidation]) -> None:
+        with self._lock:
+            for entry in entries:
+                if entry.collection != self._collection:
+                    continue
+                self._seq += 1
+                self._entries.pop(entry.doc_id, None)
+                self._invalidated[entry.doc_id] = self._seq
+                self._invalidated.move_to_end(entry.doc_id)
+            while len(self._invalidated) > self._max_entries:
+                _, self._floor = self._invalidated.popitem(last=False)
+
+
+# Global importable instance
+invalidation_bus = InvalidationBus()
@@ -0,0 +1,114 @@
+import os
+import json
+import queue
+import atexit
+import random
+import logging
+import logging.handlers
+from typing import Optional, Dict, Any
+
+# === Config ===
+# Per-operation overrides are read from the environment as comma separated pairs, e.g.
+#   FIRESTORE_LOG_LEVELS="query=DEBUG,list=DEBUG"
+#   FIRESTORE_LOG_SAMPLE="query=0.05,get=0.1"
+DEFAULT_LEVEL = logging.INFO
+DEFAULT_SAMPLE_RATE = 1.0
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def _parse_pairs(raw: Optional[str]) -> Dict[str, str]:
+    pairs = {}
+    for entry in (raw or "").split(","):
+        if "=" not in entry:
+            continue
+        key, value = entry.split("=", 1)
+        pairs[key.strip()] = value.strip()
+    return pairs
+
+
+class OperationLogPolicy:
+    """
+    Decides, per Firestore operation, which level a log is emitted at and how often it is sampled.
+    Warnings and errors are never sampled out.
+    """
+
+    def __init__(self, levels: Optional[Dict[str, int]] = None, rates: Optional[Dict[str, float]] = None,
+                 default_level: int = DEFAULT_LEVEL, default_rate: float = DEFAULT_SAMPLE_RATE):
+        self._levels = levels or {}
+        self._rates = rates or {}
+        self._default_level = default_level
+        self._default_rate = default_rate
+
+    @classmethod
+    def from_env(cls) -> 'OperationLogPolicy':
+        levels = {op: logging.getLevelName(name.upper()) for op, name in _parse_pairs(os.environ.get("FIRESTORE_LOG_LEVELS")).items()}
+        rates = {op: float(rate) for op, rate in _parse_pairs(os.environ.get("FIRESTORE_LOG_SAMPLE")).items()}
+        return cls(
+            levels={op: level for op, level in levels.items() if isinstance(level, int)},
+            rates=rates,
+        )
+
+    def level_for(self, op: str) -> int:
+        return self._levels.get(op, self._default_level)
+
+    def sample(self, op: str, level: int) -> bool:
+        if level >= logging.WARNING:
+            return True
+        rate = self._rates.get(op, self._default_rate)
+        return rate >= 1.0 or random.random() < rate
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formats a record as a single JSON line. Runs on the listener thread, never on the request path.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            "ts": record.created,
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        if (op := getattr(record, "op", None)):
+            entry["op"] = op
+        if (ctx := getattr(record, "ctx", None)):
+            entry.update(ctx)
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that hands the raw record to the listener instead of formatting it first.
+    The stock handler formats in `prepare`, which puts message building back on the caller's thread.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def setup_logging(level: Optional[int] = None) -> None:
+    """
+    Routes the `backend` loggers through a queue so handler I/O happens on a background thread.
+    Safe to call more than once.
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(JsonFormatter())
+
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+    logger = logging.getLogger("backend")
+    logger.setLevel(level or os.environ.get("LOG_LEVEL", "INFO").upper())
+    logger.addHandler(DeferredQueueHandler(log_queue))
+    logger.propagate = False
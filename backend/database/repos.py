@@ -1,22 +1,90 @@
 # database/base_repo.py
-from typing import TypeVar, Generic, Type, List, Optional, Dict, Any
+from __future__ import annotations
+
+import os
+import asyncio
+from typing import TYPE_CHECKING, TypeVar, Generic, Type, List, Optional, Dict, Any, Callable, Hashable, Iterable, Iterator, Tuple
 from backend.models import BaseDocument
 from backend.database.firestore_wrapper import firestore_wrapper
-from google.cloud import firestore
+from backend.database.invalidation import DocumentCache, Invalidation, invalidation_bus
+from backend.database.singleflight import SingleFlight, freeze
+if TYPE_CHECKING:
+    from google.cloud import firestore
 
 from datetime import datetime, timezone
 from uuid import uuid4
 
 T = TypeVar("T", bound=BaseDocument)
 
+# === Config ===
+# Upper bound on how long a cached document can be served if an invalidation is lost
+CACHE_TTL_SECONDS = float(os.environ.get("DOCUMENT_CACHE_TTL", "30"))
+MAX_IN_VALUES = 30  # Firestore's limit on values in one 'in' filter
+WRITE_CHUNK = 400  # writes per batch, under Firestore's 500
+
 class BaseRepo(Generic[T]):
-    def __init__(self, model_cls: Type[T], collection: str):
+    def __init__(self, model_cls: Type[T], collection: str, trusted: bool = False, cache_ttl: Optional[float] = None):
         self._db = firestore_wrapper
         self._collection = collection
         self._model_cls = model_cls
+        self._trusted = trusted  # Skip validation on read for documents only this backend writes
+        # Point reads are cached per process and dropped by the invalidation bus on any write
+        self._cache: Optional[DocumentCache[T]] = DocumentCache(collection, cache_ttl) if cache_ttl else None
+        # Identical reads in flight at the same time share one Firestore call
+        self._flight = SingleFlight()
+        invalidation_bus.subscribe(self._on_invalidate)
+
+    def _on_invalidate(self, entries: List[Invalidation]) -> None:
+        # A read already in flight may predate the write, so later callers must not join it
+        if (ids := {entry.doc_id for entry in entries if entry.collection == self._collection}):
+            self._flight.forget(lambda key: key[0] != "get" or key[2] in ids)
+
+    def _flight_key(self, op: str, *args: Any) -> Optional[Hashable]:
+        try:
+            return (op, self._collection, *freeze(args))
+        except TypeError:
+            return None  # unhashable filter value, just run the call
+
+    def _coalesce(self, op: str, fn: Callable[[], Any], *args: Any) -> Any:
+        if (key := self._flight_key(op, *args)) is None:
+            return fn()
+        return self._flight.do(key, fn)
+
+    async def _coalesce_async(self, op: str, fn: Callable[[], Any], *args: Any) -> Any:
+        if (key := self._flight_key(op, *args)) is None:
+            return await asyncio.get_running_loop().run_in_executor(None, fn)
+        return await self._flight.do_async(key, fn)
 
-    def get(self, id: str) -> Optional[T]:
-        return self._db.get_document(self._collection, id, self._model_cls)
+    def _read(self, id: str) -> Optional[T]:
+        token = self._cache.token() if self._cache is not None else 0
+        obj = self._db.get_document(self._collection, id, self._model_cls, trusted=self._trusted)
+        if obj is not None and self._cache is not None:
+            self._cache.put(id, obj, token)
+        return obj
+
+    def get(self, id: str, fresh: bool = False) -> Optional[T]:
+        """
+        `fresh` skips the cache and in-flight reads, e.g. before a write with a precondition.
+        """
+        if fresh:
+            return self._read(id)
+        if self._cache is not None and (cached := self._cache.get(id)) is not None:
+            return cached
+        return self._coalesce("get", lambda: self._read(id), id)
+
+    def get_many(self, ids: Iterable[str]) -> Dict[str, T]:
+        """
+        Many documents in one round trip, read fresh, keyed by id. Missing ones are left out.
+        """
+        return self._db.get_documents(self._collection, ids, self._model_cls, trusted=self._trusted)
+
+    def transaction_get(self, transaction: firestore.Transaction, id: str) -> Optional[T]:
+        return self._db.get_document(self._collection, id, self._model_cls, trusted=self._trusted, transaction=transaction)
+
+    async def aget(self, id: str) -> Optional[T]:
+        if self._cache is not None and (cached := self._cache.get(id)) is not None:
+            return cached
+        return await self._coalesce_async("get", lambda: self._read(id), id)
 
     def add(self, obj: T) -> Optional[T]:
         obj.created_at = datetime.now(timezone.utc)
@@ -25,9 +93,16 @@ class BaseRepo(Generic[T]):
             return self.get(obj.id)
         return None
 
+    @staticmethod
+    def _update_payload(obj: T) -> Dict[str, Any]:
+        # Only the changed paths for documents read from Firestore, every set field otherwise
+        if (paths := obj.changed_paths()) is not None:
+            return paths
+        return obj.model_dump(exclude_unset=True)
+
     def update(self, obj: T) -> Optional[T]:
         obj.updated_at = datetime.now(timezone.utc)
-        if self._db.update_document(self._collection, obj.id, obj.model_dump(exclude_unset=True)):
+        if self._db.update_document(self._collection, obj.id, self._update_payload(obj)):
             return self.get(obj.id)
         return None
 
@@ -36,10 +111,34 @@ class BaseRepo(Generic[T]):
         return self.get(id) is None
 
     def list(self, limit: Optional[int] = None) -> List[T]:
-        return self._db.list_documents(self._collection, self._model_cls, limit)
+        return self._coalesce("list", lambda: self._db.list_documents(self._collection, self._model_cls, limit, trusted=self._trusted), limit)
 
-    def query(self, filters: List[tuple], limit: Optional[int] = None) -> List[T]:
-        return self._db.query_collection(self._collection, filters, self._model_cls, limit)
+    def query(self, filters: List[tuple], limit: Optional[int] = None, fields: Optional[List[str]] = None, order_by: Optional[List[Tuple[str, str]]] = None) -> List[T]:
+        return self._coalesce("query", lambda: self._db.query_collection(self._collection, filters, self._model_cls, limit, trusted=self._trusted, fields=fields, order_by=order_by), filters, limit, fields, order_by)
+
+    async def aquery(self, filters: List[tuple], limit: Optional[int] = None, fields: Optional[List[str]] = None) -> List[T]:
+        return await self._coalesce_async("query", lambda: self._db.query_collection(self._collection, filters, self._model_cls, limit, trusted=self._trusted, fields=fields), filters, limit, fields)
+    
+    def count(self, filters: List[tuple]) -> int:
+        return int(self._coalesce("count", lambda: self._db.aggregate_collection(self._collection, filters, "count"), filters) or 0)
+
+    def sum(self, field: str, filters: List[tuple]) -> float:
+        return self._coalesce("sum", lambda: self._db.aggregate_collection(self._collection, filters, "sum", field), field, filters) or 0.0
+
+    def avg(self, field: str, filters: List[tuple]) -> Optional[float]:
+        return self._coalesce("avg", lambda: self._db.aggregate_collection(self._collection, filters, "avg", field), field, filters)
+
+    def exists(self, filters: List[tuple]) -> bool:
+        return self._coalesce("exists", lambda: self._db.exists_in_collection(self._collection, filters), filters)
+
+    def stream_raw(self, filters: List[tuple], page_size: int = WRITE_CHUNK) -> Iterator[Dict[str, Any]]:
+        """
+        Stored data of every matching document, as is, read one page at a time.
+        """
+        return self._db.stream_collection(self._collection, filters, page_size)
+
+    def get_fields(self, ids: Iterable[str], fields: List[str]) -> Dict[str, Dict[str, Any]]:
+        return self._db.get_fields(self._collection, ids, fields)
     
     def batch_add(self, batch: firestore.WriteBatch, obj: T):
         obj.created_at = datetime.now(timezone.utc)
@@ -47,24 +146,176 @@ class BaseRepo(Generic[T]):
         doc_ref = self._db._db.collection(self._collection).document(obj.id)
         batch.set(doc_ref, obj.model_dump())
 
-    def batch_update(self, batch: firestore.WriteBatch, obj: T):
+    def batch_create(self, batch: firestore.WriteBatch, obj: T):
+        """
+        Like batch_add, but the whole batch fails if a document with the same ID already exists.
+        """
+        obj.created_at = datetime.now(timezone.utc)
+        obj.updated_at = datetime.now(timezone.utc)
+        doc_ref = self._db._db.collection(self._collection).document(obj.id)
+        batch.create(doc_ref, obj.model_dump())
+
+    def batch_restore(self, batch: firestore.WriteBatch, obj: T):
+        """
+        Writes `obj` exactly as given, timestamps included, replacing any document with its ID.
+        """
+        doc_ref = self._db._db.collection(self._collection).document(obj.id)
+        batch.set(doc_ref, obj.model_dump())
+
+    def batch_update(self, batch: firestore.WriteBatch, obj: T, if_unchanged: bool = False):
+        """
+        With `if_unchanged`, the whole batch fails if the document changed since `obj` was read.
+        """
         obj.updated_at = datetime.now(timezone.utc)
         doc_ref = self._db._db.collection(self._collection).document(obj.id)
-        batch.update(doc_ref, obj.model_dump(exclude_unset=True))
+        if if_unchanged and obj._update_time is not None:
+            batch.update(doc_ref, self._update_payload(obj), option=self._db._db.write_option(last_update_time=obj._update_time))
+        else:
+            batch.update(doc_ref, self._update_payload(obj))
     
-    def batch_delete(self, batch: firestore.WriteBatch, doc_id: str):
+    def batch_array_union(self, batch: firestore.WriteBatch, doc_id: str, field: str, *values: Any):
+        """
+        Adds values to an array field on the server, without reading or rewriting the array.
+        """
+        from google.cloud import firestore
+        doc_ref = self._db._db.collection(self._collection).document(doc_id)
+        batch.update(doc_ref, {field: firestore.ArrayUnion(list(values)), "updated_at": datetime.now(timezone.utc)})
+
+    def batch_array_remove(self, batch: firestore.WriteBatch, doc_id: str, field: str, *values: Any):
+        """
+        Removes every occurrence of values from an array field on the server.
+        """
+        from google.cloud import firestore
         doc_ref = self._db._db.collection(self._collection).document(doc_id)
-        batch.delete(doc_ref)
+        batch.update(doc_ref, {field: firestore.ArrayRemove(list(values)), "updated_at": datetime.now(timezone.utc)})
+
+    def batch_increment(self, batch: firestore.WriteBatch, doc_id: str, field: str, amount: float):
+        """
+        Adds amount (negative to subtract) to a numeric field on the server.
+        """
+        from google.cloud import firestore
+        doc_ref = self._db._db.collection(self._collection).document(doc_id)
+        batch.update(doc_ref, {field: firestore.Increment(amount), "updated_at": datetime.now(timezone.utc)})
+
+    def batch_accumulate(self, batch: firestore.WriteBatch, doc_id: str, fields: Dict[str, Any], counters: Dict[str, Any]):
+        """
+        Creates the document if it is missing, sets `fields` and adds `counters` (numbers, or maps of
+        numbers for map fields) onto what is stored, all on the server.
+        """
+        from google.cloud import firestore
+
+        def increments(values: Dict[str, Any]) -> Dict[str, Any]:
+            return {key: increments(value) if isinstance(value, dict) else firestore.Increment(value) for key, value in values.items()}
+
+        doc_ref = self._db._db.collection(self._collection).document(doc_id)
+        batch.set(doc_ref, {**fields, **increments(counters), "updated_at": datetime.now(timezone.utc)}, merge=True)
+
+    def batch_delete(self, batch: firestore.WriteBatch, doc_id: str, must_exist: bool = False, unchanged_since: Optional[datetime] = None):
+        """
+        With `must_exist`, the whole batch fails if the document is already gone.
+        With `unchanged_since` (the update_time it was read at), it also fails if the document changed since.
+        """
+        doc_ref = self._db._db.collection(self._collection).document(doc_id)
+        if unchanged_since is not None:
+            batch.delete(doc_ref, option=self._db._db.write_option(last_update_time=unchanged_since))
+        elif must_exist:
+            batch.delete(doc_ref, option=self._db._db.write_option(exists=True))
+        else:
+            batch.delete(doc_ref)
     
 from backend.models import (
-    User, Member, Stash, Storage, Label, Item, Order, Event
+    User, UserEmail, Member, Stash, JoinCode, Storage, Label, Item, Order, Event, EventDigest, ConsumptionRate,
+    month_start, previous_month
 )
 
-user_repo = BaseRepo[User](User, "users")
-member_repo = BaseRepo[Member](Member, "members")
-stash_repo = BaseRepo[Stash](Stash, "stashes")
-storage_repo = BaseRepo[Storage](Storage, "storages")
-label_repo = BaseRepo[Label](Label, "labels")
-item_repo = BaseRepo[Item](Item, "items")
-order_repo = BaseRepo[Order](Order, "orders")
-event_repo = BaseRepo[Event](Event, "events")
\ No newline at end of file
+class EventRepo(BaseRepo[Event]):
+    """
+    Events carry a `partition` key per stash and month. Reads are ordered range scans over
+    the months they cover, so their cost follows the page size, not the stash's history.
+    Needs a composite index on events (partition, created_at desc).
+    """
+
+    def scan(
+        self,
+        stash_id: str,
+        oldest: datetime,
+        newest: Optional[datetime] = None,
+        limit: Optional[int] = None,
+        after: Optional[datetime] = None,
+        before: Optional[datetime] = None,
+        fields: Optional[List[str]] = None,
+    ) -> List[Event]:
+        """
+        Events of a stash from the month of `newest` (default now) back to the month of `oldest`,
+        newest first, optionally bounded by created_at >= `after` and < `before`.
+        The current month is read alone first; each following query covers twice as many months.
+        """
+        months = []
+        month = month_start(newest or datetime.now(timezone.utc))
+        while month >= month_start(oldest):
+            months.append(Event.partition_for(stash_id, month))
+            month = previous_month(month)
+
+        range_filters = [("created_at", ">=", after)] if after else []
+        range_filters += [("created_at", "<", before)] if before else []
+
+        events: List[Event] = []
+        width = 1
+        while months and (limit is None or len(events) < limit):
+            window, months = months[:width], months[width:]
+            partition_filter = ("partition", "==", window[0]) if len(window) == 1 else ("partition", "in", window)
+            events += self.query(
+                [partition_filter, *range_filters],
+                limit=limit - len(events) if limit is not None else None,
+                fields=fields,
+                order_by=[("created_at", "desc")],
+            )
+            width = min(width * 2, MAX_IN_VALUES)
+        return events
+
+    def batch_delete_partition(self, batch: firestore.WriteBatch, stash_id: str, month: datetime) -> int:
+        """
+        Queues deletes for every event of a stash in one month. Returns how many were queued.
+        """
+        events = self.query([("partition", "==", Event.partition_for(stash_id, month))], fields=["id"])
+        for event in events:
+            self.batch_delete(batch, event.id)
+        return len(events)
+
+    def ensure_partitioned(self, stash: Stash) -> None:
+        """
+        Sets `partition` on events written before it existed, once per stash, and records on the
+        stash when its oldest event is older than the stash itself.
+        """
+        if stash.events_partitioned:
+            return
+        events = self.query([("stash_id", "==", stash.id)], fields=["id", "created_at"])
+        for start in range(0, len(events), WRITE_CHUNK):
+            batch = self._db.create_batch()
+            for event in events[start:start + WRITE_CHUNK]:
+                doc_ref = self._db._db.collection(self._collection).document(event.id)
+                batch.update(doc_ref, {"partition": Event.partition_for(stash.id, event.created_at)})
+            if not self._db.commit_batch(batch):
+                return  # retried on the next read
+        flagged = stash.model_copy(deep=True)
+        flagged.events_partitioned = True
+        since = min((event.created_at for event in events), default=None)
+        if since is not None and since < stash.created_at:
+            flagged.events_since = since
+        if stash_repo.update(flagged):
+            stash.events_partitioned = True
+            stash.events_since = flagged.events_since
+
+
+user_repo = BaseRepo[User](User, "users", trusted=True, cache_ttl=CACHE_TTL_SECONDS)
+user_email_repo = BaseRepo[UserEmail](UserEmail, "user_emails", trusted=True)
+member_repo = BaseRepo[Member](Member, "members", trusted=True, cache_ttl=CACHE_TTL_SECONDS)
+stash_repo = BaseRepo[Stash](Stash, "stashes", trusted=True, cache_ttl=CACHE_TTL_SECONDS)
+join_code_repo = BaseRepo[JoinCode](JoinCode, "join_codes", trusted=True)
+storage_repo = BaseRepo[Storage](Storage, "storages", trusted=True)
+label_repo = BaseRepo[Label](Label, "labels", trusted=True)
+item_repo = BaseRepo[Item](Item, "items", trusted=True)
+order_repo = BaseRepo[Order](Order, "orders", trusted=True)
+event_repo = EventRepo(Event, "events", trusted=True)
+event_digest_repo = BaseRepo[EventDigest](EventDigest, "event_digests", trusted=True)
+consumption_rate_repo = BaseRepo[ConsumptionRate](ConsumptionRate, "consumption_rates", trusted=True)
\ No newline at end of file
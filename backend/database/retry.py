@@ -0,0 +1,49 @@
+import os
+import time
+import random
+import threading
+from collections import defaultdict
+from typing import Dict
+
+# === Config ===
+DEFAULT_MAX_ATTEMPTS = int(os.environ.get("TRANSACTION_MAX_ATTEMPTS", "5"))
+DEFAULT_BASE_DELAY = 0.02  # seconds
+DEFAULT_MAX_DELAY = 1.0
+
+
+class Backoff:
+    """
+    Exponential backoff with full jitter: the n-th retry sleeps a random time in [0, base * 2^n],
+    capped at max_delay, so writers that collided once spread out instead of colliding again.
+    """
+
+    def __init__(self, base_delay: float = DEFAULT_BASE_DELAY, max_delay: float = DEFAULT_MAX_DELAY):
+        self._base_delay = base_delay
+        self._max_delay = max_delay
+
+    def delay(self, retry: int) -> float:
+        return random.uniform(0, min(self._max_delay, self._base_delay * (2 ** retry)))
+
+    def sleep(self, retry: int) -> None:
+        time.sleep(self.delay(retry))
+
+
+class RetryStats:
+    """
+    Per-operation counters for contended writes: runs, retries and runs that gave up.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts: Dict[str, Dict[str, int]] = defaultdict(lambda: {"runs": 0, "retries": 0, "conflicts": 0})
+
+    def record(self, name: str, retries: int, conflict: bool) -> None:
+        with self._lock:
+            counts = self._counts[name]
+            counts["runs"] += 1
+            counts["retries"] += retries
+            counts["conflicts"] += int(conflict)
+
+    def snapshot(self) -> Dict[str, Dict[str, int]]:
+        with self._lock:
+            return {name: dict(counts) for name, counts in self._counts.items()}
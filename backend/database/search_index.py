@@ -0,0 +1,368 @@
+import os
+import heapq
+import queue
+import logging
+import threading
+import unicodedata
+from collections import Counter, OrderedDict, deque
+from typing import Deque, Dict, FrozenSet, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+from backend.database.invalidation import Invalidation, invalidation_bus
+from backend.database.repos import MAX_IN_VALUES
+from backend.database.singleflight import SingleFlight
+
+# === Config ===
+MAX_INDEXED_STASHES = int(os.environ.get("SEARCH_MAX_STASHES", "256"))  # least recently searched beyond this are dropped
+MAX_CHANGE_LOG = 20000  # an index that falls further behind than this is rebuilt
+MAX_INLINE_RESOLVES = 32  # changes a search may read itself when the resolver lags; with more the index is rebuilt
+MIN_COVERAGE = 0.4  # share of the query's trigrams a match must contain
+
+# Indexed text per collection: (kind reported to clients, fields)
+INDEXED_FIELDS: Dict[str, Tuple[str, Tuple[str, ...]]] = {
+    "items": ("item", ("name",)),
+    "labels": ("label", ("name", "food_group")),
+    "storages": ("storage", ("name",)),
+}
+OWNER_FIELDS = {"items": "label_id", "labels": "stash_id", "storages": "stash_id"}
+# Id lists a new document is added to in the same commit, so it is found without reading every write
+CHILD_LISTS: Dict[str, Tuple[Tuple[str, str], ...]] = {
+    "stashes": (("labels", "label_ids"), ("storages", "storage_ids")),
+    "labels": (("items", "item_ids"),),
+}
+
+_DocKey = Tuple[str, str]  # (kind, id)
+_logger = logging.getLogger(__name__)
+
+
+def normalize(text: str) -> str:
+    """
+    Lower-cased, accents stripped, anything but letters and digits turned into single spaces.
+    """
+    decomposed = unicodedata.normalize("NFKD", text)
+    stripped = "".join(char for char in decomposed if not unicodedata.combining(char)).casefold()
+    return " ".join("".join(char if char.isalnum() else " " for char in stripped).split())
+
+def trigrams(normalized: str) -> FrozenSet[str]:
+    # Words are padded so their first letters form their own trigrams, which makes prefixes match
+    grams = set()
+    for word in normalized.split():
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return frozenset(grams)
+
+
+class SearchHit(NamedTuple):
+    kind: str
+    id: str
+    field: str
+    text: str
+    score: float
+
+
+class _Entry(NamedTuple):
+    field: str
+    text: str
+    normalized: str
+    grams: FrozenSet[str]
+
+
+class _Update(NamedTuple):
+    key: _DocKey
+    stash_id: Optional[str]
+    fields: Optional[Dict[str, str]]  # None if the document is gone
+
+
+class _Change:
+    """
+    One write from the invalidation bus, resolved into updates to the indexed documents it concerns:
+    the document itself, and any new documents named by its id lists. Writes to documents no live
+    index holds are resolved to nothing without a read. Resolved in the background as it is logged,
+    so indexes can skip other stashes' writes.
+    """
+    __slots__ = ("seq", "collection", "doc_id", "resolved")
+
+    def __init__(self, seq: int, collection: str, doc_id: str):
+        self.seq = seq
+        self.collection = collection
+        self.doc_id = doc_id
+        self.resolved: Optional[List[_Update]] = None
+
+
+
+# === === Index === ===
+
+class StashIndex:
+    """
+    Trigram postings over one stash's item, label and storage names.
+    """
+
+    def __init__(self, stash_id: str, applied_seq: int):
+        self.stash_id = stash_id
+        self.applied_seq = applied_seq  # last change from the log reflected here
+        self.start_seq = applied_seq
+        self.built_seq: Optional[int] = None  # last change logged before members was filled; None while building
+        self.lock = threading.Lock()  # held while building, applying changes and searching
+        self.members: Set[_DocKey] = set()  # documents of the stash as of the last resolved change; guarded by the registry lock
+        self._entries: Dict[_DocKey, List[_Entry]] = {}
+        self._postings: Dict[str, Set[_DocKey]] = {}
+
+    def put(self, key: _DocKey, fields: Dict[str, str]) -> None:
+        self.remove(key)
+        entries = []
+        for field, text in fields.items():
+            if text and (normalized := normalize(text)):
+                entries.append(_Entry(field, text, normalized, trigrams(normalized)))
+        if not entries:
+            return
+        self._entries[key] = entries
+        for entry in entries:
+            for gram in entry.grams:
+                self._postings.setdefault(gram, set()).add(key)
+
+    def remove(self, key: _DocKey) -> None:
+        for entry in self._entries.pop(key, ()):
+            for gram in entry.grams:
+                if (keys := self._postings.get(gram)) is not None:
+                    keys.discard(key)
+                    if not keys:
+                        del self._postings[gram]
+
+    def search(self, query: str, limit: int, kinds: Optional[Iterable[str]] = None) -> List[SearchHit]:
+        """
+        Ranked fuzzy matches: trigram overlap with the query, boosted for exact, prefix and word-prefix matches.
+        """
+        if not (normalized := normalize(query)) or not (grams := trigrams(normalized)):
+            return []
+        kinds = set(kinds) if kinds else None
+
+        shared: Counter = Counter()
+        for gram in grams:
+            shared.update(self._postings.get(gram, ()))
+
+        hits = []
+        for key, _ in shared.items():
+            if kinds is not None and key[0] not in kinds:
+                continue
+            best: Optional[SearchHit] = None
+            for entry in self._entries[key]:
+                overlap = len(grams & entry.grams)
+                if (coverage := overlap / len(grams)) < MIN_COVERAGE:
+                    continue
+                score = 0.6 * coverage + 0.4 * overlap / (len(grams) + len(entry.grams) - overlap)
+                if entry.normalized == normalized:
+                    score += 1.0
+                elif entry.normalized.startswith(normalized):
+                    score += 0.5
+                elif f" {normalized}" in f" {entry.normalized}":
+                    score += 0.3
+                if best is None or score > best.score:
+                    best = SearchHit(key[0], key[1], entry.field, entry.text, round(score, 4))
+            if best is not None:
+                hits.append(best)
+        return heapq.nlargest(limit, hits, key=lambda hit: hit.score)
+
+
+
+# === === Registry === ===
+
+class SearchIndexes:
+    """
+    Per-stash indexes, built on the first search and kept current from the invalidation bus.
+    Writes are logged as they are published and resolved to their stash by a background thread;
+    each index applies its own stash's changes newer than itself before answering, and a changed
+    document is read at most once however many indexes need it. Only documents of stashes with a
+    live index are read, except for writes logged while an index was being built.
+    """
+
+    def __init__(self, max_stashes: int = MAX_INDEXED_STASHES):
+        self._max_stashes = max_stashes
+        self._indexes: "OrderedDict[str, StashIndex]" = OrderedDict()
+        self._log: Deque[_Change] = deque()
+        self._seq = 0
+        self._lock = threading.Lock()  # guards _indexes, _log, _seq and index members
+        self._builds = SingleFlight()
+        self._unresolved: "queue.Queue[_Change]" = queue.Queue()
+        self._resolver: Optional[threading.Thread] = None
+        invalidation_bus.subscribe(self._on_invalidate)
+
+    def _on_invalidate(self, entries: List[Invalidation]) -> None:
+        with self._lock:
+            if not self._indexes:
+                return
+            for entry in entries:
+                if entry.collection in INDEXED_FIELDS or (entry.collection == "stashes" and entry.doc_id in self._indexes):
+                    self._seq += 1
+                    change = _Change(self._seq, entry.collection, entry.doc_id)
+                    self._log.append(change)
+                    self._unresolved.put(change)
+            while len(self._log) > MAX_CHANGE_LOG:
+                self._log.popleft()
+            if self._resolver is None or not self._resolver.is_alive():
+                self._resolver = threading.Thread(target=self._resolve_loop, name="search-index-resolver", daemon=True)
+                self._resolver.start()
+
+    def _resolve_loop(self) -> None:
+        while True:
+            change = self._unresolved.get()
+            if change.resolved is None:
+                try:
+                    self._resolve(change)
+                except Exception:
+                    # Left unresolved; the index that needs it reads it itself or rebuilds
+                    _logger.exception("Resolving %s/%s for search failed", change.collection, change.doc_id)
+
+    def search(self, stash_id: str, query: str, limit: int = 20, kinds: Optional[Iterable[str]] = None) -> List[SearchHit]:
+        index = self._get(stash_id)
+        if not self._catch_up(index):
+            index = self._get(stash_id)
+            self._catch_up(index)
+        with index.lock:
+            return index.search(query, limit, kinds)
+
+    def _get(self, stash_id: str) -> StashIndex:
+        with self._lock:
+            if (index := self._indexes.get(stash_id)) is not None:
+                self._indexes.move_to_end(stash_id)
+                return index
+        return self._builds.do(("build", stash_id), lambda: self._build(stash_id))
+
+    def _build(self, stash_id: str) -> StashIndex:
+        from backend.database.repos import storage_repo, label_repo, item_repo
+
+        with self._lock:
+            # Writes logged from here on are applied after the build, so none are missed
+            index = StashIndex(stash_id, self._seq)
+            index.lock.acquire()  # anyone finding it before it is filled waits
+            self._indexes[stash_id] = index
+            while len(self._indexes) > self._max_stashes:
+                self._indexes.popitem(last=False)
+
+        members: Set[_DocKey] = set()
+        try:
+            storages = storage_repo.query([("stash_id", "==", stash_id)], fields=["id", "name"])
+            labels = label_repo.query([("stash_id", "==", stash_id)], fields=["id", "name", "food_group"])
+            label_ids = [label.id for label in labels]
+            items = []
+            for start in range(0, len(label_ids), MAX_IN_VALUES):
+                items += item_repo.query([("label_id", "in", label_ids[start:start + MAX_IN_VALUES])], fields=["id", "name"])
+
+            for collection, documents in (("storages", storages), ("labels", labels), ("items", items)):
+                kind, fields = INDEXED_FIELDS[collection]
+                for document in documents:
+                    index.put((kind, document.id), {field: getattr(document, field) for field in fields})
+                    members.add((kind, document.id))
+        except BaseException:
+            self._forget(index)
+            raise
+        finally:
+            with self._lock:
+                index.members |= members
+                index.built_seq = self._seq
+            index.lock.release()
+        return index
+
+    def drop(self, stash_id: str) -> None:
+        with self._lock:
+            self._indexes.pop(stash_id, None)
+
+    def _forget(self, index: StashIndex) -> None:
+        with self._lock:
+            if self._indexes.get(index.stash_id) is index:
+                del self._indexes[index.stash_id]
+
+    def _catch_up(self, index: StashIndex) -> bool:
+        """
+        Applies logged changes newer than the index. False if it fell behind the log, or the resolver
+        left too many changes for this search to read itself, and the index was dropped.
+        """
+        with self._lock:
+            if self._log and self._log[0].seq > index.applied_seq + 1:
+                stale = True
+            else:
+                pending = [change for change in self._log if change.seq > index.applied_seq]
+                stale = sum(1 for change in pending if change.resolved is None) > MAX_INLINE_RESOLVES
+        if stale:
+            self._forget(index)
+            return False
+
+        # Resolved before taking the index lock, so searches of the stash do not wait on the reads
+        resolved = [(change.seq, self._resolve(change)) for change in pending]
+        with index.lock:
+            for seq, updates in resolved:
+                if seq <= index.applied_seq:
+                    continue  # applied by a concurrent search
+                for update in updates:
+                    if update.fields is None or update.stash_id != index.stash_id:
+                        index.remove(update.key)
+                    else:
+                        index.put(update.key, update.fields)
+                index.applied_seq = seq
+        return True
+
+    def _owner(self, key: _DocKey) -> Optional[str]:
+        # Caller holds self._lock
+        return next((index.stash_id for index in self._indexes.values() if key in index.members), None)
+
+    def _resolve(self, change: _Change) -> List[_Update]:
+        if change.resolved is None:
+            with self._lock:
+                # Written while an index was being built, and maybe missed by it: read in full
+                full = any(index.start_seq < change.seq and (index.built_seq is None or change.seq <= index.built_seq) for index in self._indexes.values())
+                if change.collection == "stashes":
+                    wanted = not full and change.doc_id in self._indexes
+                else:
+                    wanted = full or self._owner((INDEXED_FIELDS[change.collection][0], change.doc_id)) is not None
+            change.resolved = self._read(change.collection, [change.doc_id], expand=not full) if wanted else []
+        return change.resolved
+
+    def _read(self, collection: str, doc_ids: List[str], expand: bool) -> List[_Update]:
+        """
+        Reads documents as they are now and updates the members of the indexes to match. With `expand`,
+        new documents named by their id lists are read too, if they belong to a stash with a live index.
+        """
+        from backend.database.repos import stash_repo, storage_repo, label_repo, item_repo
+
+        repo = {"stashes": stash_repo, "items": item_repo, "labels": label_repo, "storages": storage_repo}[collection]
+        kind, fields = INDEXED_FIELDS.get(collection, ("stash", ()))
+        owner_field = OWNER_FIELDS.get(collection)
+        child_lists = CHILD_LISTS.get(collection, ()) if expand else ()
+        documents = repo.get_fields(doc_ids, [*fields, *([owner_field] if owner_field else []), *(field for _, field in child_lists)])
+
+        # Items belong to the stash of their label, which is read only if no index holds it
+        owners = {doc_id: data.get(owner_field) for doc_id, data in documents.items() if owner_field}
+        if collection == "items":
+            with self._lock:
+                stashes = {label_id: self._owner(("label", label_id)) for label_id in set(owners.values())}
+            if (unknown := [label_id for label_id, stash_id in stashes.items() if stash_id is None and label_id]):
+                stashes.update((label_id, data.get("stash_id")) for label_id, data in label_repo.get_fields(unknown, ["stash_id"]).items())
+            owners = {doc_id: stashes.get(label_id) for doc_id, label_id in owners.items()}
+
+        updates: List[_Update] = []
+        children: Dict[str, List[str]] = {}
+        with self._lock:
+            for doc_id in doc_ids:
+                data = documents.get(doc_id)
+                stash_id = doc_id if collection == "stashes" else owners.get(doc_id)
+                index = self._indexes.get(stash_id) if data is not None else None
+                if collection != "stashes":
+                    key = (kind, doc_id)
+                    updates.append(_Update(key, stash_id, None if data is None else {field: data.get(field) for field in fields}))
+                    for other in self._indexes.values():
+                        other.members.discard(key)
+                    if index is not None:
+                        index.members.add(key)
+                if index is None:
+                    continue
+                for child_collection, field in child_lists:
+                    child_kind = INDEXED_FIELDS[child_collection][0]
+                    children.setdefault(child_collection, []).extend(
+                        child_id for child_id in data.get(field) or () if (child_kind, child_id) not in index.members
+                    )
+        for child_collection, child_ids in children.items():
+            if child_ids:
+                updates += self._read(child_collection, list(dict.fromkeys(child_ids)), expand)
+        return updates
+
+
+# Global importable instance
+search_indexes = SearchIndexes()
@@ -0,0 +1,85 @@
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Hashable, Tuple, TypeVar
+
+from pydantic import BaseModel
+
+R = TypeVar("R")
+
+
+def _share(value: Any) -> Any:
+    """
+    Copy handed to callers that joined someone else's call, so no two requests mutate the same model.
+    """
+    if isinstance(value, BaseModel):
+        return value.model_copy(deep=True)
+    if isinstance(value, list):
+        return [_share(entry) for entry in value]
+    return value
+
+
+def freeze(value: Any) -> Hashable:
+    """
+    Hashable form of a query argument (lists become tuples). Raises TypeError if it cannot be keyed.
+    """
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(entry) for entry in value)
+    if isinstance(value, dict):
+        return tuple(sorted((key, freeze(entry)) for key, entry in value.items()))
+    hash(value)
+    return value
+
+
+class SingleFlight:
+    """
+    Collapses identical concurrent calls into one: the first caller for a key runs the function,
+    everyone arriving while it is in flight waits for and shares its result (or exception).
+    Works from worker threads (`do`) and from the event loop (`do_async`).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, Future] = {}
+
+    def _join(self, key: Hashable) -> Tuple[Future, bool]:
+        with self._lock:
+            if (future := self._calls.get(key)) is not None:
+                return future, False
+            future = self._calls[key] = Future()
+            return future, True
+
+    def _run(self, key: Hashable, future: Future, fn: Callable[[], R]) -> R:
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                if self._calls.get(key) is future:
+                    del self._calls[key]
+
+    def do(self, key: Hashable, fn: Callable[[], R]) -> R:
+        future, leader = self._join(key)
+        if leader:
+            return self._run(key, future, fn)
+        return _share(future.result())
+
+    async def do_async(self, key: Hashable, fn: Callable[[], R]) -> R:
+        future, leader = self._join(key)
+        if leader:
+            return await asyncio.get_running_loop().run_in_executor(None, self._run, key, future, fn)
+        return _share(await asyncio.wrap_future(future))
+
+    def forget(self, predicate: Callable[[Hashable], bool]) -> None:
+        """
+        Stops new callers from joining matching in-flight calls, e.g. after a write made them stale.
+        Callers already waiting still get the result.
+        """
+        with self._lock:
+            for key in [key for key in self._calls if predicate(key)]:
+                del self._calls[key]
@@ -1,9 +1,36 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
+from fastapi.concurrency import run_in_threadpool
+from backend.database.log_pipeline import setup_logging
+from backend.database.firestore_wrapper import firestore_wrapper
+from backend.database.invalidation import invalidation_bus, transport_from_env
+from backend.database.event_retention import event_compactor
 from backend.routes import auth_routes, repo_routes
+from backend.routes._responses import ModelResponse
+from backend.routes._admission import AdmissionMiddleware
 
 from fastapi.middleware.cors import CORSMiddleware
 
-app = FastAPI()
+setup_logging()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Fail fast on missing config, then connect before the server reports ready
+    auth_routes.get_secret_key()
+    firestore_wrapper.connect()
+    await run_in_threadpool(firestore_wrapper.warm_up)
+    if (transport := transport_from_env(firestore_wrapper.connect)):
+        invalidation_bus.start(transport)
+    event_compactor.start()
+    yield
+    event_compactor.stop()
+    invalidation_bus.stop()
+    firestore_wrapper.close()
+
+app = FastAPI(default_response_class=ModelResponse, lifespan=lifespan)
+
+# Added first so it sits inside CORS and shed responses still carry CORS headers
+app.add_middleware(AdmissionMiddleware)
 
 app.add_middleware(
     CORSMiddleware,
@@ -1,21 +1,97 @@
 import uuid
-from pydantic import BaseModel, Field, EmailStr
-from typing import List, Optional, Dict, Any
-from datetime import datetime, timezone
+import itertools
+from urllib.parse import quote
+from pydantic import BaseModel, Field, EmailStr, PrivateAttr, computed_field
+from typing import List, Optional, Dict, Any, ClassVar, FrozenSet, Iterable, get_origin
+from datetime import datetime, timedelta, timezone
 from enum import Enum
 
 # === Base ===
+_load_ids = itertools.count(1)
+
+def _is_path_key(key: Any) -> bool:
+    # Map keys that can be addressed as a dotted Firestore field path without quoting
+    return isinstance(key, str) and key != "" and "." not in key and "`" not in key
+
 class BaseDocument(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
+    # Change tracking: fields assigned since load, and shallow copies of the dict/list fields as loaded.
+    # Documents that were not loaded from Firestore have no snapshot and are written whole.
+    _dirty: FrozenSet[str] = PrivateAttr(default_factory=frozenset)
+    _loaded: Optional[Dict[str, Any]] = PrivateAttr(default=None)
+    _load_id: Optional[int] = PrivateAttr(default=None)
+    _update_time: Optional[datetime] = PrivateAttr(default=None)  # server version as read, for preconditions
+    _mutable_fields: ClassVar[FrozenSet[str]] = frozenset()
+
+    @classmethod
+    def __pydantic_init_subclass__(cls, **kwargs: Any) -> None:
+        super().__pydantic_init_subclass__(**kwargs)
+        cls._mutable_fields = frozenset(
+            name for name, field in cls.model_fields.items()
+            if get_origin(field.annotation) in (dict, list) or field.annotation in (dict, list)
+        )
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        if name in self.__pydantic_fields__ and (private := self.__pydantic_private__) is not None \
+                and name not in private["_dirty"] and self.__dict__.get(name) != value:
+            # Replaced rather than mutated, so shallow model copies do not share it
+            private["_dirty"] = private["_dirty"] | {name}
+        super().__setattr__(name, value)
+
+    def _mark_loaded(self, fields: Optional[Iterable[str]] = None, update_time: Optional[datetime] = None) -> None:
+        """
+        Called when the document is read. `fields` limits the snapshot to a projection.
+        """
+        mutable = self._mutable_fields if fields is None else self._mutable_fields.intersection(fields)
+        private = self.__pydantic_private__
+        private["_dirty"] = frozenset()
+        private["_loaded"] = {name: getattr(self, name).copy() for name in mutable}
+        private["_load_id"] = next(_load_ids)
+        private["_update_time"] = update_time
+
+    def changed_paths(self) -> Optional[Dict[str, Any]]:
+        """
+        Update payload with only what changed since load: assigned fields whole and map fields
+        as one dotted path per changed key. None if the document was not loaded from Firestore.
+        """
+        private = self.__pydantic_private__
+        if (loaded := private["_loaded"]) is None:
+            return None
+
+        from google.cloud.firestore import DELETE_FIELD
+
+        paths: Dict[str, Any] = {}
+        whole = {name for name in private["_dirty"] if name not in loaded}
+        for name, old in loaded.items():
+            if (new := getattr(self, name)) == old:
+                continue
+            if isinstance(new, dict) and isinstance(old, dict) and all(_is_path_key(key) for key in new.keys() | old.keys()):
+                for key in new.keys() | old.keys():
+                    if key not in new:
+                        paths[f"{name}.{key}"] = DELETE_FIELD
+                    elif key not in old or old[key] != new[key]:
+                        paths[f"{name}.{key}"] = new[key]
+            else:
+                whole.add(name)
+        if whole:
+            paths.update(self.model_dump(include=whole))
+        return paths
+
     def diff(self, other: 'BaseDocument') -> dict[str, tuple[Any, Any]]:
         if not isinstance(other, type(self)):
             raise ValueError(f"Cannot diff {type(self)} with {type(other)}")
 
+        fields = type(self).model_fields
+        if self._load_id is not None and self._load_id == other._load_id:
+            # Both come from the same read, so only assigned or mutable fields can differ
+            candidates = self._dirty | other._dirty | self._mutable_fields
+            fields = [field for field in fields if field in candidates]
+
         changes = {}
-        for field in type(self).model_fields:
+        for field in fields:
             old_val = getattr(self, field)
             new_val = getattr(other, field)
             if old_val != new_val:
@@ -23,6 +99,13 @@ class BaseDocument(BaseModel):
         return changes
     
 # === User ===
+def normalize_email(email: str) -> str:
+    return email.strip().lower()
+
+def email_key(email: str) -> str:
+    # Document IDs cannot contain '/', which is legal in an email's local part
+    return quote(normalize_email(email), safe="@+")
+
 class User(BaseDocument):
     email: EmailStr
     username: str
@@ -55,12 +138,12 @@ class User(BaseDocument):
     
     def purge(self, batch):
         from backend.database.firestore_wrapper import firestore_wrapper
-        from backend.database.repos import user_repo, member_repo
+        from backend.database.repos import user_repo, user_email_repo, member_repo
         
         if user_repo.get(self.id) is None:
             raise ValueError("User does not exist.")
 
-        _batch = batch if batch else firestore_wrapper.create_batch()
+        _batch = batch if batch is not None else firestore_wrapper.create_batch()
 
         members = self.get_all_members()
         for member in members:
@@ -68,10 +151,16 @@ class User(BaseDocument):
             member.owner_user_id = None
             member_repo.batch_update(_batch, member)
 
+        user_email_repo.batch_delete(_batch, email_key(self.email))
         user_repo.batch_delete(_batch, self.id)
 
         return _batch
 
+# === UserEmail ===
+class UserEmail(BaseDocument):
+    # id is email_key(email), so email lookups are a single point read and creation enforces uniqueness
+    user_id: str
+
 # === Member ===
 class Member(BaseDocument):
     owner_user_id: Optional[str] = None
@@ -130,17 +219,13 @@ class Member(BaseDocument):
         if member_repo.get(self.id) is None:
             raise ValueError("Member does not exist.")
 
-        _batch = batch if batch else firestore_wrapper.create_batch()
+        _batch = batch if batch is not None else firestore_wrapper.create_batch()
 
-        user = self.get_owner()
-        if user:
-            user.member_ids.remove(self.id)
-            user_repo.batch_update(_batch, user)
+        if self.get_owner():
+            user_repo.batch_array_remove(_batch, self.owner_user_id, "member_ids", self.id)
             
-        stash = self.get_stash()
-        if stash:
-            stash.member_ids.remove(self.id)
-            stash_repo.batch_update(_batch, stash)
+        if self.get_stash():
+            stash_repo.batch_array_remove(_batch, self.stash_id, "member_ids", self.id)
             
         bought_items = item_repo.query([("buyer_member_id", "==", self.id)])
         for item in bought_items:
@@ -166,13 +251,39 @@ class Member(BaseDocument):
         return _batch
 
 # === Stash ===
+EVENT_CLOCK_SKEW = timedelta(minutes=5)  # events written on another server may be stamped this much before the stash
+
+def generate_join_code() -> str:
+    return uuid.uuid4().hex[:8].upper()
+
+def normalize_join_code(code: str) -> str:
+    return code.strip().upper()
+
+class RollupPeriod(str, Enum):
+    DAILY = "daily"
+    WEEKLY = "weekly"
+
+    def start_of(self, moment: datetime) -> datetime:
+        # Periods are in UTC; weeks start on Monday
+        day = moment.astimezone(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+        return day - timedelta(days=day.weekday()) if self is RollupPeriod.WEEKLY else day
+
+    def length(self) -> timedelta:
+        return timedelta(weeks=1) if self is RollupPeriod.WEEKLY else timedelta(days=1)
+
 class Stash(BaseDocument):
     name: str
     address: Optional[str] = None
     member_ids: List[str] = Field(default_factory=list)
     storage_ids: List[str] = Field(default_factory=list)
     label_ids: List[str] = Field(default_factory=list)
-    join_code: str = Field(default_factory=lambda: uuid.uuid4().hex[:8])
+    join_code: str = Field(default_factory=generate_join_code)
+    events_partitioned: bool = False  # False for stashes whose events predate Event.partition, until backfilled
+    events_since: Optional[datetime] = None  # created_at of the oldest event, when it is older than the stash (e.g. restored)
+    # Event retention, opt-in; None or 0 keeps every event. Events past a limit are rolled into digests.
+    event_retention_days: Optional[int] = None
+    event_retention_count: Optional[int] = None
+    event_rollup: RollupPeriod = RollupPeriod.DAILY
     
     def get_all_members(self) -> List[Member]:
         from backend.database.repos import member_repo
@@ -213,33 +324,48 @@ class Stash(BaseDocument):
         orders = order_repo.query([("stash_id", "==", self.id)])
         return orders
     
-    def get_events(self) -> List['Event']:
+    def get_events(self, limit: Optional[int] = None, after: Optional[datetime] = None, before: Optional[datetime] = None) -> List['Event']:
+        """
+        Newest first, optionally only created_at >= `after` and < `before`. Only the months in range are read.
+        """
         from backend.database.repos import event_repo
-        events = event_repo.query([("stash_id", "==", self.id)])
+        event_repo.ensure_partitioned(self)
+        oldest = max(after, self.events_start()) if after else self.events_start()
+        events = event_repo.scan(self.id, oldest, newest=before, limit=limit, after=after, before=before)
         return events
     
-    def get_items(self) -> List['Item']:
+    def events_start(self) -> datetime:
+        """
+        A moment none of the stash's events is older than, where month-by-month event scans stop.
+        """
+        oldest = min(self.created_at, self.events_since) if self.events_since else self.created_at
+        return oldest - EVENT_CLOCK_SKEW
+    
+    def get_event_digests(self) -> List['EventDigest']:
+        from backend.database.repos import event_digest_repo
+        digests = event_digest_repo.query([("stash_id", "==", self.id)], order_by=[("period_start", "desc")])
+        return digests
+    
+    def get_items(self, fields: Optional[List[str]] = None) -> List['Item']:
         from backend.database.repos import item_repo, label_repo
         labels = self.get_labels()
         label_ids = [label.id for label in labels]
-        items = item_repo.query([("label_id", "in", label_ids)]) if label_ids else []
+        items = item_repo.query([("label_id", "in", label_ids)], fields=fields) if label_ids else []
         return items
     
     def purge(self, batch):
         from backend.database.firestore_wrapper import firestore_wrapper
-        from backend.database.repos import stash_repo, user_repo, member_repo, storage_repo, label_repo, item_repo, order_repo, event_repo
+        from backend.database.repos import stash_repo, user_repo, member_repo, storage_repo, label_repo, item_repo, order_repo, event_repo, event_digest_repo, join_code_repo, consumption_rate_repo
         
         if stash_repo.get(self.id) is None:
             raise ValueError("stash does not exist.")
 
-        _batch = batch if batch else firestore_wrapper.create_batch()
+        _batch = batch if batch is not None else firestore_wrapper.create_batch()
 
         members = self.get_all_members()
         for member in members:
-            user = member.get_owner()
-            if user:
-                user.member_ids.remove(member.id)
-                user_repo.batch_update(_batch, user)
+            if member.get_owner():
+                user_repo.batch_array_remove(_batch, member.owner_user_id, "member_ids", member.id)
                 
             member_repo.batch_delete(_batch, member.id)
             
@@ -252,25 +378,47 @@ class Stash(BaseDocument):
             items = label.get_items()
             for item in items:
                 item_repo.batch_delete(_batch, item.id)
+            consumption_rate_repo.batch_delete(_batch, label.id)
             label_repo.batch_delete(_batch, label.id)
 
         orders = self.get_orders()
         for order in orders:
             order_repo.batch_delete(_batch, order.id)
 
-        events = self.get_events()
-        for event in events:
-            event_repo.batch_delete(_batch, event.id)
+        event_repo.ensure_partitioned(self)
+        month = month_start(datetime.now(timezone.utc))
+        while month >= month_start(self.events_start()):
+            event_repo.batch_delete_partition(_batch, self.id, month)
+            month = previous_month(month)
+
+        digests = self.get_event_digests()
+        for digest in digests:
+            event_digest_repo.batch_delete(_batch, digest.id)
             
+        if self.join_code:
+            join_code_repo.batch_delete(_batch, normalize_join_code(self.join_code))
+
         stash_repo.batch_delete(_batch, self.id)
         
         return _batch
 
+# === JoinCode ===
+class JoinCode(BaseDocument):
+    # id is the normalized join code, so resolving a code is a single point read
+    stash_id: str
+
 # === Storage ===
+class StorageType(str, Enum):
+    FRIDGE = "Fridge"
+    FREEZER = "Freezer"
+    PANTRY = "Pantry"
+    GARDEN = "Garden"
+    OTHER = "Other"
+
 class Storage(BaseDocument):
     name: str
     stash_id: str
-    type: 'StorageType' = Field(default_factory=lambda: StorageType.PANTRY)
+    type: StorageType = Field(default_factory=lambda: StorageType.PANTRY)
     description: Optional[str] = None
     item_ids: List[str] = Field(default_factory=list)
     
@@ -279,9 +427,9 @@ class Storage(BaseDocument):
         stash = stash_repo.get(self.stash_id)
         return stash
     
-    def get_items(self) -> List['Item']:
+    def get_items(self, fields: Optional[List[str]] = None) -> List['Item']:
         from backend.database.repos import item_repo
-        items = item_repo.query([("storage_id", "==", self.id)])
+        items = item_repo.query([("storage_id", "==", self.id)], fields=fields)
         return items
     
     def get_labels(self) -> List['Label']:
@@ -296,23 +444,20 @@ class Storage(BaseDocument):
         if storage_repo.get(self.id) is None:
             raise ValueError("Storage does not exist.")
         
-        items = self.get_items()
-        if items:
+        if item_repo.exists([("storage_id", "==", self.id)]):
             raise ValueError("Cannot delete storage with associated items.")
         
-        labels = label_repo.query([("default_storage_id", "==", self.id)])
-        if labels:
+        if label_repo.exists([("default_storage_id", "==", self.id)]):
             raise ValueError("Cannot delete storage that is set as default in a label.")
 
-        _batch = batch if batch else firestore_wrapper.create_batch()
+        _batch = batch if batch is not None else firestore_wrapper.create_batch()
 
         stash = self.get_stash()
         if stash:
             if len(stash.storage_ids) <= 1:
                 raise ValueError("Stash must have at least one storage.")
             
-            stash.storage_ids.remove(self.id)
-            stash_repo.batch_update(_batch, stash)
+            stash_repo.batch_array_remove(_batch, stash.id, "storage_ids", self.id)
 
             event = Event(
                 stash_id=stash.id,
@@ -327,13 +472,6 @@ class Storage(BaseDocument):
 
         return _batch
     
-class StorageType(str, Enum):
-    FRIDGE = "Fridge"
-    FREEZER = "Freezer"
-    PANTRY = "Pantry"
-    GARDEN = "Garden"
-    OTHER = "Other"
-
 # === Label ===
 class Label(BaseDocument):
     name: str
@@ -361,21 +499,19 @@ class Label(BaseDocument):
 
     def purge(self, batch, deleter_id: Optional[str]):
         from backend.database.firestore_wrapper import firestore_wrapper
-        from backend.database.repos import label_repo, stash_repo, item_repo, event_repo
+        from backend.database.repos import label_repo, stash_repo, item_repo, event_repo, consumption_rate_repo
         
         if label_repo.get(self.id) is None:
             raise ValueError("Label does not exist.")
         
-        items = self.get_items()
-        if items:
+        if item_repo.exists([("label_id", "==", self.id)]):
             raise ValueError("Cannot delete label with associated items.")
         
-        _batch = batch if batch else firestore_wrapper.create_batch()
+        _batch = batch if batch is not None else firestore_wrapper.create_batch()
         
         stash = self.get_stash()
         if stash:
-            stash.label_ids.remove(self.id)
-            stash_repo.batch_update(_batch, stash)
+            stash_repo.batch_array_remove(_batch, stash.id, "label_ids", self.id)
 
             event = Event(
                 stash_id=stash.id,
@@ -386,6 +522,7 @@ class Label(BaseDocument):
             )
             event_repo.batch_add(_batch, event)
             
+        consumption_rate_repo.batch_delete(_batch, self.id)
         label_repo.batch_delete(_batch, self.id)
 
         return _batch
@@ -465,24 +602,15 @@ class Item(BaseDocument):
         if item_repo.get(self.id) is None:
             raise ValueError("Item does not exist.")
 
-        _batch = batch if batch else firestore_wrapper.create_batch()
+        _batch = batch if batch is not None else firestore_wrapper.create_batch()
 
-        label = self.get_label()
-        if label:
-            if self.id in label.item_ids:
-                label.item_ids.remove(self.id)
-                label_repo.batch_update(_batch, label)
-                
-        storage = self.get_storage()
-        if storage:
-            if self.id in storage.item_ids:
-                storage.item_ids.remove(self.id)
-                storage_repo.batch_update(_batch, storage)
+        # Labels and storages cannot be deleted while they hold items, so both parents exist
+        label_repo.batch_array_remove(_batch, self.label_id, "item_ids", self.id)
+        storage_repo.batch_array_remove(_batch, self.storage_id, "item_ids", self.id)
                 
         order = self.get_order()
         if order:
-            order.item_ids.remove(self.id)
-            order_repo.batch_update(_batch, order)
+            order_repo.batch_array_remove(_batch, order.id, "item_ids", self.id)
             
         stash = self.get_stash()
         if stash:
@@ -500,10 +628,15 @@ class Item(BaseDocument):
         return _batch
 
 # === Order ===
+class OrderStatus(str, Enum):
+    SKIPPED = "skipped"
+    COMPLETED = "completed"
+    IN_PROGRESS = "in_progress"
+
 class Order(BaseDocument):
     stash_id: str
     buyer_member_id: Optional[str] = None
-    status: dict[str, 'OrderStatus'] = Field(default_factory=dict) # {attribute: OrderStatus}
+    status: dict[str, OrderStatus] = Field(default_factory=dict) # {attribute: OrderStatus}
     item_ids: List[str] = Field(default_factory=list)
     
     def get_stash(self) -> Optional[Stash]:
@@ -534,7 +667,7 @@ class Order(BaseDocument):
         if order_repo.get(self.id) is None:
             raise ValueError("Order does not exist.")
 
-        _batch = batch if batch else firestore_wrapper.create_batch()
+        _batch = batch if batch is not None else firestore_wrapper.create_batch()
 
         items = self.get_items()
         for item in items:
@@ -556,18 +689,37 @@ class Order(BaseDocument):
 
         return _batch
 
-class OrderStatus(str, Enum):
-    SKIPPED = "skipped"
-    COMPLETED = "completed"
-    IN_PROGRESS = "in_progress"
-
 # === Event ===
+class EventType(str, Enum):
+    SUCCESS = "success"
+    INFO = "info"
+    WARNING = "warning"
+    DANGER = "danger"
+
+def month_start(moment: datetime) -> datetime:
+    return moment.astimezone(timezone.utc).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+def previous_month(month: datetime) -> datetime:
+    return month_start(month - timedelta(days=1))
+
 class Event(BaseDocument):
     stash_id: str
     member_id: str
-    type: 'EventType'
+    type: EventType
     title: str
     message: Optional[str] = ""
+    target_id: Optional[str] = None  # the document the event is about, for update events
+    changes: Dict[str, Dict[str, Any]] = Field(default_factory=dict)  # compact diff by changed path, for update events
+
+    @staticmethod
+    def partition_for(stash_id: str, moment: datetime) -> str:
+        return f"{stash_id}_{month_start(moment):%Y%m}"
+
+    @computed_field
+    @property
+    def partition(self) -> str:
+        # Stored with the event so reads can range-scan one stash-month at a time
+        return Event.partition_for(self.stash_id, self.created_at)
 
     def get_stash(self) -> Optional[Stash]:
         from backend.database.repos import stash_repo
@@ -583,23 +735,65 @@ class Event(BaseDocument):
         from backend.database.firestore_wrapper import firestore_wrapper
         from backend.database.repos import event_repo
         
-        _batch = batch if batch else firestore_wrapper.create_batch()
+        _batch = batch if batch is not None else firestore_wrapper.create_batch()
 
         event_repo.batch_delete(_batch, self.id)
         
         return _batch
 
-class EventType(str, Enum):
-    SUCCESS = "success"
-    INFO = "info"
-    WARNING = "warning"
-    DANGER = "danger"
-
-User.model_rebuild()
-Member.model_rebuild()
-Stash.model_rebuild()
-Storage.model_rebuild()
-Label.model_rebuild()
-Item.model_rebuild()
-Order.model_rebuild()
-Event.model_rebuild()
\ No newline at end of file
+class EventDigest(BaseDocument):
+    # Compacted summary of one stash's events in one period. The id is derived from the period,
+    # so compacting more events of the same period adds to the same digest.
+    stash_id: str
+    period: RollupPeriod
+    period_start: datetime
+    period_end: datetime
+    count: int = 0
+    counts_by_type: Dict[str, int] = Field(default_factory=dict)
+    counts_by_member: Dict[str, int] = Field(default_factory=dict)
+
+    @staticmethod
+    def id_for(stash_id: str, period: RollupPeriod, period_start: datetime) -> str:
+        return f"{stash_id}_{period.value}_{period_start:%Y%m%d}"
+
+# === Consumption ===
+CONSUMPTION_HALF_LIFE_DAYS = 14.0  # weight of past consumption halves every this many days
+MIN_CONSUMPTION_INTERVAL_DAYS = 1 / 24  # shorter gaps between uses count as this long
+
+def _days(delta: timedelta) -> float:
+    return max(0.0, delta.total_seconds() / 86400)
+
+def _decay(days: float) -> float:
+    return 0.5 ** (days / CONSUMPTION_HALF_LIFE_DAYS)
+
+class ConsumptionRate(BaseDocument):
+    # How fast a label's items are used up, kept as exponentially decayed totals so each use is
+    # folded in with one write. The id is the label id; quantities are in `unit`.
+    stash_id: str
+    unit: Optional[str] = None
+    weighted_quantity: float = 0.0
+    weighted_days: float = 0.0
+    last_consumed_at: Optional[datetime] = None
+    samples: int = 0
+
+    def record(self, quantity: float, since: datetime, at: datetime) -> None:
+        """
+        Folds in `quantity` used up at `at`. `since` is when it was last known to be unused,
+        for the first use of the label.
+        """
+        elapsed = max(MIN_CONSUMPTION_INTERVAL_DAYS, _days(at - (self.last_consumed_at or since)))
+        decay = _decay(elapsed)
+        self.weighted_quantity = self.weighted_quantity * decay + quantity
+        self.weighted_days = self.weighted_days * decay + elapsed
+        self.last_consumed_at = max(at, self.last_consumed_at or at)
+        self.samples += 1
+
+    def daily_rate(self, now: datetime) -> float:
+        """
+        Units used per day as of `now`. Time since the last use counts as days without any.
+        """
+        if self.last_consumed_at is None or self.weighted_days <= 0:
+            return 0.0
+        idle = _days(now - self.last_consumed_at)
+        decay = _decay(idle)
+        return self.weighted_quantity * decay / (self.weighted_days * decay + idle)
@@ -0,0 +1,164 @@
+import os
+import math
+import time
+import asyncio
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from fastapi import HTTPException, Request
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from backend.routes._responses import ModelResponse
+
+# === Config ===
+DEFAULT_MAX_CONCURRENCY = int(os.environ.get("MAX_CONCURRENT_REQUESTS", "64"))
+DEFAULT_MAX_QUEUE_SECONDS = float(os.environ.get("MAX_QUEUE_SECONDS", "2.0"))
+MAX_BUCKETS = 50000  # least recently used buckets beyond this are dropped (an idle bucket is full anyway)
+READ_METHODS = frozenset({"GET", "HEAD", "OPTIONS"})
+ADMISSION_SCOPE_KEY = "stasher.admission"  # the middleware admitting the request, for work that needs more slots
+
+
+
+# === === Rate Limits === ===
+
+class RateLimit(NamedTuple):
+    per_second: float
+    burst: int
+
+class RouteLimits(NamedTuple):
+    read: RateLimit
+    write: RateLimit
+
+class RouteGroup(NamedTuple):
+    """
+    Routes whose path equals one of `prefixes` or continues it with '/' share a set of buckets.
+    """
+    name: str
+    prefixes: Tuple[str, ...]
+    limits: RouteLimits
+
+    def matches(self, path: str) -> bool:
+        return any(path == prefix or path.startswith(prefix + "/") for prefix in self.prefixes)
+
+
+class TokenBucket:
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, limit: RateLimit, now: float):
+        self.rate = limit.per_second
+        self.capacity = float(limit.burst)
+        self.tokens = self.capacity
+        self.updated = now
+
+    def take(self, now: float) -> float:
+        """
+        Takes one token. Returns 0 if one was available, else the seconds until one will be.
+        """
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class RateLimiter:
+    """
+    Router dependency that applies per-client token buckets, with separate read and write
+    buckets for each route group. Runs before the route's own dependencies, so a rejected
+    request never reaches Firestore. Raises 429 with Retry-After.
+    `key_func` identifies the client, e.g. the user id from the access token.
+    """
+
+    def __init__(self, key_func: Callable[[Request], str], default: RouteLimits, groups: Iterable[RouteGroup] = ()):
+        self._key_func = key_func
+        self._default = RouteGroup("default", (), default)
+        self._groups: List[RouteGroup] = list(groups)
+        self._group_by_path: Dict[str, RouteGroup] = {}
+        self._buckets: "OrderedDict[Tuple[str, str, str], TokenBucket]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def group_for(self, path: str) -> RouteGroup:
+        if (group := self._group_by_path.get(path)) is None:
+            group = next((group for group in self._groups if group.matches(path)), self._default)
+            self._group_by_path[path] = group
+        return group
+
+    async def __call__(self, request: Request) -> None:
+        route = request.scope.get("route")
+        group = self.group_for(getattr(route, "path", request.url.path))
+        kind = "read" if request.method in READ_METHODS else "write"
+        key = (self._key_func(request), group.name, kind)
+
+        now = time.monotonic()
+        with self._lock:
+            if (bucket := self._buckets.get(key)) is None:
+                bucket = self._buckets[key] = TokenBucket(getattr(group.limits, kind), now)
+            else:
+                self._buckets.move_to_end(key)
+            wait = bucket.take(now)
+            while len(self._buckets) > MAX_BUCKETS:
+                self._buckets.popitem(last=False)
+
+        if wait:
+            raise HTTPException(
+                status_code=429,
+                detail="Too many requests, slow down.",
+                headers={"Retry-After": str(max(1, math.ceil(wait)))},
+            )
+
+
+
+# === === Load Shedding === ===
+
+class AdmissionMiddleware:
+    """
+    Caps how many requests are handled at once. A request that cannot get a slot within
+    `max_queue_seconds` is shed with 503 and Retry-After instead of piling up behind the others.
+    """
+
+    def __init__(self, app: ASGIApp, max_concurrency: int = DEFAULT_MAX_CONCURRENCY, max_queue_seconds: float = DEFAULT_MAX_QUEUE_SECONDS):
+        self.app = app
+        self._max_concurrency = max_concurrency
+        self._max_queue_seconds = max_queue_seconds
+        self._slots: Optional[asyncio.Semaphore] = None  # created in the server's event loop
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        if not await self.acquire():
+            await self.busy_response()(scope, receive, send)
+            return
+
+        scope[ADMISSION_SCOPE_KEY] = self
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.release()
+
+    async def acquire(self) -> bool:
+        """
+        Takes a slot, waiting up to `max_queue_seconds`. False if none came free in time.
+        """
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self._max_concurrency)
+        try:
+            # Unlike wait_for, a timeout here never lands after acquire() succeeded, so no slot leaks
+            async with asyncio.timeout(self._max_queue_seconds):
+                await self._slots.acquire()
+        except TimeoutError:
+            return False
+        return True
+
+    def release(self) -> None:
+        self._slots.release()
+
+    def busy_response(self) -> ModelResponse:
+        return ModelResponse(
+            {"detail": "Server is busy, try again shortly."},
+            status_code=503,
+            headers={"Retry-After": str(max(1, math.ceil(self._max_queue_seconds)))},
+        )
@@ -0,0 +1,327 @@
+import os
+import zlib
+import asyncio
+import threading
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Dict, Iterator, List, NamedTuple, Optional, Set, Tuple, Type
+
+import orjson
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+from pydantic import ValidationError
+
+from backend.models import BaseDocument, User, Stash, JoinCode, Member, Storage, Label, Item, Order, Event, EventDigest, ConsumptionRate
+from backend.database.firestore_wrapper import firestore_wrapper
+from backend.database.repos import (
+    BaseRepo, user_repo, stash_repo, join_code_repo, member_repo, storage_repo, label_repo, item_repo, order_repo,
+    consumption_rate_repo, event_digest_repo, event_repo, MAX_IN_VALUES, WRITE_CHUNK,
+)
+from backend.routes._imports import read_lines
+from backend.routes._schemas import StashRestoreResult
+
+# === Config ===
+FORMAT_VERSION = 1
+PAGE_SIZE = 500  # documents per export read
+MAX_PARALLEL_BATCHES = int(os.environ.get("RESTORE_PARALLEL_BATCHES", "4"))
+MAX_RECORD_CHARS = 4 * 1024 * 1024  # a stash or label with many ids makes for a long line
+MAX_REPORTED_ERRORS = 100
+FLUSH_BYTES = 64 * 1024  # export output is sent in pieces of about this size
+INFLATE_STEP = 1024 * 1024  # most bytes one gzip chunk may expand to at once
+
+
+class _Collection(NamedTuple):
+    name: str
+    repo: BaseRepo
+    model: Type[BaseDocument]
+    owner_field: str  # what ties a document to the stash: its stash id, or its label for items
+
+# Export order, which restore relies on: the stash and its members come first so access can be
+# checked before anything is written, and labels come before the items that point to them.
+COLLECTIONS: List[_Collection] = [
+    _Collection("stashes", stash_repo, Stash, "id"),
+    _Collection("join_codes", join_code_repo, JoinCode, "stash_id"),
+    _Collection("members", member_repo, Member, "stash_id"),
+    _Collection("storages", storage_repo, Storage, "stash_id"),
+    _Collection("labels", label_repo, Label, "stash_id"),
+    _Collection("items", item_repo, Item, "label_id"),
+    _Collection("orders", order_repo, Order, "stash_id"),
+    _Collection("consumption_rates", consumption_rate_repo, ConsumptionRate, "stash_id"),
+    _Collection("event_digests", event_digest_repo, EventDigest, "stash_id"),
+    _Collection("events", event_repo, Event, "stash_id"),
+]
+_POSITION = {collection.name: position for position, collection in enumerate(COLLECTIONS)}
+_ACCESS_CHECKED_AFTER = _POSITION["members"]
+
+
+
+# === === Export === ===
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+def _documents(stash: Stash) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    label_ids: List[str] = []
+    for collection in COLLECTIONS:
+        if collection.name == "items":
+            pages = (item_repo.stream_raw([("label_id", "in", label_ids[start:start + MAX_IN_VALUES])], PAGE_SIZE) for start in range(0, len(label_ids), MAX_IN_VALUES))
+        else:
+            pages = iter([collection.repo.stream_raw([("id" if collection.name == "stashes" else "stash_id", "==", stash.id)], PAGE_SIZE)])
+        for page in pages:
+            for data in page:
+                if collection.name == "labels":
+                    label_ids.append(data["id"])
+                yield collection.name, data
+
+def export_stash(stash: Stash, compress: bool = False) -> Iterator[bytes]:
+    """
+    Every document of the stash as NDJSON: a header record, one `{"collection", "data"}` record per
+    document with its stored data, and an end record with the count per collection. Documents are
+    read a page at a time and sent as they are read, so memory does not grow with the stash.
+    """
+    counts: Dict[str, int] = {}
+    compressor = zlib.compressobj(wbits=31) if compress else None
+
+    def records() -> Iterator[Dict[str, Any]]:
+        yield {"kind": "header", "version": FORMAT_VERSION, "stash_id": stash.id, "exported_at": datetime.now(timezone.utc)}
+        for name, data in _documents(stash):
+            counts[name] = counts.get(name, 0) + 1
+            yield {"collection": name, "data": data}
+        yield {"kind": "end", "counts": counts}
+
+    buffer = bytearray()
+    for record in records():
+        buffer += orjson.dumps(record, default=_json_default) + b"\n"
+        if len(buffer) >= FLUSH_BYTES:
+            yield compressor.compress(bytes(buffer)) if compressor else bytes(buffer)
+            buffer.clear()
+    yield compressor.compress(bytes(buffer)) + compressor.flush() if compressor else bytes(buffer)
+
+
+
+# === === Restore === ===
+
+async def _inflate(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    # Gzip is recognized by its magic bytes, so plain and compressed backups are both accepted
+    decompressor = None
+    head = b""
+    try:
+        async for chunk in chunks:
+            if decompressor is None and head is not None:
+                head += chunk
+                if len(head) < 2:
+                    continue
+                chunk, head = head, None
+                if chunk[:2] == b"\x1f\x8b":
+                    decompressor = zlib.decompressobj(wbits=31)
+            if decompressor is None:
+                yield chunk
+                continue
+            yield decompressor.decompress(chunk, INFLATE_STEP)
+            while decompressor.unconsumed_tail:
+                yield decompressor.decompress(decompressor.unconsumed_tail, INFLATE_STEP)
+    except zlib.error:
+        raise HTTPException(status_code=400, detail="Backup is not valid gzip.")
+    if head:
+        yield head
+
+
+class StashRestorer:
+    """
+    Writes a backup made by export_stash back, keeping every document's id and timestamps, so
+    restoring the same backup again leaves the same state. Records are validated against their model;
+    records of another stash, and ids that another stash already uses, are skipped.
+
+    Documents are written in batches of WRITE_CHUNK, up to MAX_PARALLEL_BATCHES committing at once;
+    memory holds only those batches. Nothing is written until the caller is known to be an admin of
+    the stash, or, for a stash that no longer exists, an admin in the backup.
+    Memberships are only restored active, and linked to their users, for the caller and for users
+    who already belong to the stash; anyone else's are restored inactive, so a backup cannot add
+    people to a stash without a join code.
+    """
+
+    def __init__(self, user: User):
+        self._user = user
+        self._result = StashRestoreResult(stash_id="")
+        self._lock = threading.Lock()  # guards _result, which batches update from worker threads
+        self._position = 0
+        self._label_ids: Set[str] = set()
+        self._held: Optional[List[Tuple[_Collection, BaseDocument]]] = []  # records read before access was checked; None after
+        self._owners: Dict[str, str] = {}  # restored active member id -> user id
+        self._trusted_user_ids: Set[str] = {user.id}  # users whose memberships may be restored active
+        self._events_since: Optional[datetime] = None  # created_at of the oldest restored event
+        self._chunk: List[Tuple[_Collection, BaseDocument]] = []
+        self._writes: Set[asyncio.Future] = set()
+
+    def _error(self, message: str, skipped: int = 1) -> None:
+        with self._lock:
+            self._result.skipped += skipped
+            if len(self._result.errors) < MAX_REPORTED_ERRORS:
+                self._result.errors.append(message)
+
+    def _read(self, line_number: int, record: Any) -> Optional[Tuple[_Collection, BaseDocument]]:
+        if not isinstance(record, dict) or (name := record.get("collection")) not in _POSITION or not isinstance(record.get("data"), dict):
+            self._error(f"Line {line_number}: not a document record.")
+            return None
+        if _POSITION[name] < self._position:
+            raise HTTPException(status_code=400, detail=f"Line {line_number}: '{name}' records must come before '{COLLECTIONS[self._position].name}' records.")
+        self._position = _POSITION[name]
+        collection = COLLECTIONS[self._position]
+
+        try:
+            document = collection.model.model_validate(record["data"])
+        except ValidationError as e:
+            self._error(f"Line {line_number}: invalid {name} record ({e.error_count()} errors).")
+            return None
+
+        owner = getattr(document, collection.owner_field)
+        if (owner not in self._label_ids) if name == "items" else (owner != self._result.stash_id):
+            self._error(f"Line {line_number}: {name} record '{document.id}' does not belong to the stash.")
+            return None
+        if name == "labels":
+            self._label_ids.add(document.id)
+        return collection, document
+
+    def _check_access(self) -> None:
+        stash_id = self._result.stash_id
+        if stash_repo.get(stash_id, fresh=True) is not None:
+            members = member_repo.query([("owner_user_id", "==", self._user.id), ("stash_id", "==", stash_id), ("is_active", "==", True)])
+            allowed = any(member.is_admin for member in members)
+            current = member_repo.query([("stash_id", "==", stash_id), ("is_active", "==", True)], fields=["id", "owner_user_id"])
+            self._trusted_user_ids.update(member.owner_user_id for member in current if member.owner_user_id)
+        elif not any(collection.name == "stashes" for collection, _ in self._held):
+            raise HTTPException(status_code=400, detail="Backup has no stash record.")
+        else:
+            allowed = any(
+                collection.name == "members" and document.owner_user_id == self._user.id and document.is_admin and document.is_active
+                for collection, document in self._held
+            )
+        if not allowed:
+            raise HTTPException(status_code=403, detail="Only admins can restore the stash.")
+
+    def _write(self, chunk: List[Tuple[_Collection, BaseDocument]]) -> None:
+        kept: List[Tuple[_Collection, BaseDocument]] = []
+        by_collection: Dict[str, List[BaseDocument]] = {}
+        for collection, document in chunk:
+            by_collection.setdefault(collection.name, []).append(document)
+        for name, documents in by_collection.items():
+            collection = COLLECTIONS[_POSITION[name]]
+            existing = collection.repo.get_fields([document.id for document in documents], [collection.owner_field]) if name != "stashes" else {}
+            for document in documents:
+                if (data := existing.get(document.id)) is not None and data.get(collection.owner_field) != getattr(document, collection.owner_field):
+                    self._error(f"{name} '{document.id}' is already used by another stash.")
+                    continue
+                if name == "members" and document.is_active and document.owner_user_id not in self._trusted_user_ids:
+                    document = document.model_copy(update={"is_active": False})
+                kept.append((collection, document))
+
+        batch = firestore_wrapper.create_batch()
+        for collection, document in kept:
+            collection.repo.batch_restore(batch, document)
+        committed = firestore_wrapper.commit_batch(batch) if kept else True
+        with self._lock:
+            for collection, document in kept:
+                if not committed:
+                    self._result.failed += 1
+                    continue
+                self._result.restored[collection.name] = self._result.restored.get(collection.name, 0) + 1
+                if collection.name == "members" and document.owner_user_id and document.is_active:
+                    self._owners[document.id] = document.owner_user_id
+                if collection.name == "events" and (self._events_since is None or document.created_at < self._events_since):
+                    self._events_since = document.created_at
+
+    async def _queue(self, entry: Tuple[_Collection, BaseDocument]) -> None:
+        self._chunk.append(entry)
+        if len(self._chunk) >= WRITE_CHUNK:
+            await self._submit()
+
+    async def _submit(self) -> None:
+        if not self._chunk:
+            return
+        chunk, self._chunk = self._chunk, []
+        while len(self._writes) >= MAX_PARALLEL_BATCHES:
+            done, self._writes = await asyncio.wait(self._writes, return_when=asyncio.FIRST_COMPLETED)
+            for write in done:
+                write.result()
+        self._writes.add(asyncio.ensure_future(run_in_threadpool(self._write, chunk)))
+
+    async def _release_held(self) -> None:
+        await run_in_threadpool(self._check_access)
+        held, self._held = self._held, []
+        for entry in held:
+            await self._queue(entry)
+        self._held = None
+
+    def _link_users(self) -> None:
+        # Users are not part of a backup; the ones that exist get their restored memberships back
+        users = user_repo.get_fields(self._owners.values(), ["id"])
+        links = [(user_id, member_id) for member_id, user_id in self._owners.items() if user_id in users]
+        for start in range(0, len(links), WRITE_CHUNK):
+            batch = firestore_wrapper.create_batch()
+            for user_id, member_id in links[start:start + WRITE_CHUNK]:
+                user_repo.batch_array_union(batch, user_id, "member_ids", member_id)
+            if not firestore_wrapper.commit_batch(batch):
+                self._error("Linking restored members to their users failed; restoring again retries it.", skipped=0)
+
+    def _extend_event_range(self) -> None:
+        # Restored events can be older than the stash record; event scans stop at the stash's events_start
+        stash = stash_repo.get(self._result.stash_id, fresh=True)
+        if stash is None or self._events_since >= (stash.events_since or stash.created_at):
+            return
+        stash.events_since = self._events_since
+        if stash_repo.update(stash) is None:
+            self._error("Recording the restored events' dates failed; restoring again retries it.", skipped=0)
+
+    async def run(self, chunks: AsyncIterator[bytes]) -> StashRestoreResult:
+        lines = read_lines(_inflate(chunks), MAX_RECORD_CHARS)
+        line_number = 0
+        try:
+            async for line in lines:
+                line_number += 1
+                if not line.strip():
+                    continue
+                try:
+                    record = orjson.loads(line)
+                except orjson.JSONDecodeError:
+                    if not self._result.stash_id:
+                        raise HTTPException(status_code=400, detail="Backup must start with a header record.")
+                    self._error(f"Line {line_number}: not valid JSON.")
+                    continue
+
+                if not self._result.stash_id:
+                    if not isinstance(record, dict) or record.get("kind") != "header" or not record.get("stash_id"):
+                        raise HTTPException(status_code=400, detail="Backup must start with a header record.")
+                    if record.get("version") != FORMAT_VERSION:
+                        raise HTTPException(status_code=400, detail=f"Unsupported backup version {record.get('version')}.")
+                    self._result.stash_id = str(record["stash_id"])
+                    continue
+                if isinstance(record, dict) and record.get("kind") == "end":
+                    self._result.complete = True
+                    break
+
+                if (entry := self._read(line_number, record)) is None:
+                    continue
+                if self._held is not None and self._position > _ACCESS_CHECKED_AFTER:
+                    await self._release_held()
+                if self._held is not None:
+                    self._held.append(entry)
+                else:
+                    await self._queue(entry)
+
+            if not self._result.stash_id:
+                raise HTTPException(status_code=400, detail="Backup must start with a header record.")
+            if self._held is not None:
+                await self._release_held()
+            await self._submit()
+        finally:
+            if self._writes:
+                await asyncio.wait(self._writes)
+        for write in self._writes:
+            write.result()
+
+        if self._owners:
+            await run_in_threadpool(self._link_users)
+        if self._events_since is not None:
+            await run_in_threadpool(self._extend_event_range)
+        return self._result
@@ -0,0 +1,167 @@
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import unquote
+
+import orjson
+from fastapi import Request
+from fastapi.concurrency import run_in_threadpool
+from starlette.exceptions import HTTPException as StarletteHTTPException
+from starlette.types import ASGIApp, Message, Scope
+
+from backend.models import User
+from backend.database.repos import user_repo
+from backend.routes.auth_routes import SHARED_USER_SCOPE_KEY
+from backend.routes._admission import ADMISSION_SCOPE_KEY
+from backend.routes._responses import ModelResponse
+from backend.routes._schemas import BatchRequest
+
+# === Config ===
+MAX_BATCH_REQUESTS = 20
+MAX_CONCURRENT_SUBREQUESTS = 8
+BATCH_PATH = "/batch"
+BATCH_METHODS = frozenset({"GET", "POST", "PATCH", "DELETE"})
+CONCURRENT_METHODS = frozenset({"GET"})  # only reads may overlap; writes run alone, in order
+FORWARDED_HEADERS = frozenset({b"cookie", b"user-agent"})
+
+_logger = logging.getLogger(__name__)
+
+_Result = Tuple[int, bytes]  # (status, JSON body)
+
+
+def _detail(status: int, detail: Any) -> _Result:
+    return status, orjson.dumps({"detail": detail})
+
+
+
+# === === Dispatch === ===
+
+class BatchDispatcher:
+    """
+    Runs a batch's sub-requests against a router in-process, as if each had been sent on its own:
+    same routes, dependencies, rate limits and error responses, minus the HTTP round trip.
+    The user resolved for the batch is handed to every sub-request, so the token is checked once,
+    and read again after each write in case the write changed it.
+    Consecutive reads run concurrently; a write waits for everything before it and blocks what follows.
+    Sub-requests run in the batch's own admission slot, one at a time; reads that overlap it take
+    further slots, so a batch counts towards load shedding like the requests it replaces. A read that
+    gets no slot in time waits for the batch's slot instead of failing, so a batch never sheds itself.
+    """
+
+    def __init__(self, max_concurrency: int = MAX_CONCURRENT_SUBREQUESTS):
+        self._max_concurrency = max_concurrency
+
+    async def run(self, app: ASGIApp, request: Request, requests: List[BatchRequest], user: User) -> ModelResponse:
+        slots = asyncio.Semaphore(self._max_concurrency)
+        admission = request.scope.get(ADMISSION_SCOPE_KEY)
+        own_slot = asyncio.Lock()  # the slot the batch was admitted with
+        results: List[Optional[_Result]] = [None] * len(requests)
+        current: Optional[User] = user
+
+        async def dispatch(index: int) -> None:
+            async with slots:
+                if admission is None:
+                    results[index] = await self._dispatch(app, request, requests[index], current)
+                elif own_slot.locked() and await admission.acquire():
+                    try:
+                        results[index] = await self._dispatch(app, request, requests[index], current)
+                    finally:
+                        admission.release()
+                else:
+                    async with own_slot:
+                        results[index] = await self._dispatch(app, request, requests[index], current)
+
+        reads: List[int] = []
+        for index, sub in enumerate(requests):
+            if sub.method.upper() in CONCURRENT_METHODS:
+                reads.append(index)
+                continue
+            await asyncio.gather(*(dispatch(read) for read in reads))
+            reads = []
+            await dispatch(index)
+            current = await run_in_threadpool(user_repo.get, user.id, fresh=True)
+        await asyncio.gather(*(dispatch(read) for read in reads))
+
+        # Sub-responses are already JSON, so they are spliced in rather than parsed and encoded again
+        body = b",".join(b'{"status":%d,"body":%s}' % result for result in results)
+        return ModelResponse(b"[" + body + b"]")
+
+    async def _dispatch(self, app: ASGIApp, request: Request, sub: BatchRequest, user: Optional[User]) -> _Result:
+        method = sub.method.upper()
+        path, _, query = sub.path.partition("?")
+        if method not in BATCH_METHODS:
+            return _detail(405, f"Method '{sub.method}' is not allowed in a batch.")
+        if not path.startswith("/"):
+            return _detail(400, "Path must start with '/'.")
+        if path.rstrip("/") == BATCH_PATH:
+            return _detail(400, "Batches cannot be nested.")
+
+        body = orjson.dumps(sub.body) if sub.body is not None else b""
+        scope = self._scope(request.scope, method, path, query, body, user)
+        status, content_type, chunks = 500, b"", []
+        received = False
+
+        async def receive() -> Message:
+            nonlocal received
+            if not received:
+                received = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return await request.receive()  # the batch's own client disconnecting
+
+        async def send(message: Message) -> None:
+            nonlocal status, content_type
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                content_type = next((value for key, value in message.get("headers", []) if key.lower() == b"content-type"), b"")
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+
+        try:
+            await app(scope, receive, send)
+        except StarletteHTTPException as e:
+            # Raised outside a route's own error handling, e.g. no route matches
+            return _detail(e.status_code, e.detail)
+        except Exception:
+            _logger.exception("Batched %s %s failed", method, path)
+            return _detail(500, "Internal Server Error")
+
+        content = b"".join(chunks)
+        if not content:
+            return status, b"null"
+        if not content_type.startswith(b"application/json"):
+            return _detail(406, f"{content_type.decode('latin-1') or 'This response'} cannot be embedded in a batch.")
+        return status, content
+
+    @staticmethod
+    def _scope(parent: Scope, method: str, path: str, query: str, body: bytes, user: Optional[User]) -> Scope:
+        headers = [(key, value) for key, value in parent["headers"] if key in FORWARDED_HEADERS]
+        headers.append((b"accept", b"application/json"))
+        if body:
+            headers += [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+        scope: Dict[str, Any] = {
+            "type": "http",
+            "asgi": parent.get("asgi", {"version": "3.0"}),
+            "http_version": parent.get("http_version", "1.1"),
+            "method": method,
+            "scheme": parent.get("scheme", "http"),
+            "path": unquote(path),
+            "raw_path": path.encode(),
+            "query_string": query.encode(),
+            "root_path": parent.get("root_path", ""),
+            "headers": headers,
+            "client": parent.get("client"),
+            "server": parent.get("server"),
+            "state": dict(parent.get("state", {})),
+            "app": parent.get("app"),
+        }
+        if user is not None:
+            # A user deleted by an earlier write is looked up from the token again, and not found
+            scope[SHARED_USER_SCOPE_KEY] = user
+        if "starlette.exception_handlers" in parent:
+            # Lets HTTPExceptions and validation errors become the usual error responses
+            scope["starlette.exception_handlers"] = parent["starlette.exception_handlers"]
+        return scope
+
+
+# Global importable instance
+batch_dispatcher = BatchDispatcher()
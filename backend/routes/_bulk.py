@@ -0,0 +1,205 @@
+from collections import Counter
+from typing import Callable, Dict, List, NamedTuple, Optional, Set, Tuple
+
+from fastapi import HTTPException
+
+from backend.models import Member, Item, Order, Event, EventType
+from backend.database.firestore_wrapper import firestore_wrapper, TransactionConflict
+from backend.database.repos import label_repo, storage_repo, item_repo, order_repo, event_repo, MAX_IN_VALUES, WRITE_CHUNK
+from backend.routes._restock import batch_record_consumption
+from backend.routes._schemas import ItemBulkAction, ItemBulkOperation, ItemBulkOperationResult, ItemBulkResult
+
+# === Config ===
+MAX_OPERATIONS = 500
+DONE = {ItemBulkAction.MOVE: "moved", ItemBulkAction.CONSUME: "consumed", ItemBulkAction.DELETE: "deleted"}
+
+
+class _Planned(NamedTuple):
+    index: int
+    operation: ItemBulkOperation
+    stash_id: str
+
+
+class _Outcome(NamedTuple):
+    index: int
+    status: int
+    error: Optional[str]
+    item: Optional[Item]
+
+
+def _apply(batch, chunk: List[_Planned]) -> List[_Outcome]:
+    """
+    Queues the writes of as many operations from the start of `chunk` as fit in WRITE_CHUNK writes,
+    reading their items fresh, and returns their outcomes; the rest are left for the next batch.
+    Item writes and deletes only land if the items are unchanged.
+    """
+    items = item_repo.get_many(planned.operation.item_id for planned in chunk)
+    deletes = [planned.operation.item_id for planned in chunk if planned.operation.action == ItemBulkAction.DELETE]
+    orders_of: Dict[str, List[Order]] = {}  # item id -> orders listing it
+    for start in range(0, len(deletes), MAX_IN_VALUES):
+        ids = deletes[start:start + MAX_IN_VALUES]
+        for order in order_repo.query([("item_ids", "array_contains_any", ids)], fields=["id", "item_ids"]):
+            for item_id in order.item_ids:
+                orders_of.setdefault(item_id, []).append(order)
+
+    outcomes: List[_Outcome] = []
+    writes: Set[Tuple[str, ...]] = set()  # one entry per document write queued
+    array_removes: Dict[Tuple[str, str], List[str]] = {}  # (collection, doc id) -> item ids
+    array_unions: Dict[str, List[str]] = {}  # storage id -> item ids
+    order_removes: Dict[str, List[str]] = {}  # order id -> item ids
+    uses: Dict[str, List[Tuple[Item, float]]] = {}  # label id -> (item, used)
+    stash_of_label: Dict[str, str] = {}
+
+    for planned in chunk:
+        operation = planned.operation
+        if (item := items.get(operation.item_id)) is None:
+            outcomes.append(_Outcome(planned.index, 404, "Item not found.", None))
+            continue
+
+        if operation.action == ItemBulkAction.DELETE:
+            orders = [order for order in orders_of.get(item.id, ()) if item.id in order.item_ids]
+            needed = {("items", item.id), ("remove", "labels", item.label_id), ("remove", "storages", item.storage_id)}
+            needed.update(("orders", order.id) for order in orders)
+            if outcomes and len(writes | needed) > WRITE_CHUNK:
+                break
+            writes |= needed
+            item_repo.batch_delete(batch, item.id, must_exist=True, unchanged_since=item._update_time)
+            array_removes.setdefault(("labels", item.label_id), []).append(item.id)
+            array_removes.setdefault(("storages", item.storage_id), []).append(item.id)
+            for order in orders:
+                order_removes.setdefault(order.id, []).append(item.id)
+            outcomes.append(_Outcome(planned.index, 200, None, None))
+            continue
+
+        updated = item.model_copy(deep=True)
+        needed = {("items", item.id)}
+        used = 0.0
+        if operation.action == ItemBulkAction.MOVE and operation.storage_id != item.storage_id:
+            updated.storage_id = operation.storage_id
+            needed |= {("remove", "storages", item.storage_id), ("union", "storages", operation.storage_id)}
+        elif operation.action == ItemBulkAction.CONSUME:
+            if operation.quantity is not None and operation.quantity > item.current_quantity:
+                outcomes.append(_Outcome(planned.index, 400, "Consumed quantity is more than the item has left.", None))
+                continue
+            used = operation.quantity if operation.quantity is not None else item.current_quantity
+            if used > 0:
+                updated.current_quantity = item.current_quantity - used
+                needed.add(("rates", item.label_id))
+
+        if not item.diff(updated):
+            outcomes.append(_Outcome(planned.index, 200, None, updated))
+            continue
+        if outcomes and len(writes | needed) > WRITE_CHUNK:
+            break
+        writes |= needed
+        if updated.storage_id != item.storage_id:
+            array_removes.setdefault(("storages", item.storage_id), []).append(item.id)
+            array_unions.setdefault(updated.storage_id, []).append(item.id)
+        if used > 0:
+            uses.setdefault(item.label_id, []).append((item, used))
+            stash_of_label[item.label_id] = planned.stash_id
+        item_repo.batch_update(batch, updated, if_unchanged=True)
+        outcomes.append(_Outcome(planned.index, 200, None, updated))
+
+    for (collection, doc_id), item_ids in array_removes.items():
+        repo = label_repo if collection == "labels" else storage_repo
+        repo.batch_array_remove(batch, doc_id, "item_ids", *item_ids)
+    for storage_id, item_ids in array_unions.items():
+        storage_repo.batch_array_union(batch, storage_id, "item_ids", *item_ids)
+    for order_id, item_ids in order_removes.items():
+        order_repo.batch_array_remove(batch, order_id, "item_ids", *item_ids)
+    for label_id, label_uses in uses.items():
+        batch_record_consumption(batch, label_uses, stash_of_label[label_id])
+    return outcomes
+
+
+def run_item_bulk(operations: List[ItemBulkOperation], member_for: Callable[[str], Member]) -> ItemBulkResult:
+    """
+    Applies move, consume and delete operations to many items. Targets are loaded with one multi-get,
+    access is checked once per stash (`member_for` raises HTTPException without access), and writes are
+    committed in batches of up to WRITE_CHUNK writes, counting the orders a delete removes the item
+    from, followed by one summary event per stash.
+    Each operation gets its own result; a failing operation does not stop the others.
+    """
+    results = [ItemBulkOperationResult(index=index, item_id=operation.item_id) for index, operation in enumerate(operations)]
+
+    def fail(index: int, status: int, error: str) -> None:
+        results[index].status = status
+        results[index].error = error
+
+    seen: Set[str] = set()
+    pending: List[Tuple[int, ItemBulkOperation]] = []
+    for index, operation in enumerate(operations):
+        if operation.item_id in seen:
+            fail(index, 400, "Item is already the target of an earlier operation.")
+        elif operation.action == ItemBulkAction.MOVE and not (operation.storage_id or "").strip():
+            fail(index, 400, "Storage ID is required to move an item.")
+        elif operation.action == ItemBulkAction.CONSUME and operation.quantity is not None and operation.quantity <= 0:
+            fail(index, 400, "Consumed quantity must be positive.")
+        else:
+            pending.append((index, operation))
+        seen.add(operation.item_id)
+
+    items = item_repo.get_many(operation.item_id for _, operation in pending)
+    labels = label_repo.get_many({item.label_id for item in items.values()})
+    storages = storage_repo.get_many({operation.storage_id for _, operation in pending if operation.action == ItemBulkAction.MOVE})
+    members: Dict[str, Optional[Member]] = {}
+
+    planned: List[_Planned] = []
+    for index, operation in pending:
+        if (item := items.get(operation.item_id)) is None:
+            fail(index, 404, "Item not found.")
+            continue
+        if (label := labels.get(item.label_id)) is None:
+            fail(index, 404, "Stash not found.")
+            continue
+        if label.stash_id not in members:
+            try:
+                members[label.stash_id] = member_for(label.stash_id)
+            except HTTPException:
+                members[label.stash_id] = None
+        if members[label.stash_id] is None:
+            fail(index, 403, "You do not have access to this stash.")
+            continue
+        if operation.action == ItemBulkAction.MOVE:
+            if (storage := storages.get(operation.storage_id)) is None:
+                fail(index, 404, "New storage not found.")
+                continue
+            if storage.stash_id != label.stash_id:
+                fail(index, 400, "New storage does not belong to the same stash.")
+                continue
+        planned.append(_Planned(index, operation, label.stash_id))
+
+    done: Counter = Counter()  # (stash id, action) -> operations applied
+    while planned:
+        # No batch fits more than WRITE_CHUNK operations that write, so no more are read for one
+        chunk = planned[:WRITE_CHUNK]
+        try:
+            outcomes = firestore_wrapper.run_optimistic(lambda batch: _apply(batch, chunk), name="item_bulk")
+        except TransactionConflict:
+            outcomes = [_Outcome(entry.index, 409, "Item was changed by someone else, try again.", None) for entry in chunk]
+        if outcomes is None:
+            outcomes = [_Outcome(entry.index, 500, "Saving this operation failed.", None) for entry in chunk]
+        planned = planned[len(outcomes):]
+        for entry, outcome in zip(chunk, outcomes):
+            if outcome.error:
+                fail(outcome.index, outcome.status, outcome.error)
+            else:
+                results[outcome.index].item = outcome.item
+                done[(entry.stash_id, entry.operation.action)] += 1
+
+    if done:
+        batch = firestore_wrapper.create_batch()
+        for stash_id in dict.fromkeys(stash_id for stash_id, _ in done):
+            counts = [f"{done[(stash_id, action)]} {DONE[action]}" for action in ItemBulkAction if done[(stash_id, action)]]
+            event_repo.batch_add(batch, Event(
+                stash_id=stash_id,
+                member_id=members[stash_id].id,
+                type=EventType.SUCCESS,
+                title="Items Updated in Bulk",
+                message=f"Items {', '.join(counts)}.",
+            ))
+        firestore_wrapper.commit_batch(batch)
+
+    failed = sum(1 for result in results if result.error)
+    return ItemBulkResult(succeeded=len(results) - failed, failed=failed, results=results)
@@ -0,0 +1,196 @@
+import os
+import time
+import threading
+from enum import Enum
+from collections import OrderedDict
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from backend.models import Event
+from backend.database.repos import event_repo
+from backend.database.invalidation import Invalidation, invalidation_bus
+
+# === Config ===
+DEFAULT_COALESCE_SECONDS = float(os.environ.get("EVENT_COALESCE_SECONDS", "60"))  # 0 writes every update as its own event
+MAX_BUFFERED = 10000
+MAX_VALUE_CHARS = 120  # longer strings are cut, lists and maps inside values are reduced to their size
+MAX_DELTA_ENTRIES = 20  # list ids or map keys listed per field before the rest is only counted
+
+Changes = Dict[str, Tuple[Any, Any]]
+_Key = Tuple[str, str]  # (member_id, target_id)
+
+
+
+# === === Diffs === ===
+
+def _compact_value(value: Any) -> Any:
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, str) and len(value) > MAX_VALUE_CHARS:
+        return value[:MAX_VALUE_CHARS - 1] + "…"
+    if isinstance(value, (list, dict)):
+        return f"{len(value)} entries"
+    return value
+
+def _list_delta(old: List[Any], new: List[Any]) -> Dict[str, Any]:
+    added = [value for value in new if value not in old]
+    removed = [value for value in old if value not in new]
+    delta: Dict[str, Any] = {
+        "added": [_compact_value(value) for value in added[:MAX_DELTA_ENTRIES]],
+        "removed": [_compact_value(value) for value in removed[:MAX_DELTA_ENTRIES]],
+    }
+    if (more := max(0, len(added) - MAX_DELTA_ENTRIES) + max(0, len(removed) - MAX_DELTA_ENTRIES)):
+        delta["more"] = more
+    return delta
+
+def compact_changes(changes: Changes) -> Dict[str, Dict[str, Any]]:
+    """
+    Structured diff for Event.changes, keyed by changed path:
+    - lists: `{"added": [...], "removed": [...]}`, e.g. ids joined or left
+    - maps: one `"field.key": {"old": ..., "new": ...}` per changed key (None when absent)
+    - anything else: `{"old": ..., "new": ...}`
+    Long values are truncated. Beyond MAX_DELTA_ENTRIES, a field gets `"more": <count not listed>`.
+    """
+    diff: Dict[str, Dict[str, Any]] = {}
+    for field, (old, new) in changes.items():
+        if isinstance(old, list) or isinstance(new, list):
+            diff[field] = _list_delta(old or [], new or [])
+        elif isinstance(old, dict) or isinstance(new, dict):
+            old, new = old or {}, new or {}
+            keys = [key for key in dict.fromkeys([*old, *new]) if old.get(key) != new.get(key)]
+            for key in keys[:MAX_DELTA_ENTRIES]:
+                diff[f"{field}.{key}"] = {"old": _compact_value(old.get(key)), "new": _compact_value(new.get(key))}
+            if len(keys) > MAX_DELTA_ENTRIES:
+                diff[field] = {"more": len(keys) - MAX_DELTA_ENTRIES}
+        else:
+            diff[field] = {"old": _compact_value(old), "new": _compact_value(new)}
+    return diff
+
+def merge_changes(earlier: Changes, later: Changes) -> Changes:
+    """
+    Net effect of two diffs: each field keeps its first old value and its last new value.
+    Fields that ended up back where they started are dropped.
+    """
+    merged = dict(earlier)
+    for field, (old, new) in later.items():
+        first = merged[field][0] if field in merged else old
+        if first == new:
+            merged.pop(field, None)
+        else:
+            merged[field] = (first, new)
+    return merged
+
+def summarize_changes(changes: Changes) -> str:
+    """
+    One-line message for update events; the details are in Event.changes.
+    """
+    return f"Changed {', '.join(changes)}." if changes else ""
+
+
+
+# === === Coalescing === ===
+
+class _Buffered(NamedTuple):
+    key: _Key
+    event: Optional[Event]  # as stored; None once the merged changes cancelled out and the event was deleted
+    changes: Changes
+    expires_at: float
+
+
+class EventCoalescer:
+    """
+    Folds consecutive update events by the same member on the same target, within `window`
+    seconds of the last one, into a single event carrying the merged diff.
+
+    Per process and in memory: the last update event per (member, target) is remembered, and the
+    next update rewrites that event instead of adding one. What is queued on a batch only becomes
+    the remembered event once the invalidation bus reports the event's write, so rolled-back
+    transactions and failed commits leave nothing behind. A write to a remembered event from
+    anywhere else (an edit, a delete, compaction) makes the next update start a new event.
+
+    Writes this process does not hear about are caught by the rewrite's update_time precondition:
+    the commit fails instead of bringing back an event that was deleted, and since a rewrite takes the
+    event out of the buffer until its write is confirmed, the caller's retry starts a new event.
+    """
+
+    def __init__(self, window: float = DEFAULT_COALESCE_SECONDS):
+        self._window = window
+        self._lock = threading.Lock()
+        self._buffered: "OrderedDict[_Key, _Buffered]" = OrderedDict()
+        self._by_event: Dict[str, _Key] = {}
+        self._staged: "OrderedDict[str, _Buffered]" = OrderedDict()  # by event id, waiting for the commit
+        invalidation_bus.subscribe(self._on_invalidate)
+
+    def batch_add(self, batch, event: Event, changes: Changes) -> Event:
+        """
+        Queues `event`, the update of `event.target_id` by `event.member_id` described by `changes`,
+        or an update of the previous such event with the merged changes. Returns the event as queued.
+        """
+        if self._window <= 0 or event.target_id is None:
+            event_repo.batch_add(batch, event)
+            return event
+
+        key = (event.member_id, event.target_id)
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            previous = self._buffered.get(key)
+
+        if previous is None or previous.event is None or previous.event._update_time is None:
+            event_repo.batch_add(batch, event)
+            self._stage(_Buffered(key, event, dict(changes), now + self._window), event.id)
+            return event
+
+        with self._lock:
+            # Until the rewrite is confirmed, another update (or a retry after a failed commit) starts a new event
+            if self._buffered.get(key) is previous:
+                self._forget(key)
+        merged = merge_changes(previous.changes, changes)
+        updated = previous.event.model_copy(deep=True)
+        if not merged:
+            # Back to where the first update started; nothing left to report
+            event_repo.batch_delete(batch, updated.id)
+            self._stage(_Buffered(key, None, merged, now + self._window), updated.id)
+            return updated
+
+        updated.message = summarize_changes(merged)
+        updated.changes = compact_changes(merged)
+        event_repo.batch_update(batch, updated, if_unchanged=True)
+        self._stage(_Buffered(key, updated, merged, now + self._window), updated.id)
+        return updated
+
+    def _stage(self, entry: _Buffered, event_id: str) -> None:
+        if entry.event is not None:
+            # Snapshot as stored, so the next merge writes only the fields it changes
+            stored = entry.event.model_copy(deep=True)
+            stored._mark_loaded()
+            entry = entry._replace(event=stored)
+        with self._lock:
+            self._staged[event_id] = entry
+            self._staged.move_to_end(event_id)
+
+    def _expire(self, now: float) -> None:
+        # Called with the lock held. Staged entries past their window belong to commits that never happened.
+        while self._staged and next(iter(self._staged.values())).expires_at < now:
+            self._staged.popitem(last=False)
+        while self._buffered and (len(self._buffered) > MAX_BUFFERED or next(iter(self._buffered.values())).expires_at < now):
+            _, entry = self._buffered.popitem(last=False)
+            if entry.event is not None:
+                self._by_event.pop(entry.event.id, None)
+
+    def _on_invalidate(self, entries: List[Invalidation]) -> None:
+        with self._lock:
+            for entry in entries:
+                if entry.collection != "events":
+                    continue
+                if (staged := self._staged.pop(entry.doc_id, None)) is not None:
+                    self._forget(staged.key)
+                    if staged.event is not None:
+                        staged.event._mark_loaded(update_time=entry.update_time)
+                        self._buffered[staged.key] = staged
+                        self._by_event[entry.doc_id] = staged.key
+                elif (key := self._by_event.get(entry.doc_id)) is not None:
+                    self._forget(key)
+
+    def _forget(self, key: _Key) -> None:
+        if (entry := self._buffered.pop(key, None)) is not None and entry.event is not None:
+            self._by_event.pop(entry.event.id, None)
@@ -0,0 +1,258 @@
+import os
+import csv
+import codecs
+from typing import Any, AsyncIterator, Dict, List, Optional, Set, Tuple, Union
+
+import orjson
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+from pydantic import ValidationError
+
+from backend.models import Stash, Member, Label, Storage, Item, Event, EventType
+from backend.database.firestore_wrapper import firestore_wrapper
+from backend.database.repos import label_repo, storage_repo, item_repo, event_repo, WRITE_CHUNK
+from backend.routes._schemas import ItemImportRow, ItemImportError, ItemImportResult
+
+# === Config ===
+MAX_IMPORT_ROWS = int(os.environ.get("MAX_IMPORT_ROWS", "5000"))
+MAX_RECORD_CHARS = 64 * 1024  # longest line (or quoted multi-line CSV record) accepted
+MAX_REPORTED_ERRORS = 100
+CSV_TYPES = frozenset({"text/csv", "application/csv"})
+NDJSON_TYPES = frozenset({"application/x-ndjson", "application/ndjson", "application/jsonl", "application/json-lines"})
+
+_Row = Tuple[int, Union[Dict[str, Any], str]]  # (line number, fields or why the line could not be read)
+
+
+
+# === === Parsing === ===
+
+async def read_lines(chunks: AsyncIterator[bytes], max_chars: int = MAX_RECORD_CHARS) -> AsyncIterator[str]:
+    """
+    Lines of a UTF-8 body as it arrives. Raises 413 for a line longer than `max_chars`.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    pending = ""
+    try:
+        async for chunk in chunks:
+            pending += decoder.decode(chunk)
+            *lines, pending = pending.split("\n")
+            for line in lines:
+                yield line.rstrip("\r")
+            if len(pending) > max_chars:
+                raise HTTPException(status_code=413, detail=f"Lines cannot be longer than {max_chars} characters.")
+        pending += decoder.decode(b"", final=True)
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="Upload must be UTF-8 encoded.")
+    if pending.strip():
+        yield pending.rstrip("\r")
+
+async def _csv_rows(lines: AsyncIterator[str]) -> AsyncIterator[_Row]:
+    # The first record is the header. A record continues onto the next line while a quoted field is open.
+    header: Optional[List[str]] = None
+    record: List[str] = []
+    line_number = start = 0
+    async for line in lines:
+        line_number += 1
+        if not record:
+            start = line_number
+        record.append(line)
+        if (text := "\n".join(record)).count('"') % 2:
+            if len(text) > MAX_RECORD_CHARS:
+                raise HTTPException(status_code=413, detail=f"Records cannot be longer than {MAX_RECORD_CHARS} characters.")
+            continue
+        record = []
+        if not text.strip():
+            continue
+        values = next(csv.reader([text]))
+        if header is None:
+            header = [value.strip().lower() for value in values]
+            continue
+        if len(values) > len(header):
+            yield start, f"Row has {len(values)} values but the header has {len(header)} columns."
+            continue
+        fields: Dict[str, Any] = {key: value.strip() for key, value in zip(header, values) if value.strip()}
+        if "allowed_member_ids" in fields:
+            fields["allowed_member_ids"] = [member_id.strip() for member_id in fields["allowed_member_ids"].split(";") if member_id.strip()]
+        yield start, fields
+    if record:
+        yield start, "Quoted field is never closed."
+
+async def _ndjson_rows(lines: AsyncIterator[str]) -> AsyncIterator[_Row]:
+    line_number = 0
+    async for line in lines:
+        line_number += 1
+        if not line.strip():
+            continue
+        try:
+            fields = orjson.loads(line)
+        except orjson.JSONDecodeError:
+            yield line_number, "Line is not valid JSON."
+            continue
+        yield line_number, fields if isinstance(fields, dict) else "Line must be a JSON object."
+
+def parse_rows(content_type: str, chunks: AsyncIterator[bytes]) -> AsyncIterator[_Row]:
+    """
+    Rows of a CSV (with a header) or NDJSON upload, read as the body arrives.
+    Raises 415 for any other content type.
+    """
+    media_type = content_type.split(";")[0].strip().lower()
+    if media_type in CSV_TYPES:
+        return _csv_rows(read_lines(chunks))
+    if media_type in NDJSON_TYPES:
+        return _ndjson_rows(read_lines(chunks))
+    raise HTTPException(status_code=415, detail="Upload CSV (text/csv) or NDJSON (application/x-ndjson).")
+
+
+
+# === === Import === ===
+
+class ItemImporter:
+    """
+    Creates a stash's items from parsed rows. Labels, storages and members are read once up front;
+    items and their Label/Storage.item_ids updates are written in batches of up to WRITE_CHUNK writes,
+    the last one also holding a single summary event. A batch that fails to commit fails its rows only.
+    """
+
+    def __init__(self, stash: Stash, member: Member):
+        self._stash = stash
+        self._member = member
+        self._result = ItemImportResult()
+        self._pending: List[Tuple[int, Item]] = []
+        self._pending_targets: Set[Tuple[str, str]] = set()  # labels and storages whose item_ids the batch updates
+        self._labels: Dict[str, Label] = {}
+        self._storages: Dict[str, Storage] = {}
+        self._label_names: Dict[str, Label] = {}
+        self._storage_names: Dict[str, Storage] = {}
+        self._members: Dict[str, Member] = {}
+
+    def _resolve(self) -> None:
+        labels = label_repo.query([("stash_id", "==", self._stash.id)], fields=["id", "name", "preferred_unit", "default_storage_id"])
+        storages = storage_repo.query([("stash_id", "==", self._stash.id)], fields=["id", "name"])
+        self._labels = {label.id: label for label in labels}
+        self._storages = {storage.id: storage for storage in storages}
+        self._label_names = {label.name.strip().casefold(): label for label in labels}
+        self._storage_names = {storage.name.strip().casefold(): storage for storage in storages}
+        self._members = {member.id: member for member in self._stash.get_all_members()}
+
+    def _build(self, fields: Dict[str, Any]) -> Item:
+        try:
+            row = ItemImportRow.model_validate(fields)
+        except ValidationError as e:
+            error = e.errors(include_url=False)[0]
+            raise ValueError(f"{'.'.join(str(part) for part in error['loc']) or 'row'}: {error['msg']}.")
+
+        if not row.name.strip():
+            raise ValueError("Item name is required.")
+
+        if row.label_id:
+            label = self._labels.get(row.label_id)
+        elif row.label:
+            label = self._label_names.get(row.label.strip().casefold())
+        else:
+            raise ValueError("Label is required.")
+        if label is None:
+            raise ValueError(f"Label '{row.label_id or row.label}' not found in the stash.")
+
+        if row.storage_id:
+            storage = self._storages.get(row.storage_id)
+        elif row.storage:
+            storage = self._storage_names.get(row.storage.strip().casefold())
+        else:
+            storage = self._storages.get(label.default_storage_id)
+        if storage is None:
+            raise ValueError(f"Storage '{row.storage_id or row.storage or label.default_storage_id}' not found in the stash.")
+
+        if row.total_quantity <= 0:
+            raise ValueError("Total quantity must be positive.")
+
+        if row.current_quantity is not None and row.current_quantity < 0:
+            raise ValueError("Current quantity cannot be negative.")
+
+        if row.cost is not None and row.cost < 0:
+            raise ValueError("Cost cannot be negative.")
+
+        if row.buyer_member_id and row.buyer_member_id not in self._members:
+            raise ValueError("Buyer member not found in the stash.")
+
+        if row.allowed_member_ids is not None:
+            if not row.allowed_member_ids:
+                raise ValueError("Must select allowed members.")
+            if (unknown := [member_id for member_id in row.allowed_member_ids if member_id not in self._members]):
+                raise ValueError(f"Allowed member '{unknown[0]}' not found in the stash.")
+            allowed = row.allowed_member_ids
+        else:
+            allowed = [member.id for member in self._members.values() if member.is_active]
+
+        return Item(
+            name=row.name.strip(),
+            label_id=label.id,
+            storage_id=storage.id,
+            buyer_member_id=row.buyer_member_id or None,
+            allowed_member_usage={member_id: 0.0 for member_id in allowed},
+            preferred_unit=row.preferred_unit or label.preferred_unit,
+            total_quantity=row.total_quantity,
+            current_quantity=row.current_quantity if row.current_quantity is not None else row.total_quantity,
+            cost=row.cost or None,
+            expiry_date=row.expiry_date or None,
+        )
+
+    def _fail(self, line: int, error: str) -> None:
+        self._result.failed += 1
+        if len(self._result.errors) < MAX_REPORTED_ERRORS:
+            self._result.errors.append(ItemImportError(row=line, error=error))
+
+    def _flush(self, final: bool) -> None:
+        batch = firestore_wrapper.create_batch()
+        item_ids_by_label: Dict[str, List[str]] = {}
+        item_ids_by_storage: Dict[str, List[str]] = {}
+        for _, item in self._pending:
+            item_repo.batch_add(batch, item)
+            item_ids_by_label.setdefault(item.label_id, []).append(item.id)
+            item_ids_by_storage.setdefault(item.storage_id, []).append(item.id)
+        for label_id, item_ids in item_ids_by_label.items():
+            label_repo.batch_array_union(batch, label_id, "item_ids", *item_ids)
+        for storage_id, item_ids in item_ids_by_storage.items():
+            storage_repo.batch_array_union(batch, storage_id, "item_ids", *item_ids)
+
+        imported = self._result.imported + len(self._pending)
+        if final and imported:
+            event_repo.batch_add(batch, Event(
+                stash_id=self._stash.id,
+                member_id=self._member.id,
+                type=EventType.SUCCESS if not self._result.failed else EventType.WARNING,
+                title="Items Imported",
+                message=f"{imported} items imported" + (f", {self._result.failed} rows skipped." if self._result.failed else "."),
+            ))
+
+        if self._pending or (final and imported):
+            if firestore_wrapper.commit_batch(batch):
+                self._result.imported += len(self._pending)
+                self._result.item_ids += [item.id for _, item in self._pending]
+            else:
+                for line, _ in self._pending:
+                    self._fail(line, "Saving this row failed.")
+        self._pending = []
+        self._pending_targets = set()
+
+    async def run(self, rows: AsyncIterator[_Row]) -> ItemImportResult:
+        await run_in_threadpool(self._resolve)
+        count = 0
+        async for line, fields in rows:
+            if (count := count + 1) > MAX_IMPORT_ROWS:
+                self._fail(line, f"Imports are limited to {MAX_IMPORT_ROWS} rows; the rest was skipped.")
+                break
+            if isinstance(fields, str):
+                self._fail(line, fields)
+                continue
+            try:
+                item = self._build(fields)
+            except ValueError as e:
+                self._fail(line, str(e))
+                continue
+            self._pending.append((line, item))
+            self._pending_targets.update({("label", item.label_id), ("storage", item.storage_id)})
+            # Leave room for another item with a new label and storage, plus the summary event
+            if len(self._pending) + len(self._pending_targets) + 4 > WRITE_CHUNK:
+                await run_in_threadpool(self._flush, False)
+        await run_in_threadpool(self._flush, True)
+        return self._result
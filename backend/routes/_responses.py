@@ -0,0 +1,195 @@
+import inspect
+from contextvars import ContextVar
+from functools import wraps
+from datetime import datetime
+from typing import Any, Callable, Coroutine, Dict, List, Union, get_args, get_origin
+
+import msgpack
+import orjson
+from fastapi import Request, Response
+from fastapi.exceptions import ResponseValidationError
+from fastapi.responses import ORJSONResponse
+from fastapi.datastructures import DefaultPlaceholder
+from fastapi.routing import APIRoute
+from pydantic import BaseModel, TypeAdapter, ValidationError
+
+# === Config ===
+NONE_TYPE = type(None)
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+
+# Accept header of the request being handled, read when the endpoint's result is rendered.
+_accept: ContextVar[str] = ContextVar("accept", default="")
+
+
+
+# === === Responses === ===
+
+def _orjson_default(value: Any) -> Any:
+    if isinstance(value, BaseModel):
+        return value.model_dump(mode="json")
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+class ModelResponse(ORJSONResponse):
+    """
+    orjson-backed JSON response.
+    Pre-rendered bytes are sent as-is, anything else is encoded with orjson.
+    """
+
+    def render(self, content: Any) -> bytes:
+        if isinstance(content, (bytes, bytearray)):
+            return bytes(content)
+        return orjson.dumps(content, default=_orjson_default, option=orjson.OPT_NON_STR_KEYS)
+
+def _msgpack_default(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return msgpack.Timestamp.from_datetime(value)
+    if isinstance(value, BaseModel):
+        return value.model_dump(mode="python")
+    raise TypeError(f"Type is not MessagePack serializable: {type(value).__name__}")
+
+def _to_columns(rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Sends the field names of a list once instead of once per row.
+    Keys are collected from every row; a row without one of them gets None for it.
+    """
+    keys = list(dict.fromkeys(key for row in rows for key in row))
+    return {"$keys": keys, "$rows": [[row.get(key) for key in keys] for row in rows]}
+
+class MsgPackResponse(Response):
+    """
+    Compact binary response. Datetimes are sent as MessagePack timestamps (ext type -1).
+    With `keyed=True`, a list of documents is sent as a field-name dictionary plus rows.
+    Only offered by routes marked with `bulk_list`.
+    """
+    media_type = MSGPACK_MEDIA_TYPE
+
+    def __init__(self, content: Any, keyed: bool = False, **kwargs: Any):
+        self.keyed = keyed
+        super().__init__(content, **kwargs)
+        if keyed:
+            self.headers["content-type"] = f"{MSGPACK_MEDIA_TYPE}; dict=1"
+
+    def render(self, content: Any) -> bytes:
+        if self.keyed and isinstance(content, list) and content and all(isinstance(row, dict) for row in content):
+            content = _to_columns(content)
+        return msgpack.packb(content, default=_msgpack_default, use_bin_type=True)
+
+def negotiate(accept: str) -> Dict[str, Any]:
+    """
+    Parses an Accept header. Returns {"msgpack": bool, "keyed": bool}.
+    """
+    for media_range in accept.split(","):
+        media_type, *params = [part.strip() for part in media_range.split(";")]
+        if media_type == MSGPACK_MEDIA_TYPE:
+            return {"msgpack": True, "keyed": "dict=1" in params}
+    return {"msgpack": False, "keyed": False}
+
+
+
+# === === Routes === ===
+
+def bulk_list(endpoint: Callable[..., Any]) -> Callable[..., Any]:
+    """
+    Marks a route that returns a long list of documents. Only these are sent as MessagePack to clients
+    that ask for it; everything else stays JSON, which every client reads.
+    """
+    endpoint.bulk_list = True
+    return endpoint
+
+class Projection:
+    """
+    Wraps a route's result when only some fields were read, so fields that were not read are left
+    out of the response instead of being sent as their defaults.
+    """
+    __slots__ = ("content",)
+
+    def __init__(self, content: Any):
+        self.content = content
+
+def is_trusted(content: Any, annotation: Any) -> bool:
+    """
+    True if `content` is already exactly the model (or list/optional of the model) a route declares.
+    Those values came out of a validated model, so validating them again is wasted work.
+    """
+    origin = get_origin(annotation)
+    if origin in (list, List):
+        (model,) = get_args(annotation) or (Any,)
+        return isinstance(content, list) and all(type(entry) is model for entry in content)
+    if origin is Union:
+        args = get_args(annotation)
+        if content is None:
+            return NONE_TYPE in args
+        return any(is_trusted(content, arg) for arg in args if arg is not NONE_TYPE)
+    return isinstance(annotation, type) and issubclass(annotation, BaseModel) and type(content) is annotation
+
+def writes_response(endpoint: Callable[..., Any]) -> bool:
+    """
+    True if the endpoint takes the Response FastAPI injects (to set cookies or headers).
+    """
+    return any(parameter.annotation is Response for parameter in inspect.signature(endpoint).parameters.values())
+
+def rendering(endpoint: Callable[..., Any], annotation: Any, status_code: int, exclude_unset: bool) -> Callable[..., Any]:
+    """
+    Wraps an endpoint so it returns its result already rendered as the declared `annotation`.
+    FastAPI sends a returned Response as it is, so the result is validated and serialized only here.
+    """
+    adapter = TypeAdapter(annotation)
+    negotiated = getattr(endpoint, "bulk_list", False)
+
+    def render(content: Any) -> Response:
+        if isinstance(content, Response):
+            return content
+        exclude = exclude_unset
+        if isinstance(content, Projection):
+            content, exclude = content.content, True
+        if not is_trusted(content, annotation):
+            try:
+                content = adapter.validate_python(content, from_attributes=True)
+            except ValidationError as e:
+                raise ResponseValidationError(errors=e.errors(include_url=False), body=content)
+        if not negotiated:
+            return ModelResponse(adapter.dump_json(content, exclude_unset=exclude), status_code=status_code)
+        if (accept := negotiate(_accept.get()))["msgpack"]:
+            return MsgPackResponse(adapter.dump_python(content, exclude_unset=exclude), keyed=accept["keyed"], status_code=status_code, headers={"vary": "Accept"})
+        return ModelResponse(adapter.dump_json(content, exclude_unset=exclude), status_code=status_code, headers={"vary": "Accept"})
+
+    if inspect.iscoroutinefunction(endpoint):
+        @wraps(endpoint)
+        async def rendered(*args: Any, **kwargs: Any) -> Response:
+            return render(await endpoint(*args, **kwargs))
+    else:
+        @wraps(endpoint)
+        def rendered(*args: Any, **kwargs: Any) -> Response:
+            return render(endpoint(*args, **kwargs))
+    rendered.rendered = True
+    return rendered
+
+class TrustedModelRoute(APIRoute):
+    """
+    Route that serializes its `response_model` straight to JSON bytes in a single pass.
+    Values that are already instances of the declared model skip FastAPI's re-validation;
+    anything else (e.g. a User for a UserProtected route) is still validated and filtered.
+    A result wrapped in a Projection is sent without the fields it does not have set.
+    On `bulk_list` routes, clients sending `Accept: application/msgpack` get a MsgPackResponse instead.
+    """
+
+    def __init__(self, path: str, endpoint: Callable[..., Any], **kwargs: Any):
+        response_model = kwargs.get("response_model")
+        # Routes that write to an injected Response (cookies, headers) keep the default path.
+        # include_router builds the route again from its already wrapped endpoint.
+        if response_model is not None and not isinstance(response_model, DefaultPlaceholder) \
+                and not writes_response(endpoint) and not getattr(endpoint, "rendered", False):
+            endpoint = rendering(endpoint, response_model, kwargs.get("status_code") or 200, kwargs.get("response_model_exclude_unset", False))
+        super().__init__(path, endpoint, **kwargs)
+
+    def get_route_handler(self) -> Callable[[Request], Coroutine[Any, Any, Response]]:
+        handler = super().get_route_handler()
+
+        async def app(request: Request) -> Response:
+            token = _accept.set(request.headers.get("accept", ""))
+            try:
+                return await handler(request)
+            finally:
+                _accept.reset(token)
+
+        return app
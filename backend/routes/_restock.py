@@ -0,0 +1,91 @@
+import math
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+
+from backend.models import ConsumptionRate, Item, Order, OrderStatus, Stash
+from backend.database.repos import label_repo, item_repo, consumption_rate_repo, MAX_IN_VALUES
+from backend.routes._schemas import RestockPlan, RestockRecommendation
+
+# === Config ===
+DEFAULT_HORIZON_DAYS = 14.0  # suggested quantities cover this many days of use
+
+
+
+# === === Write path === ===
+
+def batch_record_consumption(batch, uses: List[Tuple[Item, float]], stash_id: str, at: Optional[datetime] = None) -> None:
+    """
+    Queues the consumption rate of the items' label with the amounts used of each folded in, as one use.
+    All items must share a label. Meant for an optimistic write: the rate is read fresh and only
+    written if nobody else changed it meanwhile. Uses in a unit other than the label's are not counted.
+    """
+    if not uses:
+        return
+    at = at or datetime.now(timezone.utc)
+    label_id = uses[0][0].label_id
+    if (rate := consumption_rate_repo.get(label_id, fresh=True)) is None:
+        label = label_repo.get(label_id)
+        rate = ConsumptionRate(id=label_id, stash_id=stash_id, unit=label.preferred_unit if label else uses[0][0].preferred_unit)
+        created = True
+    else:
+        created = False
+
+    counted = [(item, used) for item, used in uses if not (item.preferred_unit and rate.unit and item.preferred_unit != rate.unit)]
+    if not counted:
+        return
+
+    rate.record(sum(used for _, used in counted), since=min(item.updated_at for item, _ in counted), at=at)
+    if created:
+        consumption_rate_repo.batch_create(batch, rate)
+    else:
+        consumption_rate_repo.batch_update(batch, rate, if_unchanged=True)
+
+
+
+# === === Read path === ===
+
+def plan_restock(stash: Stash, buyer_member_id: Optional[str], horizon_days: float = DEFAULT_HORIZON_DAYS, now: Optional[datetime] = None) -> RestockPlan:
+    """
+    Run-out predictions for every label with recorded consumption, soonest first, from the stored
+    rates and the items' current quantities; no item or event history is read.
+    """
+    now = now or datetime.now(timezone.utc)
+    labels = label_repo.query([("stash_id", "==", stash.id)], fields=["id", "name", "preferred_unit"])
+    rates = {rate.id: rate for rate in consumption_rate_repo.query([("stash_id", "==", stash.id)])}
+
+    tracked = [label for label in labels if label.id in rates and rates[label.id].unit == label.preferred_unit]
+    in_stock: Dict[str, float] = {label.id: 0.0 for label in tracked}
+    units = {label.id: label.preferred_unit for label in tracked}
+    label_ids = list(in_stock)
+    for start in range(0, len(label_ids), MAX_IN_VALUES):
+        items = item_repo.query([("label_id", "in", label_ids[start:start + MAX_IN_VALUES])], fields=["label_id", "current_quantity", "preferred_unit"])
+        for item in items:
+            if not item.preferred_unit or item.preferred_unit == units[item.label_id]:
+                in_stock[item.label_id] += item.current_quantity
+
+    recommendations: List[RestockRecommendation] = []
+    for label in tracked:
+        rate = rates[label.id]
+        if (daily_rate := rate.daily_rate(now)) <= 0:
+            continue
+        stock = in_stock[label.id]
+        days_left = stock / daily_rate
+        recommendations.append(RestockRecommendation(
+            label_id=label.id,
+            label_name=label.name,
+            unit=label.preferred_unit,
+            in_stock=stock,
+            daily_rate=round(daily_rate, 4),
+            days_left=round(days_left, 2),
+            runs_out_at=now + timedelta(days=days_left),
+            suggested_quantity=math.ceil(max(0.0, daily_rate * horizon_days - stock) * 100) / 100,
+            samples=rate.samples,
+        ))
+    recommendations.sort(key=lambda recommendation: recommendation.days_left)
+
+    order = Order(
+        stash_id=stash.id,
+        buyer_member_id=buyer_member_id,
+        status={recommendation.label_id: OrderStatus.IN_PROGRESS for recommendation in recommendations if recommendation.suggested_quantity > 0},
+    )
+    return RestockPlan(horizon_days=horizon_days, recommendations=recommendations, order=order)
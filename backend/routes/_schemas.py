@@ -1,3 +1,4 @@
+from enum import Enum
 from datetime import datetime, timezone
 from pydantic import BaseModel, Field, EmailStr
 from typing import Optional, List, Dict, Any
@@ -32,6 +33,79 @@ class UserProtected(BaseDocument):
         return schema
 
 
+# === Stash Stats ===
+class StashStats(BaseModel):
+    active_member_count: int = 0
+    storage_count: int = 0
+    label_count: int = 0
+    item_count: int = 0
+    order_count: int = 0
+    event_count: int = 0
+    total_item_cost: float = 0.0
+
+class SearchResult(BaseModel):
+    kind: str  # "item", "label" or "storage"
+    id: str
+    field: str  # the field that matched best
+    text: str
+    score: float
+
+# === Restock ===
+class RestockRecommendation(BaseModel):
+    label_id: str
+    label_name: str
+    unit: Optional[str] = None
+    in_stock: float = 0.0
+    daily_rate: float = 0.0  # units used per day, recent days weighted most
+    days_left: float = 0.0
+    runs_out_at: datetime
+    suggested_quantity: float = 0.0  # to buy for the plan's horizon
+    samples: int = 0  # uses the rate is based on
+
+class RestockPlan(BaseModel):
+    horizon_days: float
+    recommendations: List[RestockRecommendation] = Field(default_factory=list)
+    order: Order  # unsaved draft; status marks the labels to buy as in progress
+
+# === Item Import ===
+class ItemImportError(BaseModel):
+    row: int  # line number in the upload
+    error: str
+
+class ItemImportResult(BaseModel):
+    imported: int = 0
+    failed: int = 0
+    item_ids: List[str] = Field(default_factory=list)
+    errors: List[ItemImportError] = Field(default_factory=list)  # the first few failed rows
+
+# === Stash Restore ===
+class StashRestoreResult(BaseModel):
+    stash_id: str
+    restored: Dict[str, int] = Field(default_factory=dict)  # documents written per collection
+    skipped: int = 0  # invalid records, and ids already used by another stash
+    failed: int = 0  # records in batches that failed to commit; restoring again retries them
+    complete: bool = False  # the backup's end record was reached, so it was not cut off
+    errors: List[str] = Field(default_factory=list)  # the first few problems, by line number
+
+# === Item Bulk ===
+class ItemBulkOperationResult(BaseModel):
+    index: int  # position in the request
+    item_id: str
+    status: int = 200  # like the single-item routes would answer
+    error: Optional[str] = None
+    item: Optional[Item] = None  # the item after a move or consume
+
+class ItemBulkResult(BaseModel):
+    succeeded: int = 0
+    failed: int = 0
+    results: List[ItemBulkOperationResult] = Field(default_factory=list)
+
+# === Batch ===
+class BatchResult(BaseModel):
+    status: int  # what the request would have answered on its own
+    body: Any = None  # its JSON body, e.g. {"detail": ...} for errors
+
+
 
 # === === Payloads === ===
 
@@ -88,6 +162,9 @@ class StashPayload(BasePayload):
     storage_ids: Optional[List[str]] = None
     label_ids: Optional[List[str]] = None
     join_code: Optional[str] = None
+    event_retention_days: Optional[int] = None
+    event_retention_count: Optional[int] = None
+    event_rollup: Optional[RollupPeriod] = None
     
     def to_model(self, model: Stash, preserve: bool) -> Stash:
         update_data = self.model_dump(exclude_unset=True)
@@ -188,6 +265,47 @@ class OrderPayload(BasePayload):
                 setattr(model, field, value)
             return model
 
+# === Item Import ===
+class ItemImportRow(BaseModel):
+    # One item of an import. Labels and storages are given by id or by name;
+    # the storage defaults to the label's default storage.
+    name: str
+    label_id: Optional[str] = None
+    label: Optional[str] = None
+    storage_id: Optional[str] = None
+    storage: Optional[str] = None
+    buyer_member_id: Optional[str] = None
+    allowed_member_ids: Optional[List[str]] = None  # all active members when not given
+    total_quantity: float
+    current_quantity: Optional[float] = None
+    preferred_unit: Optional[str] = None
+    cost: Optional[float] = None
+    expiry_date: Optional[datetime] = None
+
+# === Item Bulk ===
+class ItemBulkAction(str, Enum):
+    MOVE = "move"
+    CONSUME = "consume"
+    DELETE = "delete"
+
+class ItemBulkOperation(BaseModel):
+    action: ItemBulkAction
+    item_id: str
+    storage_id: Optional[str] = None  # move: where to
+    quantity: Optional[float] = None  # consume: how much was used; everything left when not given
+
+class ItemBulkPayload(BaseModel):
+    operations: List[ItemBulkOperation] = Field(default_factory=list)
+
+# === Batch ===
+class BatchRequest(BaseModel):
+    method: str = "GET"
+    path: str  # including any query string, e.g. "/stash/{id}/labels"
+    body: Optional[Any] = None  # sent as JSON
+
+class BatchPayload(BaseModel):
+    requests: List[BatchRequest] = Field(default_factory=list)
+
 # === Event ===
 class EventPayload(BasePayload):
     stash_id: Optional[str] = None
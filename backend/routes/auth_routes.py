@@ -1,27 +1,38 @@
 import os
-from fastapi import APIRouter, Depends, HTTPException, status, Cookie, Response
+from fastapi import APIRouter, Depends, HTTPException, status, Cookie, Request, Response
 from passlib.context import CryptContext # type: ignore
 from jose import jwt, JWTError, ExpiredSignatureError # type: ignore
 from datetime import datetime, timedelta, timezone
+from functools import lru_cache
 from typing import Optional
-from backend.database.repos import user_repo
-from backend.models import User
+from backend.database.repos import user_repo, user_email_repo
+from backend.database.firestore_wrapper import firestore_wrapper
+from backend.models import User, UserEmail, normalize_email, email_key
 from backend.routes._schemas import UserPayload, UserProtected
+from backend.routes._responses import ModelResponse, TrustedModelRoute
 
 # === Config ===
-SECRET_KEY = os.environ['JWT_KEY']
-if not SECRET_KEY:
-    raise ValueError("JWT_KEY environment variable not set.")
-
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60
 REFRESH_TOKEN_EXPIRE_DAYS = 7
 REFRESH_TOKEN_EXPIRE_MINUTES = REFRESH_TOKEN_EXPIRE_DAYS * 24 * 60
+SHARED_USER_SCOPE_KEY = "stasher.current_user"  # set server-side on batched sub-requests, never from the client
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-router = APIRouter()
+router = APIRouter(route_class=TrustedModelRoute, default_response_class=ModelResponse)
 
 # === Helper Functions ===
+@lru_cache(maxsize=1)
+def get_secret_key() -> str:
+    """
+    Read the JWT signing key from the environment on first use.
+    Checked during app startup so a missing key still fails before serving.
+    """
+    secret_key = os.environ.get('JWT_KEY')
+    if not secret_key:
+        raise ValueError("JWT_KEY environment variable not set.")
+    return secret_key
+
 def hash_password(password: str) -> str:
     """
     Hash a plain text password using bcrypt.
@@ -47,7 +58,7 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     else:
         expire = datetime.now(timezone.utc) + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     to_encode.update({"exp": expire})
-    return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    return jwt.encode(to_encode, get_secret_key(), algorithm=ALGORITHM)
     
 def create_refresh_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     """
@@ -60,7 +71,7 @@ def create_refresh_token(data: dict, expires_delta: Optional[timedelta] = None)
     else:
         expire = datetime.now(timezone.utc) + timedelta(minutes=REFRESH_TOKEN_EXPIRE_MINUTES)
     to_encode.update({"exp": expire})
-    return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    return jwt.encode(to_encode, get_secret_key(), algorithm=ALGORITHM)
 
 def decode_token(token: str) -> Optional[dict]:
     """
@@ -69,13 +80,29 @@ def decode_token(token: str) -> Optional[dict]:
     Raises HTTPException if the token is expired.
     """
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = jwt.decode(token, get_secret_key(), algorithms=[ALGORITHM])
         return payload
     except ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token expired")
     except JWTError:
         return None
 
+def find_user_by_email(email: str) -> Optional[User]:
+    """
+    Look up a user through the user_emails index (one point read for the entry, one for the user).
+    Accounts created before the index existed are found by query and backfilled.
+    """
+    entry = user_email_repo.get(email_key(email))
+    if entry:
+        return user_repo.get(entry.user_id)
+
+    users = user_repo.query([('email', '==', normalize_email(email))], limit=1)
+    if not users:
+        return None
+
+    user_email_repo.add(UserEmail(id=email_key(email), user_id=users[0].id))
+    return users[0]
+
 def save_tokens(response: Response, access_token: str, refresh_token: str):
     """
     Save access and refresh tokens in HTTP-only cookies.
@@ -107,12 +134,10 @@ def login(payload: UserPayload, response: Response):
     if( not payload.email or not payload.password_current):
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Email and password are required")
 
-    users = user_repo.query([('email','==', payload.email.strip().lower())])
-    if not users:
+    user = find_user_by_email(payload.email)
+    if not user:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="No account with that email exists")
     
-    user = users[0]
-    
     if not verify_password(payload.password_current, user.password_hashed):
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Password is incorrect")
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
@@ -131,18 +156,25 @@ def register(payload: UserPayload, response: Response):
     if not payload.username or not payload.email or not payload.password_current:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Username, email, and password are required.")
 
-    if len(user_repo.query([('email','==', payload.email.strip().lower())])) > 0:
+    if find_user_by_email(payload.email):
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="An account with that email already exists.")
     
     user = User(
         username=payload.username,
-        email=payload.email,
+        email=normalize_email(payload.email),
         password_hashed=hash_password(payload.password_current)
     )
 
-    id = user_repo.add(user)
-    if not id:
+    # Reserving the email fails the whole batch if a concurrent registration claimed it first
+    batch = firestore_wrapper.create_batch()
+    user_email_repo.batch_create(batch, UserEmail(id=email_key(user.email), user_id=user.id))
+    user_repo.batch_add(batch, user)
+
+    if not firestore_wrapper.commit_batch(batch):
+        if user_email_repo.get(email_key(user.email)):
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="An account with that email already exists.")
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="User registration failed")
+    id = user.id
     
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(data={"sub": str(id)}, expires_delta=access_token_expires)
@@ -215,11 +247,15 @@ from fastapi.security import OAuth2PasswordBearer
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
 
-def get_current_user(access_token: str = Cookie(None)):
+def get_current_user(request: Request, access_token: str = Cookie(None)):
     """
     Dependency to get the current authenticated user from the JWT access token.
+    Sub-requests of a batch reuse the user already resolved for the batch.
     Raises 401 if invalid or expired.
     """
+    if (user := request.scope.get(SHARED_USER_SCOPE_KEY)) is not None:
+        return user
+
     payload = decode_token(access_token)
     if not payload:
         raise HTTPException(status_code=401, detail="Invalid access token")
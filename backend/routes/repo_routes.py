@@ -1,14 +1,54 @@
-import uuid
-from fastapi import APIRouter, Depends, HTTPException
-from backend.routes.auth_routes import get_current_user, hash_password, verify_password
-from backend.database.repos import user_repo, member_repo, stash_repo, storage_repo, label_repo, item_repo, order_repo, event_repo
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from backend.routes.auth_routes import get_current_user, hash_password, verify_password, find_user_by_email, decode_token
+from backend.database.repos import user_repo, user_email_repo, member_repo, stash_repo, join_code_repo, storage_repo, label_repo, item_repo, order_repo, event_repo, MAX_IN_VALUES
 from backend.models import *
 from backend.routes._schemas import *
-from backend.database.firestore_wrapper import firestore_wrapper
+from backend.routes._responses import ModelResponse, TrustedModelRoute, Projection, bulk_list
+from backend.routes._admission import RateLimiter, RouteGroup, RouteLimits, RateLimit
+from backend.routes._events import EventCoalescer, compact_changes, summarize_changes
+from backend.routes._restock import DEFAULT_HORIZON_DAYS, batch_record_consumption, plan_restock
+from backend.routes._imports import ItemImporter, parse_rows
+from backend.routes._backups import StashRestorer, export_stash
+from backend.routes._bulk import MAX_OPERATIONS, run_item_bulk
+from backend.routes._batch import MAX_BATCH_REQUESTS, batch_dispatcher
+from backend.database.firestore_wrapper import firestore_wrapper, TransactionConflict
+from backend.database.event_retention import event_compactor
+from backend.database.search_index import search_indexes
 
 # region === Config === ===
-router = APIRouter()
-
+def rate_limit_key(request: Request) -> str:
+    # Limits follow the user across devices; requests without a valid token are limited per address
+    if (token := request.cookies.get("access_token")):
+        try:
+            if (payload := decode_token(token)) and payload.get("sub"):
+                return payload["sub"]
+        except HTTPException:
+            pass
+    return request.client.host if request.client else "anonymous"
+
+rate_limiter = RateLimiter(
+    rate_limit_key,
+    default=RouteLimits(read=RateLimit(per_second=20, burst=60), write=RateLimit(per_second=5, burst=20)),
+    groups=[
+        # Event feeds are what clients poll, so they get the tightest read budget
+        RouteGroup("events", ("/event", "/stash/{stash_id}/events", "/member/{member_id}/events"),
+                   RouteLimits(read=RateLimit(per_second=2, burst=10), write=RateLimit(per_second=2, burst=10))),
+        # Whole-stash reads cost one Firestore read per document returned
+        RouteGroup("bulk", ("/stash/{stash_id}/items", "/stash/{stash_id}/items/import", "/storage/{storage_id}/items", "/stash/{stash_id}/orders", "/stash/{stash_id}/stats",
+                             "/stash/{stash_id}/export", "/stash/restore", "/items/bulk"),
+                   RouteLimits(read=RateLimit(per_second=5, burst=20), write=RateLimit(per_second=5, burst=20))),
+        # Each sub-request is charged to its own group, so the batch itself only needs a read-sized budget
+        RouteGroup("batch", ("/batch",),
+                   RouteLimits(read=RateLimit(per_second=20, burst=60), write=RateLimit(per_second=20, burst=60))),
+    ],
+)
+
+router = APIRouter(route_class=TrustedModelRoute, default_response_class=ModelResponse,
+                   dependencies=[Depends(rate_limiter)])
+
+JOIN_CODE_ATTEMPTS = 3  # Codes are reserved atomically; a collision only fails the commit, so just retry
 
 #endregion
 
@@ -20,11 +60,24 @@ def get_current_member(user: User, stash_id: str) -> Member:
     
     return members[0]
 
-def changes_to_string(changes: dict) -> str:
-    messages = []
-    for field, (old, new) in changes.items():
-        messages.append(f"- **{field}** changed from '{old}' to '{new}'")
-    return "\n".join(messages)
+def parse_fields(model_cls: type[BaseDocument], fields: Optional[str]) -> Optional[List[str]]:
+    if not fields or fields.strip() == "":
+        return None
+
+    requested = [field.strip() for field in fields.split(",") if field.strip()]
+    if (unknown := [field for field in requested if field not in model_cls.model_fields]):
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}.")
+
+    return ["id"] + [field for field in dict.fromkeys(requested) if field != "id"]
+
+def as_utc(moment: Optional[datetime]) -> Optional[datetime]:
+    # Query parameters without an offset are taken as UTC
+    if moment is None or moment.tzinfo is not None:
+        return moment
+    return moment.replace(tzinfo=timezone.utc)
+
+# Rapid successive updates of one document by one member become a single event
+event_coalescer = EventCoalescer()
 # endregion
 
 # region === Current API === ===
@@ -87,8 +140,9 @@ def user_update(payload: UserPayload, current_user: User = Depends(get_current_u
         
         user.password_hashed = hash_password(payload.password_new)
     
-    if payload.email and payload.email != user.email:
-        if len(user_repo.query([('email','==', payload.email.strip().lower())])) > 0:
+    if payload.email:
+        payload.email = normalize_email(payload.email)
+        if payload.email != normalize_email(user.email) and find_user_by_email(payload.email):
             raise HTTPException(status_code=400, detail="An account with that email already exists.")
 
     updated_user = payload.to_model(user, preserve=True)
@@ -96,7 +150,16 @@ def user_update(payload: UserPayload, current_user: User = Depends(get_current_u
     if not (changes := user.diff(updated_user)):
         return user
 
-    if (updated_user := user_repo.update(updated_user)):
+    batch = firestore_wrapper.create_batch()
+
+    if email_key(updated_user.email) != email_key(user.email):
+        # Move the index entry; creating the new one fails the batch if the email was just taken
+        user_email_repo.batch_create(batch, UserEmail(id=email_key(updated_user.email), user_id=user.id))
+        user_email_repo.batch_delete(batch, email_key(user.email))
+
+    user_repo.batch_update(batch, updated_user)
+
+    if firestore_wrapper.commit_batch(batch):
         return updated_user
     raise HTTPException(status_code=500, detail="User update failed.")
 
@@ -189,33 +252,47 @@ def member_update(payload: MemberPayload, current_user: User = Depends(get_curre
     if not current_member:
         raise HTTPException(status_code=403, detail="You do not have access to this stash.")
 
-    if not current_member.is_admin:
-        if current_member.id != member.id:
-            raise HTTPException(status_code=403, detail="Only admins can update other members.")
-        
-        if payload.is_admin is not None and payload.is_admin != member.is_admin:
-            raise HTTPException(status_code=403, detail="Only admins can change admin status.")
+    def apply(transaction) -> Member:
+        # Both members are read in the transaction, so debts and admin status are checked against what is written
+        member = member_repo.transaction_get(transaction, payload.id)
+        if not member:
+            raise HTTPException(status_code=404, detail="Member not found.")
 
-    updated_member = payload.to_model(member, preserve=True)
-    
-    if not (changes := member.diff(updated_member)):
-        return member
-    
-    event = Event(
-        stash_id=member.stash_id,
-        member_id=current_member.id,
-        type=EventType.SUCCESS,
-        title=f"Member '{member.nickname}' Updated",
-        message=changes_to_string(changes)
-    )
-    
-    batch = firestore_wrapper.create_batch()
-    
-    event_repo.batch_add(batch, event)
-    member_repo.batch_update(batch, updated_member)
+        acting_member = member if member.id == current_member.id else member_repo.transaction_get(transaction, current_member.id)
+        if not acting_member or not acting_member.is_active:
+            raise HTTPException(status_code=403, detail="You do not have access to this stash.")
 
-    if firestore_wrapper.commit_batch(batch):
+        if not acting_member.is_admin:
+            if acting_member.id != member.id:
+                raise HTTPException(status_code=403, detail="Only admins can update other members.")
+            
+            if payload.is_admin is not None and payload.is_admin != member.is_admin:
+                raise HTTPException(status_code=403, detail="Only admins can change admin status.")
+
+        updated_member = payload.to_model(member, preserve=True)
+        
+        if not (changes := member.diff(updated_member)):
+            return member
+        
+        event = Event(
+            stash_id=member.stash_id,
+            member_id=acting_member.id,
+            type=EventType.SUCCESS,
+            title=f"Member '{member.nickname}' Updated",
+            message=summarize_changes(changes),
+            changes=compact_changes(changes),
+            target_id=member.id
+        )
+        
+        event_coalescer.batch_add(transaction, event, changes)
+        member_repo.batch_update(transaction, updated_member)
         return updated_member
+
+    try:
+        if (updated_member := firestore_wrapper.run_transaction(apply, name="member_update")) is not None:
+            return updated_member
+    except TransactionConflict:
+        raise HTTPException(status_code=409, detail="Member was changed by someone else, try again.")
     raise HTTPException(status_code=500, detail="Member update failed.")
 
 @router.delete("/member/{member_id}", response_model=bool)
@@ -275,6 +352,7 @@ def member_get_stash(member_id: str, current_user: User = Depends(get_current_us
     return stash
 
 @router.get("/member/{member_id}/items/{filter}", response_model=List[Item])
+@bulk_list
 def member_get_items(member_id: str, filter: str, current_user: User = Depends(get_current_user)):
     member = member_repo.get(member_id)
     if not member:
@@ -289,6 +367,7 @@ def member_get_items(member_id: str, filter: str, current_user: User = Depends(g
         return member.get_used_items()
 
 @router.get("/member/{member_id}/orders", response_model=List[Order])
+@bulk_list
 def member_get_orders(member_id: str, current_user: User = Depends(get_current_user)):
     member = member_repo.get(member_id)
     if not member:
@@ -300,6 +379,7 @@ def member_get_orders(member_id: str, current_user: User = Depends(get_current_u
     return member.get_orders()
 
 @router.get("/member/{member_id}/events", response_model=List[Event])
+@bulk_list
 def member_get_events(member_id: str, current_user: User = Depends(get_current_user)):
     member = member_repo.get(member_id)
     if not member:
@@ -328,10 +408,6 @@ def stash_get_template(current_user: User = Depends(get_current_user)):
 def stash_create(payload: StashPayload, current_user: User = Depends(get_current_user)):
     if not payload.name or payload.name.strip() == "":
         raise HTTPException(status_code=400, detail="Stash name is required.")
-    
-    payload.join_code = uuid.uuid4().hex[:8].strip().upper()
-    while len(stash_repo.query([("join_code", "==", payload.join_code)])) > 0:
-        payload.join_code = uuid.uuid4().hex[:8].strip().upper()
 
     stash = Stash(
         name=payload.name.strip(),
@@ -339,7 +415,8 @@ def stash_create(payload: StashPayload, current_user: User = Depends(get_current
         member_ids=[],
         storage_ids=[],
         label_ids=[],
-        join_code=payload.join_code
+        join_code=generate_join_code(),
+        events_partitioned=True
     )
     
     member = Member(
@@ -359,30 +436,89 @@ def stash_create(payload: StashPayload, current_user: User = Depends(get_current
         item_ids=[]
     )
     
+    stash.member_ids.append(member.id)
+    stash.storage_ids.append(storage.id)
+    
+    for _ in range(JOIN_CODE_ATTEMPTS):
+        event = Event(
+            stash_id=stash.id,
+            member_id=member.id,
+            type=EventType.SUCCESS,
+            title="Stash Created",
+            message=f"Stash '{stash.name}' created with join code '{stash.join_code}'."
+        )
+
+        batch = firestore_wrapper.create_batch()
+        
+        join_code_repo.batch_create(batch, JoinCode(id=stash.join_code, stash_id=stash.id))
+        stash_repo.batch_add(batch, stash)
+        storage_repo.batch_add(batch, storage)
+        member_repo.batch_add(batch, member)
+        event_repo.batch_add(batch, event)
+        user_repo.batch_array_union(batch, current_user.id, "member_ids", member.id)
+        
+        if firestore_wrapper.commit_batch(batch):
+            return stash
+        
+        stash.join_code = generate_join_code()
+    raise HTTPException(status_code=500, detail="Stash creation failed.")
+
+@router.post("/stash/join/{join_code}", response_model=Stash)
+def stash_join(join_code: str, current_user: User = Depends(get_current_user)):
+    code = normalize_join_code(join_code)
+    if code == "":
+        raise HTTPException(status_code=400, detail="Join code is required.")
+
+    entry = join_code_repo.get(code)
+    if entry:
+        stash = stash_repo.get(entry.stash_id)
+    elif (stashes := stash_repo.query([("join_code", "==", code)], limit=1)):
+        # Stash created before the join code index existed; backfill it on first use
+        stash = stashes[0]
+        join_code_repo.add(JoinCode(id=code, stash_id=stash.id))
+    else:
+        stash = None
+
+    if not stash:
+        raise HTTPException(status_code=404, detail="No stash with that join code exists.")
+
+    members = member_repo.query([("owner_user_id", "==", current_user.id), ("stash_id", "==", stash.id)], limit=1)
+    if members and members[0].is_active:
+        raise HTTPException(status_code=400, detail="You are already a member of this stash.")
+
+    batch = firestore_wrapper.create_batch()
+
+    if members:
+        member = members[0]
+        member.is_active = True
+        member_repo.batch_update(batch, member)
+    else:
+        member = Member(
+            owner_user_id=current_user.id,
+            stash_id=stash.id,
+            nickname=current_user.username or "New Member",
+            debts={},
+            is_admin=False,
+            is_active=True
+        )
+        stash.member_ids.append(member.id)
+
+        member_repo.batch_add(batch, member)
+        stash_repo.batch_array_union(batch, stash.id, "member_ids", member.id)
+        user_repo.batch_array_union(batch, current_user.id, "member_ids", member.id)
+
     event = Event(
         stash_id=stash.id,
         member_id=member.id,
         type=EventType.SUCCESS,
-        title="Stash Created",
-        message=f"Stash '{stash.name}' created with join code '{stash.join_code}'."
+        title=f"Member '{member.nickname}' Joined",
+        message=f"'{member.nickname}' joined the stash."
     )
-    
-    current_user.member_ids.append(member.id)
-    
-    stash.member_ids.append(member.id)
-    stash.storage_ids.append(storage.id)
-    
-    batch = firestore_wrapper.create_batch()
-    
-    stash_repo.batch_add(batch, stash)
-    storage_repo.batch_add(batch, storage)
-    member_repo.batch_add(batch, member)
     event_repo.batch_add(batch, event)
-    user_repo.batch_update(batch, current_user)
-    
+
     if firestore_wrapper.commit_batch(batch):
         return stash
-    raise HTTPException(status_code=500, detail="Stash creation failed.")
+    raise HTTPException(status_code=500, detail="Joining the stash failed.")
 
 @router.get("/stash/{stash_id}", response_model=Stash)
 def stash_get(stash_id: str, current_user: User = Depends(get_current_user)):
@@ -413,6 +549,20 @@ def stash_update(payload: StashPayload, current_user: User = Depends(get_current
     if not payload.name or payload.name.strip() == "":
         raise HTTPException(status_code=400, detail="Stash name is required.")
 
+    if payload.join_code is not None:
+        if normalize_join_code(payload.join_code) == "":
+            raise HTTPException(status_code=400, detail="Join code cannot be empty.")
+        payload.join_code = normalize_join_code(payload.join_code)
+
+    if payload.event_retention_days is not None and payload.event_retention_days < 0:
+        raise HTTPException(status_code=400, detail="Event retention days cannot be negative.")
+
+    if payload.event_retention_count is not None and payload.event_retention_count < 0:
+        raise HTTPException(status_code=400, detail="Event retention count cannot be negative.")
+
+    if "event_rollup" in payload.model_fields_set and payload.event_rollup is None:
+        raise HTTPException(status_code=400, detail="Event rollup period cannot be empty.")
+
     updated_stash = payload.to_model(stash, preserve=True)
     
     if not (changes := stash.diff(updated_stash)):
@@ -423,16 +573,27 @@ def stash_update(payload: StashPayload, current_user: User = Depends(get_current
         member_id=current_member.id,
         type=EventType.SUCCESS,
         title=f"Stash '{stash.name}' Updated",
-        message=changes_to_string(changes)
+        message=summarize_changes(changes),
+        changes=compact_changes(changes),
+        target_id=stash.id
     )
 
-    batch = firestore_wrapper.create_batch()
-    
-    event_repo.batch_add(batch, event)
-    stash_repo.batch_update(batch, updated_stash)
+    def apply(batch) -> Stash:
+        if "join_code" in changes:
+            # Reserving the new code fails the whole batch if another stash already holds it
+            join_code_repo.batch_create(batch, JoinCode(id=updated_stash.join_code, stash_id=stash.id))
+            if stash.join_code:
+                join_code_repo.batch_delete(batch, normalize_join_code(stash.join_code))
 
-    if firestore_wrapper.commit_batch(batch):
+        event_coalescer.batch_add(batch, event, changes)
+        stash_repo.batch_update(batch, updated_stash)
         return stash
+
+    try:
+        if (updated := firestore_wrapper.run_optimistic(apply, name="stash_update")) is not None:
+            return updated
+    except TransactionConflict:
+        raise HTTPException(status_code=409, detail="Stash was changed by someone else, try again.")
     raise HTTPException(status_code=500, detail="Stash update failed.")
 
 @router.delete("/stash/{stash_id}", response_model=bool)
@@ -452,6 +613,7 @@ def stash_delete(stash_id: str, current_user: User = Depends(get_current_user)):
     stash.purge(batch)
 
     if firestore_wrapper.commit_batch(batch):
+        search_indexes.drop(stash.id)
         return True
     raise HTTPException(status_code=500, detail="Stash deletion failed.")
 
@@ -494,6 +656,7 @@ def stash_get_members(stash_id: str, filter: str, current_user: User = Depends(g
         return stash.get_active_members()
 
 @router.get("/stash/{stash_id}/orders", response_model=List[Order])
+@bulk_list
 def stash_get_orders(stash_id: str, current_user: User = Depends(get_current_user)):
     stash = stash_repo.get(stash_id)
     if not stash:
@@ -505,7 +668,34 @@ def stash_get_orders(stash_id: str, current_user: User = Depends(get_current_use
     return stash.get_orders()
 
 @router.get("/stash/{stash_id}/events", response_model=List[Event])
-def stash_get_events(stash_id: str, current_user: User = Depends(get_current_user)):
+@bulk_list
+def stash_get_events(stash_id: str, limit: Optional[int] = None, after: Optional[datetime] = None, before: Optional[datetime] = None, current_user: User = Depends(get_current_user)):
+    stash = stash_repo.get(stash_id)
+    if not stash:
+        raise HTTPException(status_code=404, detail="Stash not found.")
+
+    if not (current_member := get_current_member(current_user, stash.id)):
+        raise HTTPException(status_code=403, detail="You do not have access to this stash.")
+
+    if limit is not None and limit <= 0:
+        raise HTTPException(status_code=400, detail="Limit must be positive.")
+
+    return stash.get_events(limit=limit, after=as_utc(after), before=as_utc(before))
+
+@router.get("/stash/{stash_id}/events/digests", response_model=List[EventDigest])
+@bulk_list
+def stash_get_event_digests(stash_id: str, current_user: User = Depends(get_current_user)):
+    stash = stash_repo.get(stash_id)
+    if not stash:
+        raise HTTPException(status_code=404, detail="Stash not found.")
+
+    if not (current_member := get_current_member(current_user, stash.id)):
+        raise HTTPException(status_code=403, detail="You do not have access to this stash.")
+
+    return stash.get_event_digests()
+
+@router.post("/stash/{stash_id}/events/compact", response_model=int)
+def stash_compact_events(stash_id: str, current_user: User = Depends(get_current_user)):
     stash = stash_repo.get(stash_id)
     if not stash:
         raise HTTPException(status_code=404, detail="Stash not found.")
@@ -513,10 +703,14 @@ def stash_get_events(stash_id: str, current_user: User = Depends(get_current_use
     if not (current_member := get_current_member(current_user, stash.id)):
         raise HTTPException(status_code=403, detail="You do not have access to this stash.")
 
-    return stash.get_events()
+    if not current_member.is_admin:
+        raise HTTPException(status_code=403, detail="Only admins can compact events.")
+
+    return event_compactor.compact_stash(stash)
 
 @router.get("/stash/{stash_id}/items", response_model=List[Item])
-def stash_get_items(stash_id: str, current_user: User = Depends(get_current_user)):
+@bulk_list
+def stash_get_items(stash_id: str, fields: Optional[str] = None, current_user: User = Depends(get_current_user)):
     stash = stash_repo.get(stash_id)
     if not stash:
         raise HTTPException(status_code=404, detail="Stash not found.")
@@ -524,7 +718,102 @@ def stash_get_items(stash_id: str, current_user: User = Depends(get_current_user
     if not (current_member := get_current_member(current_user, stash.id)):
         raise HTTPException(status_code=403, detail="You do not have access to this stash.")
 
-    return stash.get_items()
+    if (projection := parse_fields(Item, fields)) is None:
+        return stash.get_items()
+    return Projection(stash.get_items(projection))
+
+@router.post("/stash/{stash_id}/items/import", response_model=ItemImportResult)
+async def stash_import_items(stash_id: str, request: Request, current_user: User = Depends(get_current_user)):
+    stash = await run_in_threadpool(stash_repo.get, stash_id)
+    if not stash:
+        raise HTTPException(status_code=404, detail="Stash not found.")
+
+    if not (current_member := await run_in_threadpool(get_current_member, current_user, stash.id)):
+        raise HTTPException(status_code=403, detail="You do not have access to this stash.")
+
+    rows = parse_rows(request.headers.get("content-type", ""), request.stream())
+    return await ItemImporter(stash, current_member).run(rows)
+
+@router.get("/stash/{stash_id}/export", response_class=StreamingResponse)
+def stash_export(stash_id: str, gzip: bool = False, current_user: User = Depends(get_current_user)):
+    stash = stash_repo.get(stash_id)
+    if not stash:
+        raise HTTPException(status_code=404, detail="Stash not found.")
+
+    if not (current_member := get_current_member(current_user, stash.id)):
+        raise HTTPException(status_code=403, detail="You do not have access to this stash.")
+
+    if not current_member.is_admin:
+        raise HTTPException(status_code=403, detail="Only admins can export the stash.")
+
+    filename = f"stash-{stash.id}-{datetime.now(timezone.utc):%Y%m%d}.ndjson" + (".gz" if gzip else "")
+    return StreamingResponse(
+        export_stash(stash, compress=gzip),
+        media_type="application/gzip" if gzip else "application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+@router.post("/stash/restore", response_model=StashRestoreResult)
+async def stash_restore(request: Request, current_user: User = Depends(get_current_user)):
+    return await StashRestorer(current_user).run(request.stream())
+
+@router.get("/stash/{stash_id}/stats", response_model=StashStats)
+def stash_get_stats(stash_id: str, current_user: User = Depends(get_current_user)):
+    stash = stash_repo.get(stash_id)
+    if not stash:
+        raise HTTPException(status_code=404, detail="Stash not found.")
+
+    if not (current_member := get_current_member(current_user, stash.id)):
+        raise HTTPException(status_code=403, detail="You do not have access to this stash.")
+
+    # An 'in' filter takes at most MAX_IN_VALUES values, so items are aggregated per chunk of labels
+    item_filters = [[("label_id", "in", stash.label_ids[start:start + MAX_IN_VALUES])] for start in range(0, len(stash.label_ids), MAX_IN_VALUES)]
+
+    return StashStats(
+        active_member_count=member_repo.count([("stash_id", "==", stash.id), ("is_active", "==", True)]),
+        storage_count=storage_repo.count([("stash_id", "==", stash.id)]),
+        label_count=label_repo.count([("stash_id", "==", stash.id)]),
+        item_count=sum(item_repo.count(filters) for filters in item_filters),
+        order_count=order_repo.count([("stash_id", "==", stash.id)]),
+        event_count=event_repo.count([("stash_id", "==", stash.id)]),
+        total_item_cost=sum((item_repo.sum("cost", filters) for filters in item_filters), 0.0),
+    )
+
+@router.get("/stash/{stash_id}/search", response_model=List[SearchResult])
+@bulk_list
+def stash_search(stash_id: str, q: str, limit: int = 20, kinds: Optional[str] = None, current_user: User = Depends(get_current_user)):
+    stash = stash_repo.get(stash_id)
+    if not stash:
+        raise HTTPException(status_code=404, detail="Stash not found.")
+
+    if not (current_member := get_current_member(current_user, stash.id)):
+        raise HTTPException(status_code=403, detail="You do not have access to this stash.")
+
+    if not q.strip():
+        raise HTTPException(status_code=400, detail="Search query is required.")
+
+    if limit <= 0:
+        raise HTTPException(status_code=400, detail="Limit must be positive.")
+
+    kind_list = [kind.strip() for kind in kinds.split(",") if kind.strip()] if kinds else None
+    if kind_list and (unknown := set(kind_list) - {"item", "label", "storage"}):
+        raise HTTPException(status_code=400, detail=f"Unknown search kinds: {', '.join(sorted(unknown))}.")
+
+    return [SearchResult(**hit._asdict()) for hit in search_indexes.search(stash.id, q, min(limit, 100), kind_list)]
+
+@router.get("/stash/{stash_id}/restock", response_model=RestockPlan)
+def stash_get_restock(stash_id: str, horizon_days: float = DEFAULT_HORIZON_DAYS, current_user: User = Depends(get_current_user)):
+    stash = stash_repo.get(stash_id)
+    if not stash:
+        raise HTTPException(status_code=404, detail="Stash not found.")
+
+    if not (current_member := get_current_member(current_user, stash.id)):
+        raise HTTPException(status_code=403, detail="You do not have access to this stash.")
+
+    if not 0 < horizon_days <= 365:
+        raise HTTPException(status_code=400, detail="Horizon must be between 0 and 365 days.")
+
+    return plan_restock(stash, current_member.id, horizon_days)
 # endregion
 
 # region === Storage API === ===
@@ -565,8 +854,6 @@ def storage_create(payload: StoragePayload, current_user: User = Depends(get_cur
         item_ids=[]
     )
     
-    stash.storage_ids.append(storage.id)
-    
     event = Event(
         stash_id=stash.id,
         member_id=current_member.id,
@@ -578,7 +865,7 @@ def storage_create(payload: StoragePayload, current_user: User = Depends(get_cur
     batch = firestore_wrapper.create_batch()
     
     storage_repo.batch_add(batch, storage)
-    stash_repo.batch_update(batch, stash)
+    stash_repo.batch_array_union(batch, stash.id, "storage_ids", storage.id)
     event_repo.batch_add(batch, event)
     
     if firestore_wrapper.commit_batch(batch):
@@ -626,16 +913,21 @@ def storage_update(payload: StoragePayload, current_user: User = Depends(get_cur
         member_id=current_member.id,
         type=EventType.SUCCESS,
         title=f"Storage '{storage.name}' Updated",
-        message=changes_to_string(changes)
+        message=summarize_changes(changes),
+        changes=compact_changes(changes),
+        target_id=storage.id
     )
     
-    batch = firestore_wrapper.create_batch()
-    
-    event_repo.batch_add(batch, event)
-    storage_repo.batch_update(batch, updated_storage)
-
-    if firestore_wrapper.commit_batch(batch):
+    def apply(batch) -> Storage:
+        event_coalescer.batch_add(batch, event, changes)
+        storage_repo.batch_update(batch, updated_storage)
         return storage
+
+    try:
+        if (updated := firestore_wrapper.run_optimistic(apply, name="storage_update")) is not None:
+            return updated
+    except TransactionConflict:
+        raise HTTPException(status_code=409, detail="Storage was changed by someone else, try again.")
     raise HTTPException(status_code=500, detail="Storage update failed.")
 
 @router.delete("/storage/{storage_id}", response_model=bool)
@@ -680,7 +972,8 @@ def storage_get_stash(storage_id: str, current_user: User = Depends(get_current_
     return stash
 
 @router.get("/storage/{storage_id}/items", response_model=List[Item])
-def storage_get_items(storage_id: str, current_user: User = Depends(get_current_user)):
+@bulk_list
+def storage_get_items(storage_id: str, fields: Optional[str] = None, current_user: User = Depends(get_current_user)):
     storage = storage_repo.get(storage_id)
     if not storage:
         raise HTTPException(status_code=404, detail="Storage not found.")
@@ -692,7 +985,9 @@ def storage_get_items(storage_id: str, current_user: User = Depends(get_current_
     if not (current_member := get_current_member(current_user, stash.id)):
         raise HTTPException(status_code=403, detail="You do not have access to this stash.")
 
-    return storage.get_items()
+    if (projection := parse_fields(Item, fields)) is None:
+        return storage.get_items()
+    return Projection(storage.get_items(projection))
 
 @router.get("/storage/{storage_id}/labels", response_model=List[Label])
 def storage_get_default_labels(storage_id: str, current_user: User = Depends(get_current_user)):
@@ -762,8 +1057,6 @@ def label_create(payload: LabelPayload, current_user: User = Depends(get_current
         food_group=payload.food_group or None,
     )
     
-    stash.label_ids.append(label.id)
-    
     event = Event(
         stash_id=stash.id,
         member_id=current_member.id,
@@ -775,7 +1068,7 @@ def label_create(payload: LabelPayload, current_user: User = Depends(get_current
     batch = firestore_wrapper.create_batch()
     
     label_repo.batch_add(batch, label)
-    stash_repo.batch_update(batch, stash)
+    stash_repo.batch_array_union(batch, stash.id, "label_ids", label.id)
     event_repo.batch_add(batch, event)
     
     if firestore_wrapper.commit_batch(batch):
@@ -823,16 +1116,21 @@ def label_update(payload: LabelPayload, current_user: User = Depends(get_current
         member_id=current_member.id,
         type=EventType.SUCCESS,
         title=f"Label '{label.name}' Updated",
-        message=changes_to_string(changes)
+        message=summarize_changes(changes),
+        changes=compact_changes(changes),
+        target_id=label.id
     )
     
-    batch = firestore_wrapper.create_batch()
-    
-    event_repo.batch_add(batch, event)
-    label_repo.batch_update(batch, updated_label)
-
-    if firestore_wrapper.commit_batch(batch):
+    def apply(batch) -> Label:
+        event_coalescer.batch_add(batch, event, changes)
+        label_repo.batch_update(batch, updated_label)
         return label
+
+    try:
+        if (updated := firestore_wrapper.run_optimistic(apply, name="label_update")) is not None:
+            return updated
+    except TransactionConflict:
+        raise HTTPException(status_code=409, detail="Label was changed by someone else, try again.")
     raise HTTPException(status_code=500, detail="Label update failed.")
 
 @router.delete("/label/{label_id}", response_model=bool)
@@ -892,6 +1190,7 @@ def label_get_default_storage(label_id: str, current_user: User = Depends(get_cu
     return label.get_default_storage()
 
 @router.get("/label/{label_id}/items", response_model=List[Item])
+@bulk_list
 def label_get_items(label_id: str, current_user: User = Depends(get_current_user)):
     label = label_repo.get(label_id)
     if not label:
@@ -980,9 +1279,6 @@ def item_create(payload: ItemPayload, current_user: User = Depends(get_current_u
         expiry_date=payload.expiry_date or None,
     )
     
-    storage.item_ids.append(item.id)
-    label.item_ids.append(item.id)
-    
     event = Event(
         stash_id=stash.id,
         member_id=current_member.id,
@@ -994,8 +1290,8 @@ def item_create(payload: ItemPayload, current_user: User = Depends(get_current_u
     batch = firestore_wrapper.create_batch()
     
     item_repo.batch_add(batch, item)
-    storage_repo.batch_update(batch, storage)
-    label_repo.batch_update(batch, label)
+    storage_repo.batch_array_union(batch, storage.id, "item_ids", item.id)
+    label_repo.batch_array_union(batch, label.id, "item_ids", item.id)
     event_repo.batch_add(batch, event)
     
     if firestore_wrapper.commit_batch(batch):
@@ -1022,71 +1318,90 @@ def item_update(payload: ItemPayload, current_user: User = Depends(get_current_u
     if not payload.id or payload.id.strip() == "":
         raise HTTPException(status_code=400, detail="Item ID is required in payload for update.")
     
-    item = item_repo.get(payload.id)
-    if not item:
-        raise HTTPException(status_code=404, detail="Item not found.")
+    def apply(batch) -> Item:
+        # Read fresh each attempt; the write only lands if the item is still at this version
+        item = item_repo.get(payload.id, fresh=True)
+        if not item:
+            raise HTTPException(status_code=404, detail="Item not found.")
 
-    stash = item.get_stash()
-    if not stash:
-        raise HTTPException(status_code=404, detail="Stash not found.")
+        stash = item.get_stash()
+        if not stash:
+            raise HTTPException(status_code=404, detail="Stash not found.")
 
-    if not (current_member := get_current_member(current_user, stash.id)):
-        raise HTTPException(status_code=403, detail="You do not have access to this stash.")
+        if not (current_member := get_current_member(current_user, stash.id)):
+            raise HTTPException(status_code=403, detail="You do not have access to this stash.")
 
-    if payload.label_id and payload.label_id.strip() != "" and payload.label_id != item.label_id:
-        raise HTTPException(status_code=400, detail="Label cannot be changed once the item is created.")
+        if payload.label_id and payload.label_id.strip() != "" and payload.label_id != item.label_id:
+            raise HTTPException(status_code=400, detail="Label cannot be changed once the item is created.")
 
-    if payload.storage_id and payload.storage_id.strip() != "" and payload.storage_id != item.storage_id:
-        new_storage = storage_repo.get(payload.storage_id)
-        if not new_storage:
-            raise HTTPException(status_code=404, detail="New storage not found.")
+        if payload.storage_id and payload.storage_id.strip() != "" and payload.storage_id != item.storage_id:
+            new_storage = storage_repo.get(payload.storage_id)
+            if not new_storage:
+                raise HTTPException(status_code=404, detail="New storage not found.")
         
-        if new_storage.stash_id != stash.id:
-            raise HTTPException(status_code=400, detail="New storage does not belong to the same stash.")
+            if new_storage.stash_id != stash.id:
+                raise HTTPException(status_code=400, detail="New storage does not belong to the same stash.")
         
-    if payload.buyer_member_id is not None and payload.buyer_member_id.strip() != "":
-        if payload.buyer_member_id != item.buyer_member_id:
-            buyer_member = member_repo.get(payload.buyer_member_id)
-            if not buyer_member or buyer_member.stash_id != stash.id:
-                raise HTTPException(status_code=404, detail="Buyer member not found in the stash.")
+        if payload.buyer_member_id is not None and payload.buyer_member_id.strip() != "":
+            if payload.buyer_member_id != item.buyer_member_id:
+                buyer_member = member_repo.get(payload.buyer_member_id)
+                if not buyer_member or buyer_member.stash_id != stash.id:
+                    raise HTTPException(status_code=404, detail="Buyer member not found in the stash.")
             
-    if payload.total_quantity is not None and payload.total_quantity <= 0:
-        raise HTTPException(status_code=400, detail="Total quantity must be positive.")
+        if payload.total_quantity is not None and payload.total_quantity <= 0:
+            raise HTTPException(status_code=400, detail="Total quantity must be positive.")
     
-    if payload.current_quantity is not None and payload.current_quantity < 0:
-        raise HTTPException(status_code=400, detail="Current quantity cannot be negative.")
+        if payload.current_quantity is not None and payload.current_quantity < 0:
+            raise HTTPException(status_code=400, detail="Current quantity cannot be negative.")
     
-    if payload.allowed_member_usage is not None and len(payload.allowed_member_usage) == 0:
-        raise HTTPException(status_code=400, detail="Must select allowed members.")
+        if payload.allowed_member_usage is not None and len(payload.allowed_member_usage) == 0:
+            raise HTTPException(status_code=400, detail="Must select allowed members.")
     
-    if payload.cost is not None and payload.cost < 0:
-        raise HTTPException(status_code=400, detail="Cost cannot be negative.")
+        if payload.cost is not None and payload.cost < 0:
+            raise HTTPException(status_code=400, detail="Cost cannot be negative.")
     
-    if payload.name is not None and payload.name.strip() == "":
-        raise HTTPException(status_code=400, detail="Item name cannot be empty.")
+        if payload.name is not None and payload.name.strip() == "":
+            raise HTTPException(status_code=400, detail="Item name cannot be empty.")
     
-    updated_item = payload.to_model(item, preserve=True)
+        updated_item = payload.to_model(item, preserve=True)
     
-    if not (changes := item.diff(updated_item)):
-        return item
+        if not (changes := item.diff(updated_item)):
+            return item
     
-    event = Event(
-        stash_id=stash.id,
-        member_id=current_member.id,
-        type=EventType.SUCCESS,
-        title=f"Item '{item.name}' Updated",
-        message=changes_to_string(changes)
-    )
-    
-    batch = firestore_wrapper.create_batch()
-    
-    event_repo.batch_add(batch, event)
-    item_repo.batch_update(batch, updated_item)
+        event = Event(
+            stash_id=stash.id,
+            member_id=current_member.id,
+            type=EventType.SUCCESS,
+            title=f"Item '{item.name}' Updated",
+            message=summarize_changes(changes),
+            changes=compact_changes(changes),
+            target_id=item.id
+        )
     
-    if firestore_wrapper.commit_batch(batch):
+        if (used := item.current_quantity - updated_item.current_quantity) > 0:
+            batch_record_consumption(batch, [(item, used)], stash.id)
+
+        event_coalescer.batch_add(batch, event, changes)
+        item_repo.batch_update(batch, updated_item, if_unchanged=True)
         return item
+
+    try:
+        if (item := firestore_wrapper.run_optimistic(apply, name="item_update")) is not None:
+            return item
+    except TransactionConflict:
+        raise HTTPException(status_code=409, detail="Item was changed by someone else, try again.")
     raise HTTPException(status_code=500, detail="Item update failed.")
 
+@router.post("/items/bulk", response_model=ItemBulkResult)
+def item_bulk(payload: ItemBulkPayload, current_user: User = Depends(get_current_user)):
+    if not payload.operations:
+        raise HTTPException(status_code=400, detail="At least one operation is required.")
+
+    if len(payload.operations) > MAX_OPERATIONS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_OPERATIONS} operations are allowed per request.")
+
+    return run_item_bulk(payload.operations, lambda stash_id: get_current_member(current_user, stash_id))
+
 @router.delete("/item/{item_id}", response_model=bool)
 def item_delete(item_id: str, current_user: User = Depends(get_current_user)):
     item = item_repo.get(item_id)
@@ -1308,16 +1623,21 @@ def order_update(payload: OrderPayload, current_user: User = Depends(get_current
         member_id=current_member.id,
         type=EventType.SUCCESS,
         title=f"Order Updated",
-        message=changes_to_string(changes)
+        message=summarize_changes(changes),
+        changes=compact_changes(changes),
+        target_id=order.id
     )
     
-    batch = firestore_wrapper.create_batch()
-    
-    event_repo.batch_add(batch, event)
-    order_repo.batch_update(batch, updated_order)
-    
-    if firestore_wrapper.commit_batch(batch):
+    def apply(batch) -> Order:
+        event_coalescer.batch_add(batch, event, changes)
+        order_repo.batch_update(batch, updated_order)
         return updated_order
+
+    try:
+        if (updated := firestore_wrapper.run_optimistic(apply, name="order_update")) is not None:
+            return updated
+    except TransactionConflict:
+        raise HTTPException(status_code=409, detail="Order was changed by someone else, try again.")
     raise HTTPException(status_code=500, detail="Order update failed.")
 
 @router.delete("/order/{order_id}", response_model=bool)
@@ -1377,6 +1697,7 @@ def order_get_buyer(order_id: str, current_user: User = Depends(get_current_user
     return order.get_buyer_member()
 
 @router.get("/order/{order_id}/items", response_model=List[Item])
+@bulk_list
 def order_get_items(order_id: str, current_user: User = Depends(get_current_user)):
     order = order_repo.get(order_id)
     if not order:
@@ -1531,4 +1852,16 @@ def event_get_member(event_id: str, current_user: User = Depends(get_current_use
         raise HTTPException(status_code=403, detail="You do not have access to this stash.")
 
     return current_member
+#endregion
+
+# region === Batch API === ===
+@router.post("/batch", response_model=List[BatchResult])
+async def batch(payload: BatchPayload, request: Request, current_user: User = Depends(get_current_user)):
+    if not payload.requests:
+        raise HTTPException(status_code=400, detail="At least one request is required.")
+
+    if len(payload.requests) > MAX_BATCH_REQUESTS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_REQUESTS} requests are allowed per batch.")
+
+    return await batch_dispatcher.run(router, request, payload.requests, current_user)
 #endregion
\ No newline at end of file
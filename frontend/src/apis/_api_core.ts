@@ -1,7 +1,13 @@
+import type { BatchPayload, BatchResult } from "./_schemas";
+
 const BASE = "http://localhost:8000";
+const MSGPACK = "application/msgpack";
+const BATCH_MAX = 20;  // the server's limit per batch
+const BATCH_WINDOW_MS = 4;  // how long a GET waits for others to share its request
 
 /**
  * Makes a GET request to the specified endpoint. Used to fetch resources.
+ * GETs made within a few milliseconds of each other, e.g. while a page mounts, are sent together as one /batch request.
  * @param endpoint The API endpoint to send the GET request to.
  * @param error Optional custom error message if the request fails.
  * @return A promise that resolves to the fetched resource.
@@ -10,6 +16,65 @@ const BASE = "http://localhost:8000";
  * @example
  */
 export async function GET_ENDPOINT<BodyType>(endpoint: string, error?: string): Promise<BodyType> {
+    return new Promise<BodyType>((resolve, reject) => {
+        batchQueue.push({ endpoint, error, resolve: resolve as (value: unknown) => void, reject });
+        if (batchQueue.length >= BATCH_MAX) {
+            flushBatch();
+        } else if (batchTimer === null) {
+            batchTimer = setTimeout(flushBatch, BATCH_WINDOW_MS);
+        }
+    });
+}
+
+interface QueuedGet {
+    endpoint: string;
+    error?: string;
+    resolve: (value: unknown) => void;
+    reject: (reason: Error) => void;
+}
+
+let batchQueue: QueuedGet[] = [];
+let batchTimer: ReturnType<typeof setTimeout> | null = null;
+
+/**
+ * Sends the queued GETs: a lone one on its own, several as one /batch request.
+ * Each caller gets its own result or error, as if it had been sent alone.
+ */
+async function flushBatch(): Promise<void> {
+    if (batchTimer !== null) {
+        clearTimeout(batchTimer);
+        batchTimer = null;
+    }
+    const queued = batchQueue;
+    batchQueue = [];
+    if (queued.length === 1) {
+        const [get] = queued;
+        GET_SINGLE_ENDPOINT(get.endpoint, get.error).then(get.resolve, get.reject);
+        return;
+    }
+
+    let results: BatchResult[];
+    try {
+        results = await POST_ENDPOINT<BatchPayload, BatchResult[]>("/batch", { requests: queued.map(get => ({ path: get.endpoint })) });
+    } catch (e) {
+        queued.forEach(get => get.reject(e as Error));
+        return;
+    }
+    queued.forEach((get, i) => {
+        const { status, body } = results[i];
+        if (status >= 200 && status < 300) {
+            get.resolve(body);
+        } else {
+            const detail = (body as { detail?: string } | null)?.detail;
+            get.reject(new Error(detail || get.error || `GET Request to '${get.endpoint}' Failed`));
+        }
+    });
+}
+
+/**
+ * Makes a GET request on its own, bypassing batching.
+ */
+async function GET_SINGLE_ENDPOINT<BodyType>(endpoint: string, error?: string): Promise<BodyType> {
     const res = await fetch(`${BASE}${endpoint}`, {
         method: "GET",
         credentials: "include",
@@ -26,6 +91,160 @@ export async function GET_ENDPOINT<BodyType>(endpoint: string, error?: string):
     return res.json();
 }
 
+/**
+ * Makes a GET request for a large list, asking the server for MessagePack instead of JSON.
+ * Field names are sent once per response and datetimes as binary timestamps.
+ * Falls back to JSON if the server answers with JSON.
+ * @param endpoint The API endpoint to send the GET request to.
+ * @param error Optional custom error message if the request fails.
+ * @return A promise that resolves to the fetched resource.
+ * @throws An error if the request fails.
+ */
+export async function GET_BULK_ENDPOINT<BodyType>(endpoint: string, error?: string): Promise<BodyType> {
+    const res = await fetch(`${BASE}${endpoint}`, {
+        method: "GET",
+        credentials: "include",
+        headers: { "Accept": `${MSGPACK}; dict=1, application/json;q=0.9` },
+    });
+    if (!res.ok) {
+        let detail = error ? error : `GET Request to '${endpoint}' Failed`;
+        try {
+            const data = await res.json();
+            detail = data.detail || detail;
+        } catch {}
+        throw new Error(detail);
+    }
+    const contentType = res.headers.get("Content-Type") || "";
+    if (!contentType.startsWith(MSGPACK)) {
+        return res.json();
+    }
+    const data = decodeMsgPack(new Uint8Array(await res.arrayBuffer()));
+    return (contentType.includes("dict=1") ? fromColumns(data) : data) as BodyType;
+}
+
+/**
+ * Makes a GET request for a file, e.g. a download, and returns it as a Blob.
+ * @param endpoint The API endpoint to send the GET request to.
+ * @param error Optional custom error message if the request fails.
+ * @return A promise that resolves to the file.
+ * @throws An error if the request fails.
+ */
+export async function GET_BLOB_ENDPOINT(endpoint: string, error?: string): Promise<Blob> {
+    const res = await fetch(`${BASE}${endpoint}`, {
+        method: "GET",
+        credentials: "include",
+    });
+    if (!res.ok) {
+        let detail = error ? error : `GET Request to '${endpoint}' Failed`;
+        try {
+            const data = await res.json();
+            detail = data.detail || detail;
+        } catch {}
+        throw new Error(detail);
+    }
+    return res.blob();
+}
+
+/**
+ * Rebuilds a list of objects sent as a field-name dictionary ({ $keys, $rows }).
+ */
+function fromColumns(data: unknown): unknown {
+    if (!data || typeof data !== "object" || !("$keys" in data) || !("$rows" in data)) return data;
+    const { $keys: keys, $rows: rows } = data as { $keys: string[]; $rows: unknown[][] };
+    return rows.map(row => Object.fromEntries(keys.map((key, i) => [key, row[i]])));
+}
+
+/**
+ * Decodes a MessagePack payload. Timestamps (ext type -1) are returned as ISO strings,
+ * matching the JSON encoding of datetimes.
+ */
+export function decodeMsgPack(bytes: Uint8Array): unknown {
+    const view = new DataView(bytes.buffer, bytes.byteOffset, bytes.byteLength);
+    const text = new TextDecoder();
+    let pos = 0;
+
+    const str = (length: number) => text.decode(bytes.subarray(pos, (pos += length)));
+    const bin = (length: number) => bytes.slice(pos, (pos += length));
+    const array = (length: number) => Array.from({ length }, () => read());
+    const map = (length: number) => {
+        const out: Record<string, unknown> = {};
+        for (let i = 0; i < length; i++) {
+            const key = read();
+            out[String(key)] = read();
+        }
+        return out;
+    };
+    const ext = (length: number) => {
+        const type = view.getInt8(pos++);
+        const start = pos;
+        pos += length;
+        if (type !== -1) return bytes.slice(start, pos);
+        let seconds: number;
+        let nanoseconds = 0;
+        if (length === 4) {
+            seconds = view.getUint32(start);
+        } else if (length === 8) {
+            const high = view.getUint32(start);
+            nanoseconds = high >>> 2;
+            seconds = (high & 0x3) * 2 ** 32 + view.getUint32(start + 4);
+        } else {
+            nanoseconds = view.getUint32(start);
+            seconds = Number(view.getBigInt64(start + 4));
+        }
+        return new Date(seconds * 1000 + nanoseconds / 1e6).toISOString();
+    };
+    const next = <T>(size: number, get: (offset: number) => T) => {
+        const value = get(pos);
+        pos += size;
+        return value;
+    };
+
+    function read(): unknown {
+        const byte = bytes[pos++];
+        if (byte <= 0x7f) return byte;
+        if (byte <= 0x8f) return map(byte & 0x0f);
+        if (byte <= 0x9f) return array(byte & 0x0f);
+        if (byte <= 0xbf) return str(byte & 0x1f);
+        if (byte >= 0xe0) return byte - 0x100;
+        switch (byte) {
+            case 0xc0: return null;
+            case 0xc2: return false;
+            case 0xc3: return true;
+            case 0xc4: return bin(next(1, o => view.getUint8(o)));
+            case 0xc5: return bin(next(2, o => view.getUint16(o)));
+            case 0xc6: return bin(next(4, o => view.getUint32(o)));
+            case 0xc7: return ext(next(1, o => view.getUint8(o)));
+            case 0xc8: return ext(next(2, o => view.getUint16(o)));
+            case 0xc9: return ext(next(4, o => view.getUint32(o)));
+            case 0xca: return next(4, o => view.getFloat32(o));
+            case 0xcb: return next(8, o => view.getFloat64(o));
+            case 0xcc: return next(1, o => view.getUint8(o));
+            case 0xcd: return next(2, o => view.getUint16(o));
+            case 0xce: return next(4, o => view.getUint32(o));
+            case 0xcf: return next(8, o => Number(view.getBigUint64(o)));
+            case 0xd0: return next(1, o => view.getInt8(o));
+            case 0xd1: return next(2, o => view.getInt16(o));
+            case 0xd2: return next(4, o => view.getInt32(o));
+            case 0xd3: return next(8, o => Number(view.getBigInt64(o)));
+            case 0xd4: return ext(1);
+            case 0xd5: return ext(2);
+            case 0xd6: return ext(4);
+            case 0xd7: return ext(8);
+            case 0xd8: return ext(16);
+            case 0xd9: return str(next(1, o => view.getUint8(o)));
+            case 0xda: return str(next(2, o => view.getUint16(o)));
+            case 0xdb: return str(next(4, o => view.getUint32(o)));
+            case 0xdc: return array(next(2, o => view.getUint16(o)));
+            case 0xdd: return array(next(4, o => view.getUint32(o)));
+            case 0xde: return map(next(2, o => view.getUint16(o)));
+            case 0xdf: return map(next(4, o => view.getUint32(o)));
+        }
+        throw new Error(`Invalid MessagePack byte 0x${byte.toString(16)} at ${pos - 1}`);
+    }
+
+    return read();
+}
+
 /**
  * Makes a POST request to the specified endpoint with the provided body. Used to create resources.
  */
@@ -47,6 +266,27 @@ export async function POST_ENDPOINT<BodyType, ReturnType>(endpoint: string, body
     return res.json();
 }
 
+/**
+ * Makes a POST request that sends a file or text as is, e.g. a CSV upload. The browser streams Blob bodies.
+ */
+export async function UPLOAD_ENDPOINT<ReturnType>(endpoint: string, body: Blob | string, contentType: string, error?: string): Promise<ReturnType> {
+    const res = await fetch(`${BASE}${endpoint}`, {
+        method: "POST",
+        credentials: "include",
+        headers: { "Content-Type": contentType },
+        body
+    });
+    if (!res.ok) {
+        let detail = error ? error : `POST Request to '${endpoint}' Failed`;
+        try {
+            const data = await res.json();
+            detail = data.detail || detail;
+        } catch {}
+        throw new Error(detail);
+    }
+    return res.json();
+}
+
 /**
  * Makes a PATCH request to the specified endpoint with the provided body. Used for partial updates.
  */
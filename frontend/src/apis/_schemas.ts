@@ -34,6 +34,13 @@ export const EventType = {
 } as const;
 export type EventType = typeof EventType[keyof typeof EventType];
 
+// === RollupPeriod ===
+export const RollupPeriod = {
+    DAILY: "daily",
+    WEEKLY: "weekly"
+} as const;
+export type RollupPeriod = typeof RollupPeriod[keyof typeof RollupPeriod];
+
 
 
 // === === Responses === ===
@@ -71,6 +78,9 @@ export interface Stash extends BaseDocument {
     storage_ids: string[];
     label_ids: string[];
     join_code: string;
+    event_retention_days?: number;
+    event_retention_count?: number;
+    event_rollup: RollupPeriod;
 }
 
 // === Storage ===
@@ -122,6 +132,108 @@ export interface Event extends BaseDocument {
     type: EventType;
     title: string;
     message?: string;
+    target_id?: string;
+    changes: Record<string, EventChange>; // keyed by changed path, e.g. "name" or "debts.<member_id>"
+    partition: string;
+}
+
+// === Event Change ===
+// Lists report ids added and removed; maps and plain values report old and new.
+// `more` counts entries left out of a long delta.
+export interface EventChange {
+    old?: unknown;
+    new?: unknown;
+    added?: unknown[];
+    removed?: unknown[];
+    more?: number;
+}
+
+// === Event Digest ===
+export interface EventDigest extends BaseDocument {
+    stash_id: string;
+    period: RollupPeriod;
+    period_start: string;
+    period_end: string;
+    count: number;
+    counts_by_type: Record<string, number>;
+    counts_by_member: Record<string, number>;
+}
+
+// === Stash Stats ===
+export interface StashStats {
+    active_member_count: number;
+    storage_count: number;
+    label_count: number;
+    item_count: number;
+    order_count: number;
+    event_count: number;
+    total_item_cost: number;
+}
+
+export interface SearchResult {
+    kind: "item" | "label" | "storage";
+    id: string;
+    field: string;
+    text: string;
+    score: number;
+}
+
+export interface RestockRecommendation {
+    label_id: string;
+    label_name: string;
+    unit?: string;
+    in_stock: number;
+    daily_rate: number;
+    days_left: number;
+    runs_out_at: string;
+    suggested_quantity: number;
+    samples: number;
+}
+
+export interface RestockPlan {
+    horizon_days: number;
+    recommendations: RestockRecommendation[];
+    order: Order;
+}
+
+export interface ItemImportError {
+    row: number;
+    error: string;
+}
+
+export interface ItemImportResult {
+    imported: number;
+    failed: number;
+    item_ids: string[];
+    errors: ItemImportError[];
+}
+
+export interface StashRestoreResult {
+    stash_id: string;
+    restored: Record<string, number>;
+    skipped: number;
+    failed: number;
+    complete: boolean;
+    errors: string[];
+}
+
+export interface ItemBulkOperationResult {
+    index: number;
+    item_id: string;
+    status: number;
+    error: string | null;
+    item: Item | null;
+}
+
+export interface ItemBulkResult {
+    succeeded: number;
+    failed: number;
+    results: ItemBulkOperationResult[];
+}
+
+export interface BatchResult {
+    status: number;
+    body: unknown;
 }
 
 
@@ -160,6 +272,9 @@ export interface StashPayload extends BasePayload {
     storage_ids?: string[];
     label_ids?: string[];
     join_code?: string;
+    event_retention_days?: number;
+    event_retention_count?: number;
+    event_rollup?: RollupPeriod;
 }
 
 // === Storage ===
@@ -204,6 +319,25 @@ export interface OrderPayload extends BasePayload {
     item_ids?: string[];
 }
 
+// === Item Bulk ===
+export interface ItemBulkOperation {
+    action: "move" | "consume" | "delete";
+    item_id: string;
+    storage_id?: string;
+    quantity?: number;
+}
+
+// === Batch ===
+export interface BatchRequest {
+    method?: "GET" | "POST" | "PATCH" | "DELETE";
+    path: string;
+    body?: unknown;
+}
+
+export interface BatchPayload {
+    requests: BatchRequest[];
+}
+
 // === Event ===
 export interface EventPayload extends BasePayload {
     stash_id?: string;
@@ -1,5 +1,5 @@
-import { GET_ENDPOINT, POST_ENDPOINT, PATCH_ENDPOINT, DELETE_ENDPOINT } from "./_api_core";
-import type { BaseDocument, User, Member, Stash, Label, Storage, Item, Event, Order } from "./_schemas";
+import { GET_ENDPOINT, GET_BULK_ENDPOINT, POST_ENDPOINT, PATCH_ENDPOINT, DELETE_ENDPOINT, UPLOAD_ENDPOINT, GET_BLOB_ENDPOINT } from "./_api_core";
+import type { BaseDocument, User, Member, Stash, Label, Storage, Item, Event, EventDigest, Order, StashStats, SearchResult, RestockPlan, ItemImportResult, StashRestoreResult, ItemBulkOperation, ItemBulkResult } from "./_schemas";
 import type { BasePayload, UserPayload, MemberPayload, StashPayload, LabelPayload, StoragePayload, ItemPayload, EventPayload, OrderPayload } from "./_schemas";
 
 // === === API Methods === ===
@@ -178,7 +178,7 @@ export class MemberAPI extends BaseAPI {
      * @returns A promise that resolves to an array of bought items.
      */
     static async get_bought_items(id: string): Promise<Item[]> {
-        return await GET_ENDPOINT<Item[]>(`/${this.endpoint}/${id}/items/bought`);
+        return await GET_BULK_ENDPOINT<Item[]>(`/${this.endpoint}/${id}/items/bought`);
     }
 
     /**
@@ -187,7 +187,7 @@ export class MemberAPI extends BaseAPI {
      * @returns A promise that resolves to an array of used items.
      */
     static async get_used_items(id: string): Promise<Item[]> {
-        return await GET_ENDPOINT<Item[]>(`/${this.endpoint}/${id}/items/used`);
+        return await GET_BULK_ENDPOINT<Item[]>(`/${this.endpoint}/${id}/items/used`);
     }
 
     /**
@@ -196,7 +196,7 @@ export class MemberAPI extends BaseAPI {
      * @returns A promise that resolves to an array of orders.
      */
     static async get_orders(id: string): Promise<Order[]> {
-        return await GET_ENDPOINT<Order[]>(`/${this.endpoint}/${id}/orders`);
+        return await GET_BULK_ENDPOINT<Order[]>(`/${this.endpoint}/${id}/orders`);
     }
 
     /**
@@ -205,7 +205,7 @@ export class MemberAPI extends BaseAPI {
      * @returns A promise that resolves to an array of events.
      */
     static async get_events(id: string): Promise<Event[]> {
-        return await GET_ENDPOINT<Event[]>(`/${this.endpoint}/${id}/events`);
+        return await GET_BULK_ENDPOINT<Event[]>(`/${this.endpoint}/${id}/events`);
     }
 }
 
@@ -233,6 +233,15 @@ export class StashAPI extends BaseAPI {
 
     // === Additional Stash-Specific Methods ===
 
+    /**
+     * Join a stash using its join code. Creates (or reactivates) the current user's member.
+     * @param code The join code shared by a stash member.
+     * @returns A promise that resolves to the joined stash.
+     */
+    static async join(code: string): Promise<Stash> {
+        return await POST_ENDPOINT<null, Stash>(`/${this.endpoint}/join/${encodeURIComponent(code.trim())}`, null);
+    }
+
     /**
      * Get all labels in a stash.
      * @param id The stash ID to get labels for.
@@ -275,25 +284,119 @@ export class StashAPI extends BaseAPI {
      * @returns A promise that resolves to an array of orders.
      */
     static async get_orders(id: string): Promise<Order[]> {
-        return await GET_ENDPOINT<Order[]>(`/${this.endpoint}/${id}/orders`);
+        return await GET_BULK_ENDPOINT<Order[]>(`/${this.endpoint}/${id}/orders`);
     }
 
     /**
-     * Get all events in a stash.
+     * Get the events in a stash, newest first.
      * @param id The stash ID to get events for.
+     * @param range Optional page size and created_at bounds (`after` inclusive, `before` exclusive).
+     * Pass the `created_at` of the last event as `before` to get the next page.
      * @returns A promise that resolves to an array of events.
      */
-    static async get_events(id: string): Promise<Event[]> {
-        return await GET_ENDPOINT<Event[]>(`/${this.endpoint}/${id}/events`);
+    static async get_events(id: string, range?: { limit?: number; after?: string; before?: string }): Promise<Event[]> {
+        const params = new URLSearchParams();
+        Object.entries(range ?? {}).forEach(([key, value]) => value !== undefined && params.set(key, String(value)));
+        const query = params.toString() ? `?${params}` : "";
+        return await GET_BULK_ENDPOINT<Event[]>(`/${this.endpoint}/${id}/events${query}`);
+    }
+
+    /**
+     * Get the digests that older events of a stash were compacted into, newest first.
+     * @param id The stash ID to get event digests for.
+     * @returns A promise that resolves to an array of event digests.
+     */
+    static async get_event_digests(id: string): Promise<EventDigest[]> {
+        return await GET_BULK_ENDPOINT<EventDigest[]>(`/${this.endpoint}/${id}/events/digests`);
+    }
+
+    /**
+     * Apply the stash's event retention policy now instead of waiting for the background job. Admins only.
+     * @param id The stash ID to compact events for.
+     * @returns A promise that resolves to the number of events compacted.
+     */
+    static async compact_events(id: string): Promise<number> {
+        return await POST_ENDPOINT<null, number>(`/${this.endpoint}/${id}/events/compact`, null);
     }
 
     /**
      * Get all items in a stash.
      * @param id The stash ID to get items for.
+     * @param fields Optional subset of item fields to fetch. `id` is always included.
      * @returns A promise that resolves to an array of items.
      */
-    static async get_items(id: string): Promise<Item[]> {
-        return await GET_ENDPOINT<Item[]>(`/${this.endpoint}/${id}/items`);
+    static async get_items<K extends keyof Item = keyof Item>(id: string, fields?: K[]): Promise<Pick<Item, K | "id">[]> {
+        const query = fields ? `?fields=${fields.join(",")}` : "";
+        return await GET_BULK_ENDPOINT<Pick<Item, K | "id">[]>(`/${this.endpoint}/${id}/items${query}`);
+    }
+
+    /**
+     * Create many items at once from a CSV file (with a header row) or NDJSON, one item per row.
+     * Rows name their label and storage by id (`label_id`, `storage_id`) or by name (`label`, `storage`).
+     * In CSV, `allowed_member_ids` are separated by `;`.
+     * @param id The stash ID to import into.
+     * @param data The file or text to upload.
+     * @param format The format of `data`.
+     * @returns A promise that resolves to the number of imported and failed rows, with the first errors by line number.
+     */
+    static async import_items(id: string, data: Blob | string, format: "csv" | "ndjson"): Promise<ItemImportResult> {
+        const contentType = format === "csv" ? "text/csv" : "application/x-ndjson";
+        return await UPLOAD_ENDPOINT<ItemImportResult>(`/${this.endpoint}/${id}/items/import`, data, contentType);
+    }
+
+    /**
+     * Download a backup of everything in a stash, as NDJSON. Admins only.
+     * @param id The stash ID to export.
+     * @param gzip Optional; compress the backup.
+     * @returns A promise that resolves to the backup file.
+     */
+    static async export(id: string, gzip?: boolean): Promise<Blob> {
+        return await GET_BLOB_ENDPOINT(`/${this.endpoint}/${id}/export${gzip ? "?gzip=true" : ""}`);
+    }
+
+    /**
+     * Restore a stash from a backup made by `export`, plain or gzipped. Restoring the same backup
+     * again is safe. Requires being an admin of the stash, or of the backed-up stash if it was deleted.
+     * @param backup The backup file.
+     * @returns A promise that resolves to the number of documents restored per collection and any problems.
+     */
+    static async restore(backup: Blob): Promise<StashRestoreResult> {
+        return await UPLOAD_ENDPOINT<StashRestoreResult>(`/${this.endpoint}/restore`, backup, "application/x-ndjson");
+    }
+
+    /**
+     * Get counts and totals for a stash without fetching its collections.
+     * @param id The stash ID to get stats for.
+     * @returns A promise that resolves to the stash stats.
+     */
+    static async get_stats(id: string): Promise<StashStats> {
+        return await GET_ENDPOINT<StashStats>(`/${this.endpoint}/${id}/stats`);
+    }
+
+    /**
+     * Search the names of a stash's items, labels and storages, tolerating typos.
+     * @param id The stash ID to search in.
+     * @param q The search text.
+     * @param limit Optional maximum number of results (default 20, at most 100).
+     * @param kinds Optional kinds to search, e.g. `["item"]`.
+     * @returns A promise that resolves to the matches, best first.
+     */
+    static async search(id: string, q: string, limit?: number, kinds?: SearchResult["kind"][]): Promise<SearchResult[]> {
+        const params = new URLSearchParams({ q });
+        if (limit !== undefined) params.set("limit", String(limit));
+        if (kinds?.length) params.set("kinds", kinds.join(","));
+        return await GET_BULK_ENDPOINT<SearchResult[]>(`/${this.endpoint}/${id}/search?${params}`);
+    }
+
+    /**
+     * Predict when each label runs out from how fast its items have been used, with a draft order.
+     * @param id The stash ID to plan for.
+     * @param horizon_days Optional number of days the suggested quantities should last (default 14).
+     * @returns A promise that resolves to the recommendations, soonest to run out first, and an unsaved order.
+     */
+    static async get_restock(id: string, horizon_days?: number): Promise<RestockPlan> {
+        const query = horizon_days !== undefined ? `?horizon_days=${horizon_days}` : "";
+        return await GET_ENDPOINT<RestockPlan>(`/${this.endpoint}/${id}/restock${query}`);
     }
 }
 
@@ -333,10 +436,12 @@ export class StorageAPI extends BaseAPI {
     /**
      * Get all items in a storage.
      * @param id The storage ID to get items for.
+     * @param fields Optional subset of item fields to fetch. `id` is always included.
      * @returns A promise that resolves to an array of items.
      */
-    static async get_items(id: string): Promise<Item[]> {
-        return await GET_ENDPOINT<Item[]>(`/${this.endpoint}/${id}/items`);
+    static async get_items<K extends keyof Item = keyof Item>(id: string, fields?: K[]): Promise<Pick<Item, K | "id">[]> {
+        const query = fields ? `?fields=${fields.join(",")}` : "";
+        return await GET_BULK_ENDPOINT<Pick<Item, K | "id">[]>(`/${this.endpoint}/${id}/items${query}`);
     }
 
     /**
@@ -397,7 +502,7 @@ export class LabelAPI extends BaseAPI {
      * @returns A promise that resolves to an array of items.
      */
     static async get_items(id: string): Promise<Item[]> {
-        return await GET_ENDPOINT<Item[]>(`/${this.endpoint}/${id}/items`);
+        return await GET_BULK_ENDPOINT<Item[]>(`/${this.endpoint}/${id}/items`);
     }
 }
 
@@ -473,6 +578,15 @@ export class ItemAPI extends BaseAPI {
     static async get_order(id: string): Promise<Order | null> {
         return await GET_ENDPOINT<Order | null>(`/${this.endpoint}/${id}/order`);
     }
+
+    /**
+     * Move, consume or delete many items in one request.
+     * @param operations The operations to apply, at most 500, each targeting a different item.
+     * @returns A promise that resolves to the outcome of every operation, in request order.
+     */
+    static async bulk(operations: ItemBulkOperation[]): Promise<ItemBulkResult> {
+        return await POST_ENDPOINT<{ operations: ItemBulkOperation[] }, ItemBulkResult>(`/items/bulk`, { operations });
+    }
 }
 
 // === Order ===
@@ -523,7 +637,7 @@ export class OrderAPI extends BaseAPI {
      * @returns A promise that resolves to an array of items in the order.
      */
     static async get_items(id: string): Promise<Item[]> {
-        return await GET_ENDPOINT<Item[]>(`/${this.endpoint}/${id}/items`);
+        return await GET_BULK_ENDPOINT<Item[]>(`/${this.endpoint}/${id}/items`);
     }
 }
 
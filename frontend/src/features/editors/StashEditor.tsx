@@ -1,6 +1,6 @@
 import { useEffect, useState } from "react";
 
-import type { Stash, Member, Label, Storage } from "@/apis/_schemas";
+import type { Stash, Member, Label, Storage, Event } from "@/apis/_schemas";
 import { StashAPI } from "@/apis/repo_api";
 
 import ButtonField from "@/components/fields/ButtonField";
@@ -15,6 +15,7 @@ import GenericList from "../list/GenericList";
 import RenderMemberTile from "../list/RenderMemberTile";
 import RenderLabelTile from "../list/RenderLabelTile";
 import RenderStorageTile from "../list/RenderStorageTile";
+import RenderEventTile from "../list/RenderEventTile";
 
 type StashEditorProps = {
     showEditor: boolean;
@@ -32,6 +33,7 @@ export function StashEditor({ showEditor, setShowEditor, refresh }: StashEditorP
     const [members, setMembers] = useState<Member[]>([]);
     const [labels, setLabels] = useState<Label[]>([]);
     const [storages, setStorages] = useState<Storage[]>([]);
+    const [events, setEvents] = useState<Event[]>([]);
 
     const [loading, setLoading] = useState<boolean>(true);
     const [tabNumber, setTabNumber] = useState<number>(0);
@@ -39,6 +41,7 @@ export function StashEditor({ showEditor, setShowEditor, refresh }: StashEditorP
     const [selectedMemberIds, setSelectedMemberIds] = useState<string[]>([]);
     const [selectedLabelIds, setSelectedLabelIds] = useState<string[]>([]);
     const [selectedStorageIds, setSelectedStorageIds] = useState<string[]>([]);
+    const [selectedEventIds, setSelectedEventIds] = useState<string[]>([]);
 
 
     const fetchStashDetails = async (refresh: boolean = false) => {
@@ -48,11 +51,13 @@ export function StashEditor({ showEditor, setShowEditor, refresh }: StashEditorP
             const memberResponse: Member[] = await loader.fetch_members(refresh);
             const labelResponse: Label[] = await loader.fetch_labels(refresh);
             const storageResponse: Storage[] = await loader.fetch_storages(refresh);
+            const eventResponse: Event[] = await loader.fetch_events(refresh);
 
             setStash(stashResponse);
             setMembers(memberResponse);
             setLabels(labelResponse);
             setStorages(storageResponse);
+            setEvents(eventResponse);
 
             const currentMember = await loader.fetch_current_member();
             setCurrentMember(currentMember);
@@ -138,7 +143,7 @@ export function StashEditor({ showEditor, setShowEditor, refresh }: StashEditorP
             ) : stash ? (
                 <div className="w-100 gap-3 d-flex flex-row">
                     <TabGroup
-                        tabNames={["General", "Members", "Labels", "Storages"]}
+                        tabNames={["General", "Members", "Labels", "Storages", "Events"]}
                         tabNumber={tabNumber}
                         setTabNumber={setTabNumber}
                         className="col-3 col-md-2"
@@ -249,6 +254,23 @@ export function StashEditor({ showEditor, setShowEditor, refresh }: StashEditorP
                             </>
                         )}
 
+                        {tabNumber === 4 && (
+                            <>
+                                <GenericList<Event>
+                                    items={events}
+                                    onRefresh={() => fetchStashDetails(true)}
+                                    renderTile={RenderEventTile}
+                                    searchBar
+                                    selectedItemIds={selectedEventIds}
+                                    setSelectedItemIds={setSelectedEventIds}
+                                    getItemName={(event) => event.title}
+                                    defaultLimit={8}
+                                    pagination
+                                    defaultView="list"
+                                />
+                            </>
+                        )}
+
                         <div className="d-flex flex-row gap-3 my-2">
                             <ButtonField
                                 onClick={() => setShowEditor(false)}
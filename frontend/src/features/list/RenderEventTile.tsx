@@ -0,0 +1,57 @@
+import type { Event, EventChange } from "@/apis/_schemas";
+import ButtonField from "@/components/fields/ButtonField";
+
+const formatValue = (value: unknown) => {
+    if (value === null || value === undefined || value === "") {
+        return "none";
+    }
+    return String(value);
+};
+
+const describeChange = (change: EventChange) => {
+    if (change.added !== undefined || change.removed !== undefined) {
+        const parts = [];
+        if (change.added?.length) parts.push(`added ${change.added.map(formatValue).join(", ")}`);
+        if (change.removed?.length) parts.push(`removed ${change.removed.map(formatValue).join(", ")}`);
+        if (change.more) parts.push(`and ${change.more} more`);
+        return parts.join("; ");
+    }
+    if (change.old === undefined && change.new === undefined) {
+        return `${change.more ?? 0} more changes`;
+    }
+    return `${formatValue(change.old)} → ${formatValue(change.new)}`;
+};
+
+const RenderEventTile = (event: Event, onClick: (event: Event) => void, _openEditor?: (event: Event) => void, isSelected?: boolean, view: "grid" | "list" = "list") => {
+
+    const changes = Object.entries(event.changes ?? {});
+
+    return (
+        <div className={view === "grid" ? "ratio ratio-4x3" : "w-100"}>
+            <ButtonField
+                onClick={() => onClick(event)}
+                rounding="3"
+                color={isSelected ? "primary" : "dark"}
+                className={`w-100 h-100 m-2 p-3 rounded-3 text-light border border-${event.type} border-2`}
+            >
+                <div className={`w-100 d-flex text-light flex-column text-start gap-1`}>
+                    <div className={`d-flex flex-row gap-1 justify-content-between`}>
+                        <h5 className="m-0">{event.title}</h5>
+                        <p className="m-0 text-muted"><small>{new Date(event.updated_at).toLocaleString()}</small></p>
+                    </div>
+                    {changes.length > 0 ? (
+                        <ul className="m-0 ps-3">
+                            {changes.map(([path, change]) => (
+                                <li key={path}><small><strong>{path}</strong>: {describeChange(change)}</small></li>
+                            ))}
+                        </ul>
+                    ) : (
+                        <p className="m-0"><small>{event.message}</small></p>
+                    )}
+                </div>
+            </ButtonField>
+        </div>
+    );
+};
+
+export default RenderEventTile;
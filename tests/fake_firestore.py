@@ -0,0 +1,420 @@
+import copy
+import uuid
+import itertools
+import unittest
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional, Tuple
+
+from google.api_core.exceptions import Aborted, AlreadyExists, FailedPrecondition, NotFound
+from google.cloud import firestore
+from google.cloud.firestore_v1 import transforms
+
+from backend.database.firestore_wrapper import firestore_wrapper
+
+# === Config ===
+DOCUMENTS_PREFIX = "projects/test/databases/(default)/documents/"
+
+_versions = itertools.count(1)  # stands in for update_time; every write gets a new one
+
+
+# === === Paths === ===
+
+def _get_path(data: Optional[Dict[str, Any]], path: str) -> Tuple[Any, bool]:
+    current: Any = data
+    for part in path.split("."):
+        if not isinstance(current, dict) or part not in current:
+            return None, False
+        current = current[part]
+    return current, True
+
+
+def _apply(data: Dict[str, Any], key: str, value: Any) -> None:
+    if value is firestore.DELETE_FIELD:
+        data.pop(key, None)
+    elif isinstance(value, transforms.ArrayUnion):
+        values = data.get(key) or []
+        data[key] = values + [v for v in value.values if v not in values]
+    elif isinstance(value, transforms.ArrayRemove):
+        data[key] = [v for v in (data.get(key) or []) if v not in value.values]
+    elif isinstance(value, transforms.Increment):
+        data[key] = (data.get(key) or 0) + value.value
+    elif value is firestore.SERVER_TIMESTAMP:
+        data[key] = datetime.now(timezone.utc)
+    else:
+        data[key] = copy.deepcopy(value)
+
+
+def _set_path(data: Dict[str, Any], path: str, value: Any) -> None:
+    # update() takes dotted field paths
+    *parents, last = path.split(".")
+    for part in parents:
+        data = data.setdefault(part, {})
+    _apply(data, last, value)
+
+
+def _merge(data: Dict[str, Any], values: Dict[str, Any]) -> None:
+    # set() takes field names; with merge, nested maps are merged key by key
+    for key, value in values.items():
+        if isinstance(value, dict) and value:
+            if not isinstance(data.get(key), dict):
+                data[key] = {}
+            _merge(data[key], value)
+        else:
+            _apply(data, key, value)
+
+
+def _matches(data: Dict[str, Any], field: str, op: str, value: Any) -> bool:
+    current, found = _get_path(data, field)
+    if op == "==":
+        return found and current == value
+    if op == "!=":
+        return found and current != value
+    if op == "in":
+        return found and current in value
+    if op == "not-in":
+        return found and current not in value
+    if op == "array_contains":
+        return found and isinstance(current, list) and value in current
+    if op == "array_contains_any":
+        return found and isinstance(current, list) and any(v in current for v in value)
+    if not found or current is None:
+        return False
+    return {"<": current < value, "<=": current <= value, ">": current > value, ">=": current >= value}[op]
+
+
+# === === Documents === ===
+
+class FakeSnapshot:
+    def __init__(self, reference: "FakeDocument", data: Optional[Dict[str, Any]], update_time: Optional[int]):
+        self.reference = reference
+        self.id = reference.id
+        self.exists = data is not None
+        self.update_time = update_time
+        self.create_time = update_time
+        self._data = data
+
+    def to_dict(self) -> Optional[Dict[str, Any]]:
+        return copy.deepcopy(self._data)
+
+    def get(self, field: str) -> Any:
+        return _get_path(self._data, field)[0]
+
+
+class FakeDocument:
+    def __init__(self, client: "FakeClient", path: str):
+        self._client = client
+        self.path = path
+        self.id = path.rpartition("/")[2]
+
+    def collection(self, name: str) -> "FakeCollection":
+        return FakeCollection(self._client, f"{self.path}/{name}")
+
+    def get(self, field_paths=None, transaction=None) -> FakeSnapshot:
+        self._client.reads += 1
+        if transaction is not None:
+            transaction._seen[self.path] = self._client.version(self.path)
+        data, version = self._client.docs.get(self.path, (None, None))
+        if data is not None and field_paths is not None:
+            data = {key: value for key, value in data.items() if key in {path.split(".")[0] for path in field_paths}}
+        return FakeSnapshot(self, copy.deepcopy(data), version)
+
+    def create(self, data: Dict[str, Any]) -> SimpleNamespace:
+        if self.path in self._client.docs:
+            raise AlreadyExists(f"{self.path} already exists")
+        return self.set(data)
+
+    def set(self, data: Dict[str, Any], merge: bool = False) -> SimpleNamespace:
+        stored = copy.deepcopy(self._client.docs[self.path][0]) if merge and self.path in self._client.docs else {}
+        _merge(stored, data)
+        return self._client.store(self.path, stored)
+
+    def update(self, data: Dict[str, Any], option=None) -> SimpleNamespace:
+        self._check(option)
+        if self.path not in self._client.docs:
+            raise NotFound(f"No document to update: {self.path}")
+        stored = copy.deepcopy(self._client.docs[self.path][0])
+        for path, value in data.items():
+            _set_path(stored, path, value)
+        return self._client.store(self.path, stored)
+
+    def delete(self, option=None) -> SimpleNamespace:
+        if option is not None and option.exists and self.path not in self._client.docs:
+            raise NotFound(f"No document to delete: {self.path}")
+        self._check(option)
+        self._client.docs.pop(self.path, None)
+        return SimpleNamespace(update_time=None)
+
+    def _check(self, option) -> None:
+        if option is not None and option.last_update_time is not None and self._client.version(self.path) != option.last_update_time:
+            raise FailedPrecondition(f"{self.path} changed since it was read")
+
+
+# === === Queries === ===
+
+class FakeQuery:
+    def __init__(self, client: "FakeClient", path: str, group: bool = False, filters=(), order=(), limit=None, fields=None, start=None):
+        self._client = client
+        self._path = path
+        self._group = group
+        self._filters = list(filters)
+        self._order = list(order)
+        self._limit = limit
+        self._fields = fields
+        self._start = start
+
+    def _copy(self, **changes: Any) -> "FakeQuery":
+        state = dict(group=self._group, filters=self._filters, order=self._order, limit=self._limit, fields=self._fields, start=self._start)
+        return FakeQuery(self._client, self._path, **{**state, **changes})
+
+    def where(self, field_path=None, op_string=None, value=None, filter=None) -> "FakeQuery":
+        if filter is not None:
+            field_path, op_string, value = filter.field_path, filter.op_string, filter.value
+        return self._copy(filters=self._filters + [(field_path, op_string, value)])
+
+    def order_by(self, field_path: str, direction: str = "ASCENDING") -> "FakeQuery":
+        return self._copy(order=self._order + [(field_path, direction)])
+
+    def limit(self, count: int) -> "FakeQuery":
+        return self._copy(limit=count)
+
+    def select(self, field_paths) -> "FakeQuery":
+        return self._copy(fields=list(field_paths))
+
+    def start_after(self, snapshot) -> "FakeQuery":
+        return self._copy(start=snapshot)
+
+    def _matching(self) -> List[Tuple[str, Dict[str, Any], int]]:
+        found = []
+        for path, (data, version) in list(self._client.docs.items()):
+            parent = path.rpartition("/")[0]
+            if (parent.rpartition("/")[2] if self._group else parent) != self._path:
+                continue
+            if all(_matches(data, *condition) for condition in self._filters):
+                found.append((path, data, version))
+        for field, direction in reversed(self._order):
+            if field == "__name__":
+                key = lambda entry: (False, entry[0].rpartition("/")[2])
+            else:
+                key = lambda entry, field=field: (_get_path(entry[1], field)[0] is None, _get_path(entry[1], field)[0])
+            found.sort(key=key, reverse=str(direction).upper().startswith("DESC"))
+        if self._start is not None:
+            ids = [path.rpartition("/")[2] for path, _, _ in found]
+            if self._start.id in ids:
+                found = found[ids.index(self._start.id) + 1:]
+        return found[:self._limit] if self._limit else found
+
+    def stream(self, transaction=None):
+        for path, data, version in self._matching():
+            self._client.reads += 1
+            data = copy.deepcopy(data)
+            if self._fields is not None:
+                data = {key: value for key, value in data.items() if key in self._fields}
+            yield FakeSnapshot(FakeDocument(self._client, path), data, version)
+
+    def get(self, transaction=None) -> List[FakeSnapshot]:
+        return list(self.stream(transaction))
+
+    def count(self, alias=None) -> "FakeAggregation":
+        return FakeAggregation(self, "count", None, alias)
+
+    def sum(self, field_ref, alias=None) -> "FakeAggregation":
+        return FakeAggregation(self, "sum", field_ref, alias)
+
+    def avg(self, field_ref, alias=None) -> "FakeAggregation":
+        return FakeAggregation(self, "avg", field_ref, alias)
+
+
+class FakeAggregation:
+    def __init__(self, query: FakeQuery, kind: str, field: Optional[str], alias: Optional[str]):
+        self._query = query
+        self._kind = kind
+        self._field = field
+        self._alias = alias
+
+    def get(self, transaction=None):
+        self._query._client.reads += 1
+        self._query._client.aggregations.append(self._query._filters)
+        for field, op, value in self._query._filters:
+            if op in ("in", "not-in", "array_contains_any") and len(value) > 30:
+                raise ValueError(f"'{op}' filters support up to 30 values")
+        matching = self._query._matching()
+        numbers = [value for _, data, _ in matching if isinstance(value := _get_path(data, self._field)[0], (int, float))] if self._field else []
+        if self._kind == "count":
+            value = len(matching)
+        elif self._kind == "sum":
+            value = sum(numbers)
+        else:
+            value = sum(numbers) / len(numbers) if numbers else None
+        return [[SimpleNamespace(alias=self._alias, value=value)]]
+
+
+class FakeCollection(FakeQuery):
+    def __init__(self, client: "FakeClient", path: str):
+        super().__init__(client, path)
+        self.id = path.rpartition("/")[2]
+
+    def document(self, document_id: Optional[str] = None) -> FakeDocument:
+        return FakeDocument(self._client, f"{self._path}/{document_id or uuid.uuid4().hex}")
+
+    def list_documents(self) -> List[FakeDocument]:
+        return [FakeDocument(self._client, path) for path in list(self._client.docs) if path.rpartition("/")[0] == self._path]
+
+
+# === === Writes === ===
+
+class FakeBatch:
+    """
+    Applies its writes in order on commit, all or nothing, like a WriteBatch.
+    """
+
+    def __init__(self, client: "FakeClient"):
+        self._client = client
+        self._operations = []
+        self._write_pbs = []  # read by FirestoreWrapper._write_targets
+
+    def _queue(self, reference: FakeDocument, operation, delete: bool = False) -> None:
+        name = DOCUMENTS_PREFIX + reference.path
+        self._write_pbs.append(SimpleNamespace(delete=name if delete else "", update=SimpleNamespace(name="" if delete else name)))
+        self._operations.append(operation)
+
+    def set(self, reference, data, merge=False) -> None:
+        self._queue(reference, lambda: reference.set(data, merge=merge))
+
+    def create(self, reference, data) -> None:
+        self._queue(reference, lambda: reference.create(data))
+
+    def update(self, reference, data, option=None) -> None:
+        self._queue(reference, lambda: reference.update(data, option=option))
+
+    def delete(self, reference, option=None) -> None:
+        self._queue(reference, lambda: reference.delete(option=option), delete=True)
+
+    def __len__(self) -> int:
+        return len(self._operations)
+
+    def commit(self) -> List[SimpleNamespace]:
+        if len(self._operations) > 500:
+            raise ValueError("A batch can contain at most 500 writes")
+        before = dict(self._client.docs)
+        try:
+            results = [operation() for operation in self._operations]
+        except Exception:
+            self._client.docs.clear()
+            self._client.docs.update(before)
+            raise
+        finally:
+            self._operations, self._write_pbs = [], []
+        self._client.commits += 1
+        return results
+
+
+class FakeTransaction(FakeBatch):
+    """
+    Optimistic: remembers the versions it read and aborts the commit if any of them changed.
+    """
+
+    def __init__(self, client: "FakeClient", max_attempts: int = 5):
+        super().__init__(client)
+        self._max_attempts = max_attempts
+        self._read_only = False
+        self._id = None
+        self._seen: Dict[str, Optional[int]] = {}
+        self.write_results = None
+
+    @property
+    def in_progress(self) -> bool:
+        return self._id is not None
+
+    def _clean_up(self) -> None:
+        self._operations, self._write_pbs, self._seen, self._id = [], [], {}, None
+
+    def _begin(self, retry_id=None) -> None:
+        self._id = b"transaction-%d" % next(_versions)
+
+    def _rollback(self) -> None:
+        self._clean_up()
+
+    def _commit(self) -> List[SimpleNamespace]:
+        if any(self._client.version(path) != version for path, version in self._seen.items()):
+            self._clean_up()
+            raise Aborted("Transaction contention")
+        self.write_results = FakeBatch.commit(self)
+        self._clean_up()
+        return self.write_results
+
+
+# === === Client === ===
+
+class FakeClient:
+    """
+    In-memory stand-in for the parts of firestore.Client the backend uses. Documents are kept
+    by path in `docs` as (data, version); `reads`, `commits` and `aggregations` record the traffic.
+    """
+
+    def __init__(self):
+        self.docs: Dict[str, Tuple[Dict[str, Any], int]] = {}
+        self.reads = 0
+        self.commits = 0
+        self.aggregations: List[List[tuple]] = []
+
+    def version(self, path: str) -> Optional[int]:
+        return self.docs[path][1] if path in self.docs else None
+
+    def store(self, path: str, data: Dict[str, Any]) -> SimpleNamespace:
+        version = next(_versions)
+        self.docs[path] = (data, version)
+        return SimpleNamespace(update_time=version)
+
+    def collection(self, name: str) -> FakeCollection:
+        return FakeCollection(self, name)
+
+    def collection_group(self, name: str) -> FakeQuery:
+        return FakeQuery(self, name, group=True)
+
+    def document(self, path: str) -> FakeDocument:
+        return FakeDocument(self, path)
+
+    def get_all(self, references, field_paths=None, transaction=None):
+        for reference in references:
+            yield reference.get(transaction=transaction)
+
+    def batch(self) -> FakeBatch:
+        return FakeBatch(self)
+
+    def transaction(self, max_attempts: int = 5, read_only: bool = False) -> FakeTransaction:
+        return FakeTransaction(self, max_attempts)
+
+    def write_option(self, last_update_time=None, exists=None) -> SimpleNamespace:
+        return SimpleNamespace(last_update_time=last_update_time, exists=exists)
+
+    def close(self) -> None:
+        pass
+
+    def data(self, collection: str, doc_id: str) -> Optional[Dict[str, Any]]:
+        stored = self.docs.get(f"{collection}/{doc_id}")
+        return copy.deepcopy(stored[0]) if stored else None
+
+
+class FirestoreTestCase(unittest.TestCase):
+    """
+    Runs every test against a fresh FakeClient in place of the real client.
+    """
+
+    def setUp(self):
+        self.firestore = FakeClient()
+        self._previous_client = firestore_wrapper._client
+        firestore_wrapper._client = self.firestore
+
+    def tearDown(self):
+        firestore_wrapper._client = self._previous_client
+
+    def store(self, repo, *documents):
+        """
+        Writes documents as given, timestamps included. Returns the last one.
+        """
+        batch = firestore_wrapper.create_batch()
+        for document in documents:
+            repo.batch_restore(batch, document)
+        self.assertTrue(firestore_wrapper.commit_batch(batch))
+        return documents[-1] if documents else None
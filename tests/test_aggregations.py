@@ -0,0 +1,91 @@
+import unittest
+
+from backend.models import User, Member, Stash, Storage, Label, Item
+from backend.database.repos import user_repo, member_repo, stash_repo, storage_repo, label_repo, item_repo, MAX_IN_VALUES
+from backend.routes.repo_routes import stash_get_stats
+
+from tests.fake_firestore import FirestoreTestCase
+
+
+class AggregationTest(FirestoreTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.store(item_repo, *(
+            Item(name=f"Item {n}", label_id="l1" if n < 3 else "l2", storage_id="s1", cost=cost)
+            for n, cost in enumerate([1.5, 2.5, None, 4.0])
+        ))
+
+    def test_count(self):
+        self.assertEqual(item_repo.count([("label_id", "==", "l1")]), 3)
+        self.assertEqual(item_repo.count([("label_id", "==", "missing")]), 0)
+
+    def test_sum_and_avg_skip_missing_values(self):
+        self.assertEqual(item_repo.sum("cost", [("label_id", "==", "l1")]), 4.0)
+        self.assertEqual(item_repo.avg("cost", [("label_id", "==", "l1")]), 2.0)
+
+    def test_empty_sum_and_avg(self):
+        self.assertEqual(item_repo.sum("cost", [("label_id", "==", "missing")]), 0.0)
+        self.assertIsNone(item_repo.avg("cost", [("label_id", "==", "missing")]))
+
+    def test_exists_reads_at_most_one_document(self):
+        reads = self.firestore.reads
+        self.assertTrue(item_repo.exists([("storage_id", "==", "s1")]))
+        self.assertEqual(self.firestore.reads - reads, 1)
+        self.assertFalse(item_repo.exists([("storage_id", "==", "missing")]))
+
+
+class PurgeGuardTest(FirestoreTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.stash = Stash(name="Home")
+        self.fridge = Storage(name="Fridge", stash_id=self.stash.id)
+        self.pantry = Storage(name="Pantry", stash_id=self.stash.id)
+        self.stash.storage_ids = [self.fridge.id, self.pantry.id]
+        self.milk = Label(name="Milk", preferred_unit="L", stash_id=self.stash.id, default_storage_id=self.fridge.id)
+        self.store(stash_repo, self.stash)
+        self.store(storage_repo, self.fridge, self.pantry)
+        self.store(label_repo, self.milk)
+
+    def test_storage_with_items_is_kept(self):
+        self.store(item_repo, Item(name="Rice", label_id="other", storage_id=self.pantry.id))
+        with self.assertRaisesRegex(ValueError, "associated items"):
+            self.pantry.purge(None, None)
+
+    def test_default_storage_of_a_label_is_kept(self):
+        with self.assertRaisesRegex(ValueError, "default in a label"):
+            self.fridge.purge(None, None)
+
+    def test_empty_storage_is_purged(self):
+        batch = self.pantry.purge(None, None)
+        self.assertEqual(len(batch), 3)  # stash storage_ids, event, the storage itself
+
+    def test_label_with_items_is_kept(self):
+        self.store(item_repo, Item(name="Milk 1L", label_id=self.milk.id, storage_id=self.fridge.id))
+        with self.assertRaisesRegex(ValueError, "associated items"):
+            self.milk.purge(None, None)
+
+
+class StashStatsTest(FirestoreTestCase):
+
+    def test_items_of_more_labels_than_one_in_filter_takes(self):
+        user = self.store(user_repo, User(email="a@example.com", username="a", password_hashed="x"))
+        stash = Stash(name="Home")
+        self.store(member_repo, Member(owner_user_id=user.id, stash_id=stash.id, nickname="a", is_admin=True))
+        labels = [Label(name=f"Label {n}", preferred_unit="pcs", stash_id=stash.id, default_storage_id="s1") for n in range(MAX_IN_VALUES + 5)]
+        stash.label_ids = [label.id for label in labels]
+        self.store(stash_repo, stash)
+        self.store(label_repo, *labels)
+        self.store(item_repo, *(Item(name=label.name, label_id=label.id, storage_id="s1", cost=2.0) for label in labels))
+
+        stats = stash_get_stats(stash.id, current_user=user)
+
+        self.assertEqual(stats.label_count, MAX_IN_VALUES + 5)
+        self.assertEqual(stats.item_count, MAX_IN_VALUES + 5)
+        self.assertEqual(stats.total_item_cost, 2.0 * (MAX_IN_VALUES + 5))
+        self.assertTrue(all(len(value) <= MAX_IN_VALUES for filters in self.firestore.aggregations for _, op, value in filters if op == "in"))
+
+
+if __name__ == "__main__":
+    unittest.main()
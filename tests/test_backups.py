@@ -0,0 +1,155 @@
+import copy
+import unittest
+from datetime import datetime, timezone
+from typing import Optional
+
+import orjson
+from fastapi import HTTPException
+
+from backend.models import User, Stash, Member, Storage, Label, Item, Order, Event, EventType
+from backend.database.repos import user_repo, stash_repo, member_repo, storage_repo, label_repo, item_repo, order_repo, event_repo
+from backend.routes._backups import StashRestorer, export_stash, FORMAT_VERSION, _json_default
+
+from tests.fake_firestore import FirestoreTestCase
+
+# === Config ===
+NOW = datetime(2026, 3, 12, 12, 0, tzinfo=timezone.utc)
+RESTORED_EVENT_AT = datetime(2025, 11, 2, tzinfo=timezone.utc)  # imported from before the stash existed
+
+
+async def chunked(data: bytes, size: int = 1000):
+    for start in range(0, len(data), size):
+        yield data[start:start + size]
+
+
+def backup(stash_id: str, *entries, version: int = FORMAT_VERSION, end: bool = True) -> bytes:
+    records = [{"kind": "header", "version": version, "stash_id": stash_id}]
+    records += [{"collection": name, "data": document.model_dump()} for name, document in entries]
+    records += [{"kind": "end", "counts": {}}] if end else []
+    return b"".join(orjson.dumps(record, default=_json_default) + b"\n" for record in records)
+
+
+class BackupTest(FirestoreTestCase, unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        super().setUp()
+        created = dict(created_at=NOW, updated_at=NOW)
+        self.stash = Stash(name="Home", events_partitioned=True, events_since=RESTORED_EVENT_AT, **created)
+        self.admin = Member(stash_id=self.stash.id, nickname="a", owner_user_id="u1", is_admin=True, **created)
+        self.other = Member(stash_id=self.stash.id, nickname="b", owner_user_id="u2", **created)
+        self.user = User(id="u1", email="a@example.com", username="alice", password_hashed="x", member_ids=[self.admin.id], **created)
+        self.fridge = Storage(name="Fridge", stash_id=self.stash.id, **created)
+        self.milk = Label(name="Milk", preferred_unit="L", stash_id=self.stash.id, default_storage_id=self.fridge.id, **created)
+        self.item = Item(name="Whole milk", label_id=self.milk.id, storage_id=self.fridge.id, total_quantity=1, current_quantity=1, **created)
+        self.fridge.item_ids = self.milk.item_ids = [self.item.id]
+        self.stash.member_ids = [self.admin.id, self.other.id]
+        self.stash.storage_ids, self.stash.label_ids = [self.fridge.id], [self.milk.id]
+        self.events = [
+            Event(stash_id=self.stash.id, member_id=self.admin.id, type=EventType.INFO, title="Imported", created_at=RESTORED_EVENT_AT, updated_at=RESTORED_EVENT_AT),
+            Event(stash_id=self.stash.id, member_id=self.admin.id, type=EventType.SUCCESS, title="Item Added", **created),
+        ]
+        self.store(user_repo, self.user)
+        self.store(stash_repo, self.stash)
+        self.store(member_repo, self.admin, self.other)
+        self.store(storage_repo, self.fridge)
+        self.store(label_repo, self.milk)
+        self.store(item_repo, self.item)
+        self.store(order_repo, Order(stash_id=self.stash.id, item_ids=[self.item.id], **created))
+        self.store(event_repo, *self.events)
+        # Another stash's documents are never exported
+        self.store(storage_repo, Storage(name="Elsewhere", stash_id="other"))
+
+    def stash_documents(self) -> dict:
+        return {path: copy.deepcopy(data) for path, (data, _) in self.firestore.docs.items() if not path.startswith("users/") and data.get("name") != "Elsewhere"}
+
+    def wipe_stash(self) -> None:
+        for path in self.stash_documents():
+            del self.firestore.docs[path]
+
+    async def restore(self, data: bytes, user: Optional[User] = None):
+        return await StashRestorer(user or self.user).run(chunked(data))
+
+    def test_export_has_a_header_every_document_and_counts(self):
+        records = [orjson.loads(line) for line in b"".join(export_stash(self.stash)).splitlines()]
+        self.assertEqual((records[0]["kind"], records[0]["version"], records[0]["stash_id"]), ("header", FORMAT_VERSION, self.stash.id))
+        self.assertEqual([record["collection"] for record in records[1:-1]], ["stashes", "members", "members", "storages", "labels", "items", "orders", "events", "events"])
+        self.assertEqual(records[-1], {"kind": "end", "counts": {"stashes": 1, "members": 2, "storages": 1, "labels": 1, "items": 1, "orders": 1, "events": 2}})
+
+    async def test_restore_brings_back_the_same_documents(self):
+        before = self.stash_documents()
+        data = b"".join(export_stash(self.stash))
+        self.wipe_stash()
+
+        result = await self.restore(data)
+
+        self.assertTrue(result.complete)
+        self.assertEqual((result.skipped, result.failed, result.errors), (0, 0, []))
+        self.assertEqual(sum(result.restored.values()), len(before))
+        # u2 is not in the stash any more, so their membership comes back inactive
+        before[f"members/{self.other.id}"]["is_active"] = False
+        self.assertEqual(self.stash_documents(), before)
+
+    async def test_restoring_twice_leaves_the_same_state(self):
+        data = b"".join(export_stash(self.stash, compress=True))
+        self.assertEqual(data[:2], b"\x1f\x8b")
+        self.wipe_stash()
+        await self.restore(data)
+        once = self.stash_documents()
+        await self.restore(data)
+        self.assertEqual(self.stash_documents(), once)
+
+    async def test_only_admins_can_restore(self):
+        data = b"".join(export_stash(self.stash))
+        commits = self.firestore.commits
+        stranger = User(id="u3", email="c@example.com", username="carol", password_hashed="x")
+        with self.assertRaises(HTTPException) as raised:
+            await self.restore(data, user=stranger)
+        self.assertEqual(raised.exception.status_code, 403)
+        self.assertEqual(self.firestore.commits, commits)
+
+    async def test_records_of_another_stash_are_skipped(self):
+        self.wipe_stash()
+        stray_label = Label(name="Stray", preferred_unit="L", stash_id=self.stash.id, default_storage_id=self.fridge.id)
+        orphan = Item(name="Orphan", label_id=stray_label.id, storage_id=self.fridge.id)
+        data = backup(self.stash.id, ("stashes", self.stash), ("members", self.admin), ("storages", Storage(name="Theirs", stash_id="other")), ("items", orphan))
+
+        result = await self.restore(data)
+
+        self.assertEqual(result.restored, {"stashes": 1, "members": 1})
+        self.assertEqual(result.skipped, 2)
+        self.assertIsNone(item_repo.get(orphan.id, fresh=True))
+
+    async def test_older_events_extend_the_stash_event_range(self):
+        self.wipe_stash()
+        stash = Stash(name="Home", created_at=NOW, updated_at=NOW, events_partitioned=True)
+        admin = Member(stash_id=stash.id, nickname="a", owner_user_id=self.user.id, is_admin=True)
+        event = Event(stash_id=stash.id, member_id=admin.id, type=EventType.INFO, title="Imported", created_at=RESTORED_EVENT_AT, updated_at=RESTORED_EVENT_AT)
+
+        await self.restore(backup(stash.id, ("stashes", stash), ("members", admin), ("events", event)))
+
+        restored = stash_repo.get(stash.id, fresh=True)
+        self.assertEqual(restored.events_since, RESTORED_EVENT_AT)
+        self.assertEqual([found.title for found in restored.get_events(before=NOW)], ["Imported"])
+        self.assertIn(admin.id, user_repo.get(self.user.id, fresh=True).member_ids)
+
+    async def test_truncated_backup_is_incomplete(self):
+        self.wipe_stash()
+        result = await self.restore(backup(self.stash.id, ("stashes", self.stash), ("members", self.admin), end=False))
+        self.assertFalse(result.complete)
+        self.assertEqual(result.restored, {"stashes": 1, "members": 1})
+
+    async def test_malformed_backups_are_refused(self):
+        cases = [
+            (b'{"collection": "stashes", "data": {}}\n', "Backup must start with a header record."),
+            (backup(self.stash.id, version=FORMAT_VERSION + 1), f"Unsupported backup version {FORMAT_VERSION + 1}."),
+            (backup(self.stash.id, ("labels", self.milk), ("storages", self.fridge)), "Line 3: 'storages' records must come before 'labels' records."),
+            (b"", "Backup must start with a header record."),
+        ]
+        for data, detail in cases:
+            with self.subTest(detail=detail), self.assertRaises(HTTPException) as raised:
+                await self.restore(data)
+            self.assertEqual((raised.exception.status_code, raised.exception.detail), (400, detail))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,93 @@
+import asyncio
+import unittest
+from unittest import mock
+
+import orjson
+from fastapi import APIRouter, Depends, FastAPI, Request
+from fastapi.testclient import TestClient
+
+from backend.models import User
+from backend.routes import auth_routes
+from backend.routes.auth_routes import SHARED_USER_SCOPE_KEY, get_current_user
+from backend.routes._admission import ADMISSION_SCOPE_KEY, AdmissionMiddleware
+from backend.routes._batch import BatchDispatcher
+from backend.routes._schemas import BatchRequest
+
+# === Config ===
+USER = User(email="a@example.com", username="alice", password_hashed="x")
+
+
+class BatchTest(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.running = self.most_running = 0
+        self.router = APIRouter()
+
+        @self.router.get("/whoami", response_model=str)
+        async def whoami(current_user: User = Depends(get_current_user)):
+            self.running += 1
+            self.most_running = max(self.most_running, self.running)
+            await asyncio.sleep(0.01)
+            self.running -= 1
+            return current_user.username
+
+        @self.router.post("/touch", response_model=bool)
+        async def touch(current_user: User = Depends(get_current_user)):
+            return True
+
+    async def run_batch(self, admission: AdmissionMiddleware, requests: list) -> list:
+        async def receive():
+            return {"type": "http.disconnect"}
+
+        scope = {"type": "http", "method": "POST", "path": "/batch", "headers": [], "query_string": b"", ADMISSION_SCOPE_KEY: admission}
+        with mock.patch("backend.routes._batch.user_repo.get", return_value=USER):
+            response = await BatchDispatcher().run(self.router, Request(scope, receive), requests, USER)
+        return orjson.loads(response.body)
+
+    async def test_batch_holding_the_last_slot_still_runs(self):
+        admission = AdmissionMiddleware(None, max_concurrency=1, max_queue_seconds=0.01)
+        self.assertTrue(await admission.acquire())  # taken by the batch itself
+        requests = [BatchRequest(path="/whoami")] * 3 + [BatchRequest(method="POST", path="/touch")] + [BatchRequest(path="/whoami")]
+
+        results = await self.run_batch(admission, requests)
+
+        self.assertEqual([result["status"] for result in results], [200] * 5)
+        self.assertEqual(results[0]["body"], "alice")
+
+    async def test_overlapping_reads_take_free_slots(self):
+        admission = AdmissionMiddleware(None, max_concurrency=3, max_queue_seconds=0.01)
+        self.assertTrue(await admission.acquire())
+
+        results = await self.run_batch(admission, [BatchRequest(path="/whoami")] * 6)
+
+        self.assertEqual([result["status"] for result in results], [200] * 6)
+        self.assertEqual(self.most_running, 3)  # the batch's slot and the two free ones
+        self.assertEqual(admission._slots._value, 2)  # all returned; the batch still holds its own
+
+
+class SharedUserTest(unittest.TestCase):
+
+    def test_client_cannot_set_the_shared_user(self):
+        router = APIRouter()
+
+        @router.get("/whoami", response_model=str)
+        def whoami(current_user: User = Depends(get_current_user)):
+            return current_user.username
+
+        app = FastAPI()
+        app.include_router(router)
+        with mock.patch.object(auth_routes, "get_secret_key", return_value="test-key"):
+            client = TestClient(app, cookies={"access_token": "forged"})
+            response = client.get("/whoami", headers={SHARED_USER_SCOPE_KEY: "alice"}, params={SHARED_USER_SCOPE_KEY: "alice"})
+        self.assertEqual(response.status_code, 401)
+
+    def test_sub_request_scope_only_carries_the_resolved_user(self):
+        parent = {"type": "http", "headers": [(b"cookie", b"a=b"), (SHARED_USER_SCOPE_KEY.encode(), b"alice")], SHARED_USER_SCOPE_KEY: USER}
+        scope = BatchDispatcher._scope(parent, "GET", "/whoami", "", b"", None)
+        self.assertNotIn(SHARED_USER_SCOPE_KEY, scope)
+        self.assertEqual([key for key, _ in scope["headers"]], [b"cookie", b"accept"])
+        self.assertIs(BatchDispatcher._scope(parent, "GET", "/whoami", "", b"", USER)[SHARED_USER_SCOPE_KEY], USER)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,129 @@
+import unittest
+from unittest import mock
+
+from fastapi import HTTPException
+
+from backend.models import Member, Stash, Storage, Label, Item, Order
+from backend.database.repos import stash_repo, storage_repo, label_repo, item_repo, order_repo, event_repo, consumption_rate_repo
+from backend.routes import _bulk
+from backend.routes._bulk import run_item_bulk
+from backend.routes._schemas import ItemBulkAction, ItemBulkOperation
+
+from tests.fake_firestore import FirestoreTestCase, FakeBatch
+
+
+class ItemBulkTest(FirestoreTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.stash = Stash(name="Home")
+        self.fridge = Storage(name="Fridge", stash_id=self.stash.id)
+        self.pantry = Storage(name="Pantry", stash_id=self.stash.id)
+        self.milk = Label(name="Milk", preferred_unit="L", stash_id=self.stash.id, default_storage_id=self.fridge.id)
+        self.items = [
+            Item(name=f"Milk {n}", label_id=self.milk.id, storage_id=self.fridge.id, total_quantity=2, current_quantity=2, preferred_unit="L")
+            for n in range(3)
+        ]
+        self.fridge.item_ids = self.milk.item_ids = [item.id for item in self.items]
+        self.member = Member(stash_id=self.stash.id, nickname="a")
+        self.store(stash_repo, self.stash)
+        self.store(storage_repo, self.fridge, self.pantry)
+        self.store(label_repo, self.milk)
+        self.store(item_repo, *self.items)
+
+    def member_for(self, stash_id: str) -> Member:
+        if stash_id != self.stash.id:
+            raise HTTPException(status_code=403)
+        return self.member
+
+    def run_bulk(self, *operations: ItemBulkOperation):
+        return run_item_bulk(list(operations), self.member_for)
+
+    def test_move(self):
+        result = self.run_bulk(ItemBulkOperation(action=ItemBulkAction.MOVE, item_id=self.items[0].id, storage_id=self.pantry.id))
+        self.assertEqual((result.succeeded, result.failed), (1, 0))
+        self.assertEqual(item_repo.get(self.items[0].id, fresh=True).storage_id, self.pantry.id)
+        self.assertEqual(storage_repo.get(self.pantry.id, fresh=True).item_ids, [self.items[0].id])
+        self.assertNotIn(self.items[0].id, storage_repo.get(self.fridge.id, fresh=True).item_ids)
+        events = event_repo.query([("stash_id", "==", self.stash.id)])
+        self.assertEqual([event.message for event in events], ["Items 1 moved."])
+
+    def test_consume_records_the_use(self):
+        result = self.run_bulk(
+            ItemBulkOperation(action=ItemBulkAction.CONSUME, item_id=self.items[0].id, quantity=0.5),
+            ItemBulkOperation(action=ItemBulkAction.CONSUME, item_id=self.items[1].id),
+        )
+        self.assertEqual(result.failed, 0)
+        self.assertEqual([entry.item.current_quantity for entry in result.results], [1.5, 0])
+        self.assertIsNotNone(consumption_rate_repo.get(self.milk.id, fresh=True))
+
+    def test_consuming_more_than_is_left_fails_that_operation(self):
+        result = self.run_bulk(
+            ItemBulkOperation(action=ItemBulkAction.CONSUME, item_id=self.items[0].id, quantity=5),
+            ItemBulkOperation(action=ItemBulkAction.CONSUME, item_id=self.items[1].id, quantity=1),
+        )
+        self.assertEqual((result.results[0].status, result.results[1].status), (400, 200))
+        self.assertEqual(item_repo.get(self.items[0].id, fresh=True).current_quantity, 2)
+        self.assertEqual(item_repo.get(self.items[1].id, fresh=True).current_quantity, 1)
+
+    def test_invalid_operations_fail_alone(self):
+        result = self.run_bulk(
+            ItemBulkOperation(action=ItemBulkAction.DELETE, item_id="missing"),
+            ItemBulkOperation(action=ItemBulkAction.MOVE, item_id=self.items[0].id),
+            ItemBulkOperation(action=ItemBulkAction.DELETE, item_id=self.items[1].id),
+            ItemBulkOperation(action=ItemBulkAction.CONSUME, item_id=self.items[1].id),
+        )
+        self.assertEqual([entry.status for entry in result.results], [404, 400, 200, 400])
+        self.assertEqual((result.succeeded, result.failed), (1, 3))
+
+    def test_delete_cascades(self):
+        order = self.store(order_repo, Order(stash_id=self.stash.id, item_ids=[self.items[0].id, self.items[1].id]))
+        result = self.run_bulk(ItemBulkOperation(action=ItemBulkAction.DELETE, item_id=self.items[0].id))
+        self.assertEqual(result.failed, 0)
+        self.assertIsNone(item_repo.get(self.items[0].id, fresh=True))
+        self.assertEqual(order_repo.get(order.id, fresh=True).item_ids, [self.items[1].id])
+        self.assertNotIn(self.items[0].id, label_repo.get(self.milk.id, fresh=True).item_ids)
+        self.assertNotIn(self.items[0].id, storage_repo.get(self.fridge.id, fresh=True).item_ids)
+
+    def test_delete_of_a_changed_item_is_retried_on_fresh_data(self):
+        get_many = item_repo.get_many
+        calls = []
+
+        def read_then_change(ids):
+            items = get_many(list(ids))
+            if not calls:
+                self.firestore.document(f"items/{self.items[0].id}").update({"name": "Changed meanwhile"})
+            calls.append(items)
+            return items
+
+        with mock.patch.object(item_repo, "get_many", side_effect=read_then_change):
+            result = _bulk.firestore_wrapper.run_optimistic(
+                lambda batch: _bulk._apply(batch, [_bulk._Planned(0, ItemBulkOperation(action=ItemBulkAction.DELETE, item_id=self.items[0].id), self.stash.id)]),
+                name="test_bulk",
+            )
+        self.assertEqual(len(calls), 2)  # the first commit failed its precondition
+        self.assertEqual(result[0].status, 200)
+        self.assertIsNone(item_repo.get(self.items[0].id, fresh=True))
+
+    def test_batches_are_split_by_writes(self):
+        # Each delete writes the item and two orders; the label and storage are shared by all of them
+        for item in self.items:
+            self.store(order_repo, Order(stash_id=self.stash.id, item_ids=[item.id]), Order(stash_id=self.stash.id, item_ids=[item.id]))
+        sizes = []
+        commit = FakeBatch.commit
+
+        def recorded(batch):
+            sizes.append(len(batch))
+            return commit(batch)
+
+        with mock.patch.object(_bulk, "WRITE_CHUNK", 7), mock.patch.object(FakeBatch, "commit", recorded):
+            result = self.run_bulk(*(ItemBulkOperation(action=ItemBulkAction.DELETE, item_id=item.id) for item in self.items))
+
+        self.assertEqual(result.failed, 0)
+        self.assertEqual(sizes[:-1], [5, 5, 5])  # then the summary event
+        self.assertEqual(order_repo.query([("stash_id", "==", self.stash.id)], fields=["item_ids"])[0].item_ids, [])
+        self.assertEqual(label_repo.get(self.milk.id, fresh=True).item_ids, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
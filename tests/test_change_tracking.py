@@ -0,0 +1,95 @@
+import unittest
+
+from google.cloud.firestore import DELETE_FIELD
+
+from backend.models import Member, Stash
+from backend.database.firestore_wrapper import firestore_wrapper
+from backend.database.repos import member_repo, stash_repo
+
+from tests.fake_firestore import FirestoreTestCase
+
+
+class ChangedPathsTest(FirestoreTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.stored = self.store(member_repo, Member(stash_id="s1", nickname="a", debts={"m1": 1.0, "m2": 2.0}))
+
+    def load(self) -> Member:
+        return member_repo.get(self.stored.id, fresh=True)
+
+    def test_documents_not_read_have_no_paths(self):
+        self.assertIsNone(Member(stash_id="s1", nickname="a").changed_paths())
+
+    def test_unchanged_document_writes_nothing(self):
+        self.assertEqual(self.load().changed_paths(), {})
+
+    def test_assigned_scalars_are_written_whole(self):
+        member = self.load()
+        member.nickname = "b"
+        member.is_admin = False  # assigned its current value
+        self.assertEqual(member.changed_paths(), {"nickname": "b"})
+
+    def test_map_keys_become_dotted_paths(self):
+        member = self.load()
+        member.debts["m1"] = 3.0
+        member.debts["m3"] = 4.0
+        del member.debts["m2"]
+        self.assertEqual(member.changed_paths(), {"debts.m1": 3.0, "debts.m3": 4.0, "debts.m2": DELETE_FIELD})
+
+    def test_reassigned_map_is_still_diffed_by_key(self):
+        member = self.load()
+        member.debts = {"m1": 1.0, "m2": 5.0}
+        self.assertEqual(member.changed_paths(), {"debts.m2": 5.0})
+
+    def test_keys_that_are_not_paths_send_the_whole_map(self):
+        member = self.load()
+        member.debts["a.b"] = 1.0
+        self.assertEqual(member.changed_paths(), {"debts": {"m1": 1.0, "m2": 2.0, "a.b": 1.0}})
+
+    def test_lists_mutated_in_place_are_written_whole(self):
+        stored = self.store(member_repo, Member(stash_id="s1", nickname="a"))
+        stash = self.store(stash_repo, Stash(name="Home", member_ids=[stored.id]))
+        loaded = stash_repo.get(stash.id, fresh=True)
+        loaded.member_ids.append("m2")
+        self.assertEqual(loaded.changed_paths(), {"member_ids": [stored.id, "m2"]})
+
+    def test_concurrent_change_to_another_key_is_kept(self):
+        member = self.load()
+        self.firestore.document(f"members/{self.stored.id}").update({"debts.m2": 5.0})
+        member.debts["m1"] = 3.0
+
+        batch = firestore_wrapper.create_batch()
+        member_repo.batch_update(batch, member)
+        self.assertTrue(firestore_wrapper.commit_batch(batch))
+
+        self.assertEqual(self.firestore.data("members", self.stored.id)["debts"], {"m1": 3.0, "m2": 5.0})
+
+
+class DiffTest(FirestoreTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.stored = self.store(member_repo, Member(stash_id="s1", nickname="a", debts={"m1": 1.0}))
+
+    def test_copies_of_one_read_compare_changed_fields(self):
+        before = member_repo.get(self.stored.id, fresh=True)
+        after = before.model_copy(deep=True)
+        after.nickname = "b"
+        after.debts["m1"] = 2.0
+        self.assertEqual(before._load_id, after._load_id)
+        self.assertEqual(before.diff(after), {"nickname": ("a", "b"), "debts": ({"m1": 1.0}, {"m1": 2.0})})
+
+    def test_separate_reads_compare_every_field(self):
+        before = member_repo.get(self.stored.id, fresh=True)
+        self.firestore.document(f"members/{self.stored.id}").update({"is_admin": True})
+        after = member_repo.get(self.stored.id, fresh=True)
+        self.assertEqual(before.diff(after), {"is_admin": (False, True)})
+
+    def test_other_types_cannot_be_diffed(self):
+        with self.assertRaises(ValueError):
+            Member(stash_id="s1", nickname="a").diff(Stash(name="Home"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,131 @@
+import unittest
+from datetime import datetime, timedelta, timezone
+from unittest import mock
+
+from backend.models import Stash, Event, EventType, RollupPeriod, EventDigest
+from backend.database import event_retention
+from backend.database.event_retention import EventCompactor, RetentionPolicy, UNKNOWN_MEMBER
+from backend.database.firestore_wrapper import firestore_wrapper
+from backend.database.repos import stash_repo, event_repo, event_digest_repo
+
+from tests.fake_firestore import FirestoreTestCase
+
+# === Config ===
+NOW = datetime(2026, 3, 12, 12, 0, tzinfo=timezone.utc)  # a Thursday
+
+
+class RetentionPolicyTest(unittest.TestCase):
+
+    def test_unset_and_zero_limits_keep_everything(self):
+        for days, count in ((None, None), (0, 0), (None, 0)):
+            policy = RetentionPolicy.for_stash(Stash(name="s", event_retention_days=days, event_retention_count=count))
+            self.assertTrue(policy.keeps_everything)
+
+    def test_limits_and_rollup_come_from_the_stash(self):
+        policy = RetentionPolicy.for_stash(Stash(name="s", event_retention_days=30, event_retention_count=0, event_rollup=RollupPeriod.WEEKLY))
+        self.assertEqual(policy.max_age, timedelta(days=30))
+        self.assertIsNone(policy.max_count)
+        self.assertEqual(policy.rollup, RollupPeriod.WEEKLY)
+
+    def test_weekly_periods_start_on_monday(self):
+        self.assertEqual(RollupPeriod.WEEKLY.start_of(NOW), datetime(2026, 3, 9, tzinfo=timezone.utc))
+        self.assertEqual(RollupPeriod.DAILY.start_of(NOW), datetime(2026, 3, 12, tzinfo=timezone.utc))
+
+
+class EventCompactorTest(FirestoreTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.compactor = EventCompactor(interval=0)
+
+    def make_stash(self, **policy) -> Stash:
+        return self.store(stash_repo, Stash(name="Home", created_at=NOW - timedelta(days=400), **policy))
+
+    def make_events(self, stash: Stash, ages: list, member_id: str = "m1", type: EventType = EventType.INFO) -> list:
+        events = [Event(stash_id=stash.id, member_id=member_id, type=type, title="e", created_at=NOW - age, updated_at=NOW - age) for age in ages]
+        self.store(event_repo, *events)
+        return events
+
+    def remaining(self, stash: Stash) -> set:
+        return {event.id for event in event_repo.query([("stash_id", "==", stash.id)])}
+
+    def test_stash_without_policy_keeps_every_event(self):
+        stash = self.make_stash()
+        events = self.make_events(stash, [timedelta(days=1000)] * 3)
+        self.assertEqual(self.compactor.compact_stash(stash, now=NOW), 0)
+        self.assertEqual(self.remaining(stash), {event.id for event in events})
+
+    def test_compact_all_only_visits_stashes_with_a_policy(self):
+        kept = self.make_stash()
+        compacted = self.make_stash(event_retention_count=1)
+        self.make_events(kept, [timedelta(days=3), timedelta(days=2)])
+        self.make_events(compacted, [timedelta(days=3), timedelta(days=2)])
+        with mock.patch.object(self.compactor, "compact_stash", wraps=self.compactor.compact_stash) as compact_stash:
+            self.assertEqual(self.compactor.compact_all(), 1)
+        self.assertEqual([call.args[0].id for call in compact_stash.call_args_list], [compacted.id])
+        self.assertEqual(len(self.remaining(kept)), 2)
+
+    def test_age_cutoff_is_exclusive(self):
+        stash = self.make_stash(event_retention_days=10)
+        older, at_cutoff, newer = self.make_events(stash, [timedelta(days=10, seconds=1), timedelta(days=10), timedelta(days=9)])
+        self.assertEqual(self.compactor.compact_stash(stash, now=NOW), 1)
+        self.assertEqual(self.remaining(stash), {at_cutoff.id, newer.id})
+
+    def test_count_limit_compacts_the_oldest(self):
+        stash = self.make_stash(event_retention_count=2)
+        events = self.make_events(stash, [timedelta(hours=hours) for hours in (5, 4, 3, 2, 1)])
+        self.assertEqual(self.compactor.compact_stash(stash, now=NOW), 3)
+        self.assertEqual(self.remaining(stash), {events[3].id, events[4].id})
+
+    def test_digests_count_by_period_type_and_member(self):
+        stash = self.make_stash(event_retention_days=1)
+        self.make_events(stash, [timedelta(days=3, hours=1), timedelta(days=3, hours=2)], member_id="m1", type=EventType.INFO)
+        self.make_events(stash, [timedelta(days=3, hours=3)], member_id="m2", type=EventType.DANGER)
+        self.make_events(stash, [timedelta(days=5)], member_id="", type=EventType.INFO)
+
+        self.assertEqual(self.compactor.compact_stash(stash, now=NOW), 4)
+
+        digests = {digest.period_start: digest for digest in event_digest_repo.query([("stash_id", "==", stash.id)])}
+        three_days_ago = RollupPeriod.DAILY.start_of(NOW - timedelta(days=3))
+        five_days_ago = RollupPeriod.DAILY.start_of(NOW - timedelta(days=5))
+        self.assertEqual(set(digests), {three_days_ago, five_days_ago})
+        digest = digests[three_days_ago]
+        self.assertEqual(digest.id, EventDigest.id_for(stash.id, RollupPeriod.DAILY, three_days_ago))
+        self.assertEqual(digest.period_end, three_days_ago + timedelta(days=1))
+        self.assertEqual(digest.count, 3)
+        self.assertEqual(digest.counts_by_type, {"info": 2, "danger": 1})
+        self.assertEqual(digest.counts_by_member, {"m1": 2, "m2": 1})
+        self.assertEqual(digests[five_days_ago].counts_by_member, {UNKNOWN_MEMBER: 1})
+
+    def test_later_runs_add_to_the_same_digest(self):
+        stash = self.make_stash(event_retention_days=1)
+        self.make_events(stash, [timedelta(days=2)])
+        self.compactor.compact_stash(stash, now=NOW)
+        self.make_events(stash, [timedelta(days=2, minutes=1)])
+        self.compactor.compact_stash(stash, now=NOW)
+
+        digests = event_digest_repo.query([("stash_id", "==", stash.id)])
+        self.assertEqual([digest.count for digest in digests], [2])
+        self.assertEqual(digests[0].counts_by_member, {"m1": 2})
+
+    def test_deletes_run_in_chunks(self):
+        stash = self.make_stash(event_retention_days=1)
+        self.make_events(stash, [timedelta(days=2, minutes=minutes) for minutes in range(7)])
+        commits = self.firestore.commits
+        with mock.patch.object(event_retention, "CHUNK_SIZE", 3):
+            self.assertEqual(self.compactor.compact_stash(stash, now=NOW), 7)
+        self.assertEqual(self.firestore.commits - commits, 3)
+        self.assertEqual(self.remaining(stash), set())
+        self.assertEqual(sum(digest.count for digest in event_digest_repo.query([("stash_id", "==", stash.id)])), 7)
+
+    def test_failed_chunk_stops_without_counting(self):
+        stash = self.make_stash(event_retention_days=1)
+        events = self.make_events(stash, [timedelta(days=2), timedelta(days=3)])
+        with mock.patch.object(firestore_wrapper, "commit_batch", return_value=False):
+            self.assertEqual(self.compactor.compact_stash(stash, now=NOW), 0)
+        self.assertEqual(self.remaining(stash), {event.id for event in events})
+        self.assertEqual(event_digest_repo.query([("stash_id", "==", stash.id)]), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
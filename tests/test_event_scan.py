@@ -0,0 +1,109 @@
+import unittest
+from datetime import datetime, timedelta, timezone
+
+from backend.models import Stash, Event, EventType, month_start, previous_month
+from backend.database.repos import stash_repo, event_repo
+
+from tests.fake_firestore import FirestoreTestCase
+
+# === Config ===
+NOW = datetime(2026, 3, 12, 12, 0, tzinfo=timezone.utc)
+
+
+def make_event(stash_id: str, created_at: datetime, title: str = "Event") -> Event:
+    return Event(stash_id=stash_id, member_id="m1", type=EventType.INFO, title=title, created_at=created_at, updated_at=created_at)
+
+
+class PartitionTest(unittest.TestCase):
+
+    def test_partition_is_the_utc_month(self):
+        moment = datetime(2026, 3, 31, 23, 30, tzinfo=timezone(timedelta(hours=-2)))
+        self.assertEqual(Event.partition_for("s1", moment), "s1_202604")
+        self.assertEqual(make_event("s1", moment).partition, "s1_202604")
+
+    def test_previous_month_crosses_the_year(self):
+        january = month_start(datetime(2026, 1, 20, tzinfo=timezone.utc))
+        self.assertEqual(january, datetime(2026, 1, 1, tzinfo=timezone.utc))
+        self.assertEqual(previous_month(january), datetime(2025, 12, 1, tzinfo=timezone.utc))
+
+
+class EventScanTest(FirestoreTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.stash = self.store(stash_repo, Stash(name="Home", created_at=NOW - timedelta(days=90), events_partitioned=True))
+        self.march = [make_event(self.stash.id, NOW - timedelta(hours=hours), f"March {hours}") for hours in (1, 2, 3)]
+        self.february = make_event(self.stash.id, datetime(2026, 2, 10, tzinfo=timezone.utc), "February")
+        self.january = make_event(self.stash.id, datetime(2026, 1, 5, tzinfo=timezone.utc), "January")
+        self.store(event_repo, *self.march, self.february, self.january, make_event("other", NOW - timedelta(hours=1)))
+
+    def titles(self, events: list) -> list:
+        return [event.title for event in events]
+
+    def test_scan_is_newest_first_across_months(self):
+        events = event_repo.scan(self.stash.id, self.stash.created_at, newest=NOW)
+        self.assertEqual(self.titles(events), ["March 1", "March 2", "March 3", "February", "January"])
+
+    def test_a_full_page_reads_no_older_months(self):
+        reads = self.firestore.reads
+        events = event_repo.scan(self.stash.id, self.stash.created_at, newest=NOW, limit=2)
+        self.assertEqual(self.titles(events), ["March 1", "March 2"])
+        self.assertEqual(self.firestore.reads - reads, 2)
+
+    def test_scan_honors_the_bounds(self):
+        before = NOW - timedelta(hours=2)
+        events = event_repo.scan(self.stash.id, datetime(2026, 2, 1, tzinfo=timezone.utc), newest=before, after=datetime(2026, 2, 1, tzinfo=timezone.utc), before=before)
+        self.assertEqual(self.titles(events), ["March 3", "February"])
+
+    def test_events_just_before_the_stash_are_found(self):
+        # Stamped on another server a minute before the stash, in the previous month
+        stash = self.store(stash_repo, Stash(name="New", created_at=datetime(2026, 3, 1, 0, 2, tzinfo=timezone.utc), events_partitioned=True))
+        self.store(event_repo, make_event(stash.id, datetime(2026, 2, 28, 23, 59, tzinfo=timezone.utc), "Created"))
+        self.assertEqual(self.titles(stash.get_events(before=NOW)), ["Created"])
+
+
+class EnsurePartitionedTest(FirestoreTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.store(stash_repo, Stash(id="s1", name="Home", created_at=NOW, updated_at=NOW))
+        # Written before events carried a partition
+        self.old = [make_event("s1", datetime(2026, 1, 20, tzinfo=timezone.utc), "Restored"), make_event("s1", NOW + timedelta(hours=1), "Recent")]
+        for event in self.old:
+            data = event.model_dump()
+            del data["partition"]
+            self.firestore.store(f"events/{event.id}", data)
+
+    def test_backfill_sets_partitions_and_events_since(self):
+        stash = stash_repo.get("s1", fresh=True)
+        event_repo.ensure_partitioned(stash)
+
+        self.assertEqual([self.firestore.data("events", event.id)["partition"] for event in self.old], ["s1_202601", "s1_202603"])
+        stored = stash_repo.get("s1", fresh=True)
+        self.assertTrue(stored.events_partitioned)
+        self.assertEqual(stored.events_since, datetime(2026, 1, 20, tzinfo=timezone.utc))
+        self.assertEqual(stash.events_since, stored.events_since)
+
+    def test_backfill_runs_once(self):
+        stash = stash_repo.get("s1", fresh=True)
+        event_repo.ensure_partitioned(stash)
+        reads, commits = self.firestore.reads, self.firestore.commits
+        event_repo.ensure_partitioned(stash)
+        self.assertEqual((self.firestore.reads, self.firestore.commits), (reads, commits))
+
+    def test_reads_find_backfilled_events_older_than_the_stash(self):
+        stash = stash_repo.get("s1", fresh=True)
+        events = stash.get_events(before=NOW + timedelta(days=1))
+        self.assertEqual([event.title for event in events], ["Recent", "Restored"])
+
+    def test_events_newer_than_the_stash_leave_events_since_unset(self):
+        self.firestore.docs.pop(f"events/{self.old[0].id}")
+        stash = stash_repo.get("s1", fresh=True)
+        event_repo.ensure_partitioned(stash)
+        stored = stash_repo.get("s1", fresh=True)
+        self.assertTrue(stored.events_partitioned)
+        self.assertIsNone(stored.events_since)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,85 @@
+import unittest
+
+from backend.models import Event, EventType
+from backend.routes._events import EventCoalescer, compact_changes, merge_changes, summarize_changes
+from backend.database.firestore_wrapper import firestore_wrapper
+from backend.database.repos import event_repo
+
+from tests.fake_firestore import FirestoreTestCase
+
+
+class DiffTest(unittest.TestCase):
+
+    def test_lists_record_added_and_removed_ids(self):
+        diff = compact_changes({"item_ids": (["a", "b"], ["b", "c"])})
+        self.assertEqual(diff, {"item_ids": {"added": ["c"], "removed": ["a"]}})
+
+    def test_maps_record_each_changed_key(self):
+        diff = compact_changes({"debts": ({"m1": 1.0, "m2": 2.0}, {"m1": 1.0, "m2": 3.0, "m3": 4.0})})
+        self.assertEqual(diff, {"debts.m2": {"old": 2.0, "new": 3.0}, "debts.m3": {"old": None, "new": 4.0}})
+
+    def test_merge_keeps_first_old_and_last_new(self):
+        merged = merge_changes({"name": ("a", "b"), "cost": (1, 2)}, {"name": ("b", "c"), "cost": (2, 1)})
+        self.assertEqual(merged, {"name": ("a", "c")})
+        self.assertEqual(summarize_changes(merged), "Changed name.")
+
+
+class EventCoalescerTest(FirestoreTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.coalescer = EventCoalescer(window=60)
+
+    def update(self, old: str, new: str) -> Event:
+        changes = {"name": (old, new)}
+        event = Event(stash_id="s1", member_id="m1", type=EventType.SUCCESS, title="Item Updated", target_id="i1", changes=compact_changes(changes))
+        return firestore_wrapper.run_optimistic(lambda batch: self.coalescer.batch_add(batch, event, changes), name="test_update")
+
+    def stored_events(self) -> dict:
+        return {event.id: event for event in event_repo.query([("stash_id", "==", "s1")])}
+
+    def test_consecutive_updates_share_one_event(self):
+        first = self.update("a", "b")
+        second = self.update("b", "c")
+        self.assertEqual(second.id, first.id)
+        self.assertEqual(self.stored_events()[first.id].changes, {"name": {"old": "a", "new": "c"}})
+
+    def test_updates_that_cancel_out_delete_the_event(self):
+        first = self.update("a", "b")
+        self.update("b", "a")
+        self.assertNotIn(first.id, self.stored_events())
+        third = self.update("a", "d")
+        self.assertNotEqual(third.id, first.id)
+
+    def test_event_deleted_elsewhere_is_not_written_again(self):
+        first = self.update("a", "b")
+        # Compacted by another worker, whose invalidation never reached this one
+        del self.firestore.docs[f"events/{first.id}"]
+
+        second = self.update("b", "c")
+
+        self.assertNotEqual(second.id, first.id)
+        self.assertEqual(set(self.stored_events()), {second.id})
+        self.assertEqual(self.stored_events()[second.id].changes, {"name": {"old": "b", "new": "c"}})
+
+    def test_event_changed_elsewhere_is_not_overwritten(self):
+        first = self.update("a", "b")
+        self.firestore.document(f"events/{first.id}").update({"title": "Edited elsewhere"})
+
+        second = self.update("b", "c")
+
+        self.assertNotEqual(second.id, first.id)
+        self.assertEqual(self.stored_events()[first.id].title, "Edited elsewhere")
+
+    def test_failed_commit_is_not_remembered(self):
+        event = Event(stash_id="s1", member_id="m1", type=EventType.SUCCESS, title="Item Updated", target_id="i1")
+        batch = firestore_wrapper.create_batch()
+        self.coalescer.batch_add(batch, event, {"name": ("a", "b")})
+        # Never committed; the next update must not try to rewrite it
+        second = self.update("a", "c")
+        self.assertNotEqual(second.id, event.id)
+        self.assertEqual(set(self.stored_events()), {second.id})
+
+
+if __name__ == "__main__":
+    unittest.main()
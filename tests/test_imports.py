@@ -0,0 +1,126 @@
+import unittest
+from unittest import mock
+
+from fastapi import HTTPException
+
+from backend.models import Stash, Member, Storage, Label, EventType
+from backend.database.repos import member_repo, storage_repo, label_repo, item_repo, event_repo
+from backend.routes import _imports
+from backend.routes._imports import ItemImporter, parse_rows, read_lines
+
+from tests.fake_firestore import FirestoreTestCase
+
+
+async def chunked(data: bytes, size: int = 3):
+    for start in range(0, len(data), size):
+        yield data[start:start + size]
+
+
+async def collect(rows) -> list:
+    return [row async for row in rows]
+
+
+class ReadLinesTest(unittest.IsolatedAsyncioTestCase):
+
+    async def test_characters_split_across_chunks(self):
+        lines = await collect(read_lines(chunked("a\ncrème brûlée\n".encode(), size=1)))
+        self.assertEqual(lines, ["a", "crème brûlée"])
+
+    async def test_bom_and_crlf_are_dropped(self):
+        lines = await collect(read_lines(chunked(b"\xef\xbb\xbfname\r\nmilk\r\nlast")))
+        self.assertEqual(lines, ["name", "milk", "last"])
+
+    async def test_long_lines_are_refused(self):
+        with self.assertRaises(HTTPException) as raised:
+            await collect(read_lines(chunked(b"abcdefghij\n"), max_chars=5))
+        self.assertEqual(raised.exception.status_code, 413)
+
+    async def test_body_must_be_utf8(self):
+        with self.assertRaises(HTTPException) as raised:
+            await collect(read_lines(chunked(b"name\n\xff\xfe\n")))
+        self.assertEqual(raised.exception.status_code, 400)
+
+
+class ParseRowsTest(unittest.IsolatedAsyncioTestCase):
+
+    async def rows(self, content_type: str, text: str) -> list:
+        return await collect(parse_rows(content_type, chunked(text.encode())))
+
+    async def test_csv_records(self):
+        rows = await self.rows("text/csv; charset=utf-8", 'Name,Label,Total_Quantity,Allowed_Member_IDs\n"Milk\nwhole",Milk,2,m1; m2\n\nBread,, 1 ,\n')
+        self.assertEqual(rows, [
+            (2, {"name": "Milk\nwhole", "label": "Milk", "total_quantity": "2", "allowed_member_ids": ["m1", "m2"]}),
+            (5, {"name": "Bread", "total_quantity": "1"}),
+        ])
+
+    async def test_csv_row_errors(self):
+        rows = await self.rows("text/csv", 'name,label\na,b,c\n"open\n')
+        self.assertEqual(rows, [(2, "Row has 3 values but the header has 2 columns."), (3, "Quoted field is never closed.")])
+
+    async def test_ndjson_lines(self):
+        rows = await self.rows("application/x-ndjson", '{"name": "Milk"}\n\nnot json\n[1]\n')
+        self.assertEqual(rows, [(1, {"name": "Milk"}), (3, "Line is not valid JSON."), (4, "Line must be a JSON object.")])
+
+    def test_other_types_are_refused(self):
+        with self.assertRaises(HTTPException) as raised:
+            parse_rows("application/json", chunked(b"[]"))
+        self.assertEqual(raised.exception.status_code, 415)
+
+
+class ItemImporterTest(FirestoreTestCase, unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.stash = Stash(name="Home")
+        self.member = Member(stash_id=self.stash.id, nickname="a", is_admin=True)
+        self.former = Member(stash_id=self.stash.id, nickname="b", is_active=False)
+        self.fridge = Storage(name="Fridge", stash_id=self.stash.id)
+        self.pantry = Storage(name="Pantry", stash_id=self.stash.id)
+        self.milk = Label(name="Milk", preferred_unit="L", stash_id=self.stash.id, default_storage_id=self.fridge.id)
+        self.store(member_repo, self.member, self.former)
+        self.store(storage_repo, self.fridge, self.pantry)
+        self.store(label_repo, self.milk)
+
+    async def run_import(self, text: str):
+        return await ItemImporter(self.stash, self.member).run(parse_rows("text/csv", chunked(text.encode(), size=16)))
+
+    def stored_items(self) -> dict:
+        return {item.name: item for item in item_repo.query([("label_id", "==", self.milk.id)])}
+
+    async def test_rows_become_items(self):
+        result = await self.run_import("name,label,storage,total_quantity\nWhole milk, milk ,,2\nOat milk,MILK,pantry,1\n")
+        self.assertEqual((result.imported, result.failed), (2, 0))
+
+        items = self.stored_items()
+        whole, oat = items["Whole milk"], items["Oat milk"]
+        self.assertEqual((whole.storage_id, oat.storage_id), (self.fridge.id, self.pantry.id))
+        self.assertEqual((whole.preferred_unit, whole.current_quantity), ("L", 2))
+        self.assertEqual(whole.allowed_member_usage, {self.member.id: 0.0})
+        self.assertEqual(sorted(label_repo.get(self.milk.id, fresh=True).item_ids), sorted(result.item_ids))
+        self.assertEqual(storage_repo.get(self.pantry.id, fresh=True).item_ids, [oat.id])
+
+    async def test_bad_rows_fail_alone(self):
+        result = await self.run_import("name,label,total_quantity,allowed_member_ids\nMilk,Milk,1,\nJuice,Juice,1,\nEmpty,Milk,0,\nShared,Milk,1,stranger\n")
+        self.assertEqual((result.imported, result.failed), (1, 3))
+        self.assertEqual([(error.row, error.error) for error in result.errors], [
+            (3, "Label 'Juice' not found in the stash."),
+            (4, "Total quantity must be positive."),
+            (5, "Allowed member 'stranger' not found in the stash."),
+        ])
+        events = event_repo.query([("stash_id", "==", self.stash.id)])
+        self.assertEqual([(event.type, event.message) for event in events], [(EventType.WARNING, "1 items imported, 3 rows skipped.")])
+
+    async def test_large_imports_are_written_in_batches(self):
+        rows = "".join(f"Milk {n},Milk,1\n" for n in range(10))
+        commits = self.firestore.commits
+        with mock.patch.object(_imports, "WRITE_CHUNK", 8):
+            result = await self.run_import("name,label,total_quantity\n" + rows)
+        self.assertEqual(result.imported, 10)
+        self.assertGreater(self.firestore.commits - commits, 1)
+        self.assertEqual(len(self.stored_items()), 10)
+        self.assertEqual(len(label_repo.get(self.milk.id, fresh=True).item_ids), 10)
+        self.assertEqual(len(event_repo.query([("stash_id", "==", self.stash.id)])), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,112 @@
+import unittest
+from datetime import datetime, timezone
+from typing import List, Optional
+
+import msgpack
+from fastapi import APIRouter, FastAPI, Response
+from fastapi.routing import APIRoute
+from fastapi.testclient import TestClient
+
+from backend.models import User, Item
+from backend.routes._schemas import UserProtected
+from backend.routes._responses import TrustedModelRoute, ModelResponse, Projection, MsgPackResponse, MSGPACK_MEDIA_TYPE, bulk_list
+
+# === Config ===
+NOW = datetime(2026, 3, 12, 12, 0, tzinfo=timezone.utc)
+USER = User(id="u1", email="a@example.com", username="a", password_hashed="secret", member_ids=["m1"], created_at=NOW, updated_at=NOW)
+ITEMS = [Item(id=f"i{n}", name=f"Item {n}", label_id="l1", storage_id="s1", cost=1.5 * n, created_at=NOW, updated_at=NOW) for n in range(3)]
+
+
+def build_app(route_class: type) -> FastAPI:
+    router = APIRouter(route_class=route_class)
+
+    @router.get("/protected/trusted", response_model=UserProtected)
+    def protected_trusted():
+        return UserProtected.from_model(USER)
+
+    @router.get("/protected/untrusted", response_model=UserProtected)
+    def protected_untrusted():
+        return USER  # validated and filtered down to UserProtected
+
+    @router.get("/items/trusted", response_model=List[Item])
+    @bulk_list
+    async def items_trusted():
+        return ITEMS
+
+    @router.get("/items/untrusted", response_model=List[Item])
+    async def items_untrusted():
+        return [item.model_dump() for item in ITEMS]
+
+    @router.get("/item/missing", response_model=Optional[Item])
+    def item_missing():
+        return None
+
+    @router.get("/items/projected", response_model=List[Item])
+    def items_projected():
+        return Projection([Item.model_construct(**{"id": item.id, "name": item.name}) for item in ITEMS])
+
+    @router.get("/cookie", response_model=bool)
+    def cookie(response: Response):
+        response.set_cookie("token", "t")
+        return True
+
+    app = FastAPI(default_response_class=ModelResponse)
+    app.include_router(router)
+    return app
+
+
+class TrustedModelRouteTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.client = TestClient(build_app(TrustedModelRoute))
+        cls.reference = TestClient(build_app(APIRoute))
+
+    def test_trusted_and_untrusted_results_serialize_alike(self):
+        for path in ("/protected", "/items"):
+            trusted = self.client.get(f"{path}/trusted")
+            untrusted = self.client.get(f"{path}/untrusted")
+            self.assertEqual(trusted.status_code, 200)
+            self.assertEqual(trusted.content, untrusted.content)
+
+    def test_output_matches_fastapi(self):
+        for path in ("/protected/trusted", "/protected/untrusted", "/items/trusted", "/items/untrusted", "/item/missing"):
+            self.assertEqual(self.client.get(path).json(), self.reference.get(path).json(), path)
+
+    def test_untrusted_result_is_filtered(self):
+        self.assertNotIn("password_hashed", self.client.get("/protected/untrusted").json())
+
+    def test_projection_leaves_out_unread_fields(self):
+        self.assertEqual(self.client.get("/items/projected").json()[0], {"id": "i0", "name": "Item 0"})
+
+    def test_injected_response_keeps_its_cookies(self):
+        response = self.client.get("/cookie")
+        self.assertEqual(response.json(), True)
+        self.assertEqual(response.cookies.get("token"), "t")
+
+    def test_msgpack_is_negotiated_for_bulk_lists(self):
+        response = self.client.get("/items/trusted", headers={"accept": MSGPACK_MEDIA_TYPE})
+        self.assertEqual(response.headers["content-type"], MSGPACK_MEDIA_TYPE)
+        rows = msgpack.unpackb(response.content, timestamp=3)
+        self.assertEqual([row["id"] for row in rows], ["i0", "i1", "i2"])
+        self.assertEqual(rows[0]["created_at"], NOW)
+
+    def test_other_routes_stay_json(self):
+        response = self.client.get("/items/untrusted", headers={"accept": f"{MSGPACK_MEDIA_TYPE}; dict=1"})
+        self.assertEqual(response.headers["content-type"], "application/json")
+        self.assertEqual(len(response.json()), 3)
+
+
+class MsgPackResponseTest(unittest.TestCase):
+
+    def test_keyed_rows_use_every_rows_keys(self):
+        response = MsgPackResponse([{"id": "a"}, {"id": "b", "name": "B"}, {"name": "C", "cost": 1.5}], keyed=True)
+        self.assertEqual(response.headers["content-type"], f"{MSGPACK_MEDIA_TYPE}; dict=1")
+        self.assertEqual(msgpack.unpackb(response.body), {
+            "$keys": ["id", "name", "cost"],
+            "$rows": [["a", None, None], ["b", "B", None], [None, "C", 1.5]],
+        })
+
+
+if __name__ == "__main__":
+    unittest.main()
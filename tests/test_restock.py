@@ -0,0 +1,131 @@
+import unittest
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from backend.models import ConsumptionRate, Stash, Label, Item, OrderStatus
+from backend.database.firestore_wrapper import firestore_wrapper
+from backend.database.repos import label_repo, item_repo, consumption_rate_repo
+from backend.routes._restock import batch_record_consumption, plan_restock
+
+from tests.fake_firestore import FirestoreTestCase
+
+# === Config ===
+NOW = datetime(2026, 3, 12, 12, 0, tzinfo=timezone.utc)
+
+
+class ConsumptionRateTest(unittest.TestCase):
+
+    def rate(self) -> ConsumptionRate:
+        return ConsumptionRate(id="l1", stash_id="s1", unit="L")
+
+    def test_steady_use_gives_its_rate(self):
+        rate = self.rate()
+        for day in range(1, 31):
+            rate.record(1, since=NOW, at=NOW + timedelta(days=day))
+        self.assertAlmostEqual(rate.daily_rate(NOW + timedelta(days=30)), 1.0)
+        self.assertEqual(rate.samples, 30)
+
+    def test_first_use_is_measured_from_since(self):
+        rate = self.rate()
+        rate.record(2, since=NOW - timedelta(days=4), at=NOW)
+        self.assertAlmostEqual(rate.daily_rate(NOW), 0.5)
+
+    def test_idle_days_lower_the_rate(self):
+        rate = self.rate()
+        rate.record(7, since=NOW - timedelta(days=7), at=NOW)
+        # One half-life later the use weighs half, against 14 days without any: 3.5 / (3.5 + 14)
+        self.assertAlmostEqual(rate.daily_rate(NOW + timedelta(days=14)), 0.2)
+
+    def test_old_use_fades(self):
+        rate = self.rate()
+        rate.record(10, since=NOW - timedelta(days=30), at=NOW - timedelta(days=29))
+        rate.record(1, since=NOW, at=NOW)
+        # Below the plain 11 units over 30 days, since the heavy day weighs less than a quarter now
+        self.assertLess(rate.daily_rate(NOW), 0.15)
+
+    def test_uses_close_together_count_a_minimum_interval(self):
+        rate = self.rate()
+        rate.record(1, since=NOW, at=NOW)
+        self.assertAlmostEqual(rate.daily_rate(NOW), 24.0)
+
+    def test_late_recorded_use_keeps_the_latest_time(self):
+        rate = self.rate()
+        rate.record(1, since=NOW - timedelta(days=1), at=NOW)
+        rate.record(1, since=NOW - timedelta(days=1), at=NOW - timedelta(hours=6))
+        self.assertEqual(rate.last_consumed_at, NOW)
+
+    def test_no_uses_is_no_rate(self):
+        self.assertEqual(self.rate().daily_rate(NOW), 0.0)
+
+
+class RestockTest(FirestoreTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.stash = Stash(name="Home")
+        self.milk = self.label("Milk", "L")
+        self.eggs = self.label("Eggs", "pcs")
+        self.bread = self.label("Bread", "pcs")  # never used up
+        self.cheese = self.label("Cheese", "kg")  # rate recorded in grams before the unit changed
+        self.store(label_repo, self.milk, self.eggs, self.bread, self.cheese)
+        self.store(consumption_rate_repo, self.rate(self.milk, 1.0), self.rate(self.eggs, 0.5), self.rate(self.cheese, 100, unit="g"))
+        self.store(
+            item_repo,
+            self.item(self.milk, 2, "L"),
+            self.item(self.milk, 1, None),
+            self.item(self.milk, 500, "ml"),  # not counted against litres
+            self.item(self.eggs, 10, "pcs"),
+            self.item(self.bread, 1, "pcs"),
+        )
+
+    def label(self, name: str, unit: str) -> Label:
+        return Label(name=name, preferred_unit=unit, stash_id=self.stash.id, default_storage_id="fridge")
+
+    def rate(self, label: Label, per_day: float, unit: Optional[str] = None) -> ConsumptionRate:
+        return ConsumptionRate(id=label.id, stash_id=self.stash.id, unit=unit or label.preferred_unit, weighted_quantity=per_day * 14, weighted_days=14, last_consumed_at=NOW, samples=3)
+
+    def item(self, label: Label, quantity: float, unit: Optional[str]) -> Item:
+        return Item(name=label.name, label_id=label.id, storage_id="fridge", total_quantity=quantity, current_quantity=quantity, preferred_unit=unit)
+
+    def test_plan_is_soonest_first(self):
+        plan = plan_restock(self.stash, "m1", now=NOW)
+        self.assertEqual([recommendation.label_name for recommendation in plan.recommendations], ["Milk", "Eggs"])
+        milk, eggs = plan.recommendations
+        self.assertEqual((milk.in_stock, milk.daily_rate, milk.days_left, milk.samples), (3, 1.0, 3.0, 3))
+        self.assertEqual(milk.runs_out_at, NOW + timedelta(days=3))
+        self.assertEqual((eggs.in_stock, eggs.days_left), (10, 20.0))
+
+    def test_suggestions_cover_the_horizon(self):
+        plan = plan_restock(self.stash, "m1", horizon_days=14, now=NOW)
+        self.assertEqual([recommendation.suggested_quantity for recommendation in plan.recommendations], [11.0, 0.0])
+
+    def test_draft_order_marks_only_labels_to_buy(self):
+        plan = plan_restock(self.stash, "m1", now=NOW)
+        self.assertEqual(plan.order.status, {self.milk.id: OrderStatus.IN_PROGRESS})
+        self.assertEqual((plan.order.stash_id, plan.order.buyer_member_id), (self.stash.id, "m1"))
+
+    def test_record_creates_the_rate_in_the_labels_unit(self):
+        item = self.item(self.bread, 2, "pcs")
+        item.updated_at = NOW - timedelta(days=4)
+        batch = firestore_wrapper.create_batch()
+        batch_record_consumption(batch, [(item, 2)], self.stash.id, at=NOW)
+        self.assertTrue(firestore_wrapper.commit_batch(batch))
+
+        rate = consumption_rate_repo.get(self.bread.id, fresh=True)
+        self.assertEqual((rate.unit, rate.samples), ("pcs", 1))
+        self.assertAlmostEqual(rate.daily_rate(NOW), 0.5)
+
+    def test_record_folds_into_the_stored_rate(self):
+        batch = firestore_wrapper.create_batch()
+        batch_record_consumption(batch, [(self.item(self.milk, 1, "L"), 1)], self.stash.id, at=NOW + timedelta(days=1))
+        self.assertTrue(firestore_wrapper.commit_batch(batch))
+        self.assertEqual(consumption_rate_repo.get(self.milk.id, fresh=True).samples, 4)
+
+    def test_uses_in_other_units_are_not_recorded(self):
+        batch = firestore_wrapper.create_batch()
+        batch_record_consumption(batch, [(self.item(self.milk, 500, "ml"), 250)], self.stash.id, at=NOW)
+        self.assertEqual(len(batch), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
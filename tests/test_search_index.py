@@ -0,0 +1,151 @@
+import unittest
+from unittest import mock
+
+from backend.models import Stash, Storage, Label, Item
+from backend.database.firestore_wrapper import firestore_wrapper
+from backend.database.invalidation import invalidation_bus
+from backend.database.repos import stash_repo, storage_repo, label_repo, item_repo
+from backend.database.search_index import SearchIndexes, StashIndex, normalize, trigrams
+
+from tests.fake_firestore import FirestoreTestCase
+
+
+def make_index(*names: str) -> StashIndex:
+    index = StashIndex("s1", 0)
+    for n, name in enumerate(names):
+        index.put(("item", f"i{n}"), {"name": name})
+    return index
+
+
+class TrigramTest(unittest.TestCase):
+
+    def test_normalize_strips_case_accents_and_punctuation(self):
+        self.assertEqual(normalize("  Crème-Fraîche, 30%!"), "creme fraiche 30")
+
+    def test_word_starts_get_their_own_trigrams(self):
+        self.assertEqual(trigrams("ab"), frozenset({"  a", " ab", "ab "}))
+
+    def test_misspelled_query_matches(self):
+        hits = make_index("Parmesan", "Mozzarella").search("parmesn", limit=10)
+        self.assertEqual([hit.text for hit in hits], ["Parmesan"])
+
+    def test_unrelated_text_does_not_match(self):
+        self.assertEqual(make_index("Milk").search("xyz", limit=10), [])
+        self.assertEqual(make_index("Milk").search("!!", limit=10), [])
+
+    def test_exact_then_prefix_then_word_prefix(self):
+        hits = make_index("Oat milk", "Milk chocolate", "Milk").search("milk", limit=10)
+        self.assertEqual([hit.text for hit in hits], ["Milk", "Milk chocolate", "Oat milk"])
+        self.assertTrue(hits[0].score > hits[1].score > hits[2].score)
+
+    def test_limit_keeps_the_best(self):
+        hits = make_index("Oat milk", "Milk chocolate", "Milk").search("milk", limit=1)
+        self.assertEqual([hit.text for hit in hits], ["Milk"])
+
+    def test_best_field_is_reported_and_kinds_filter(self):
+        index = StashIndex("s1", 0)
+        index.put(("label", "l1"), {"name": "Gouda", "food_group": "Dairy"})
+        index.put(("item", "i1"), {"name": "Dairy free spread"})
+        hits = index.search("dairy", limit=10, kinds=["label"])
+        self.assertEqual([(hit.kind, hit.field) for hit in hits], [("label", "food_group")])
+
+    def test_removed_entries_are_not_found(self):
+        index = make_index("Milk")
+        index.remove(("item", "i0"))
+        self.assertEqual(index.search("milk", limit=10), [])
+        self.assertEqual(index._postings, {})
+
+
+class SearchIndexesTest(FirestoreTestCase):
+
+    def setUp(self):
+        super().setUp()
+        # No background resolver, so searches resolve what they need themselves and reads are countable
+        patcher = mock.patch.object(SearchIndexes, "_resolve_loop", lambda self: None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        subscribe = invalidation_bus.subscribe
+        with mock.patch.object(invalidation_bus, "subscribe", lambda callback: self.addCleanup(subscribe(callback))):
+            self.indexes = SearchIndexes()
+        self.home, self.fridge, self.milk = self.make_stash("Home")
+        self.other, _, self.other_label = self.make_stash("Other")
+        self.store(item_repo, Item(name="Whole milk", label_id=self.milk.id, storage_id=self.fridge.id))
+        self.store(item_repo, Item(name="Skimmed milk", label_id=self.other_label.id, storage_id="elsewhere"))
+
+    def make_stash(self, name: str) -> tuple:
+        stash = Stash(name=name)
+        storage = Storage(name="Fridge", stash_id=stash.id)
+        label = Label(name="Milk", preferred_unit="L", stash_id=stash.id, default_storage_id=storage.id)
+        stash.storage_ids, stash.label_ids = [storage.id], [label.id]
+        self.store(stash_repo, stash)
+        self.store(storage_repo, storage)
+        self.store(label_repo, label)
+        return stash, storage, label
+
+    def add_item(self, name: str, label: Label) -> Item:
+        item = Item(name=name, label_id=label.id, storage_id="s")
+        batch = firestore_wrapper.create_batch()
+        item_repo.batch_add(batch, item)
+        label_repo.batch_array_union(batch, label.id, "item_ids", item.id)
+        self.assertTrue(firestore_wrapper.commit_batch(batch))
+        return item
+
+    def rename(self, repo, document, name: str) -> None:
+        batch = firestore_wrapper.create_batch()
+        document.name = name
+        repo.batch_update(batch, document)
+        self.assertTrue(firestore_wrapper.commit_batch(batch))
+
+    def names(self, stash: Stash, query: str) -> list:
+        return sorted(hit.text for hit in self.indexes.search(stash.id, query))
+
+    def test_search_is_scoped_to_the_stash(self):
+        self.assertEqual(self.names(self.home, "milk"), ["Milk", "Whole milk"])
+        self.assertEqual(self.names(self.other, "milk"), ["Milk", "Skimmed milk"])
+
+    def test_changes_after_the_build_are_applied(self):
+        self.names(self.home, "milk")
+        created = self.add_item("Butter milk", self.milk)
+        self.rename(label_repo, self.milk, "Dairy")
+        self.assertEqual(self.names(self.home, "milk"), ["Butter milk", "Whole milk"])
+
+        batch = firestore_wrapper.create_batch()
+        item_repo.batch_delete(batch, created.id)
+        self.assertTrue(firestore_wrapper.commit_batch(batch))
+        self.assertEqual(self.names(self.home, "milk"), ["Whole milk"])
+
+    def test_new_labels_are_found_through_the_stash(self):
+        self.names(self.home, "milk")
+        label = Label(name="Cheese", preferred_unit="g", stash_id=self.home.id, default_storage_id=self.fridge.id)
+        batch = firestore_wrapper.create_batch()
+        label_repo.batch_add(batch, label)
+        stash_repo.batch_array_union(batch, self.home.id, "label_ids", label.id)
+        self.assertTrue(firestore_wrapper.commit_batch(batch))
+        self.add_item("Cheddar cheese", label)
+        self.assertEqual(self.names(self.home, "cheese"), ["Cheddar cheese", "Cheese"])
+
+    def test_writes_to_stashes_without_an_index_are_not_read(self):
+        self.names(self.home, "milk")
+        self.add_item("Oat milk", self.other_label)
+        self.rename(label_repo, self.other_label, "Dairy")
+        reads = self.firestore.reads
+        self.assertEqual(self.names(self.home, "milk"), ["Milk", "Whole milk"])
+        self.assertEqual(self.firestore.reads, reads)
+
+    def test_catch_up_reads_outside_the_index_lock(self):
+        self.names(self.home, "milk")
+        index = self.indexes._indexes[self.home.id]
+        self.add_item("Butter milk", self.milk)
+        get_fields = item_repo.get_fields
+
+        def checked(*args, **kwargs):
+            self.assertFalse(index.lock.locked())
+            return get_fields(*args, **kwargs)
+
+        with mock.patch.object(item_repo, "get_fields", side_effect=checked) as read:
+            self.assertIn("Butter milk", self.names(self.home, "milk"))
+        self.assertTrue(read.called)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,38 @@
+import os
+import sys
+import json
+import subprocess
+import unittest
+from pathlib import Path
+
+# === Config ===
+REPO_ROOT = Path(__file__).resolve().parent.parent
+HEAVY_MODULES = ("google.cloud.firestore", "google.cloud", "google.api_core", "grpc")
+
+
+def imported_modules(module: str, env: dict) -> set:
+    """
+    Imports `module` in a fresh interpreter and returns every module that ended up loaded.
+    """
+    script = f"import sys, json, {module}; print(json.dumps(sorted(sys.modules)))"
+    result = subprocess.run([sys.executable, "-c", script], cwd=REPO_ROOT, env=env, check=True, capture_output=True, text=True)
+    return set(json.loads(result.stdout.splitlines()[-1]))
+
+
+class StartupImportTest(unittest.TestCase):
+    """
+    Importing the app is most of a cold start, so it must stay cheap: no client, credentials or
+    config are touched until the lifespan runs, and the Google client libraries load with it.
+    """
+
+    def test_import_needs_no_config(self):
+        env = {key: value for key, value in os.environ.items() if key not in ("JWT_KEY", "FIREBASE_CREDENTIALS_PATH", "GOOGLE_APPLICATION_CREDENTIALS")}
+        imported_modules("backend.main", env)
+
+    def test_google_clients_load_lazily(self):
+        modules = imported_modules("backend.main", dict(os.environ))
+        self.assertEqual([module for module in HEAVY_MODULES if module in modules], [])
+
+
+if __name__ == "__main__":
+    unittest.main()